@@ -1,5 +1,5 @@
 import streamlit as st
-from PIL import Image
+from utils.views import sidebar_branding
 
 st.set_page_config(
     page_title='Home',
@@ -7,12 +7,7 @@ st.set_page_config(
 )
 
 
-image = Image.open('food_delivery.png')
-st.sidebar.image(image, width=150)
-
-st.sidebar.markdown('# Cury Company')
-st.sidebar.markdown('### Fastest Delivery in Town')
-st.sidebar.markdown("""---""")
+sidebar_branding()
 
 st.write('# Cury Company Growth Dashboard')
 
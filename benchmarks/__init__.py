@@ -0,0 +1 @@
+"""Benchmarks do Growth Dashboard (gerador de dados sintéticos e suíte de medições)."""
@@ -0,0 +1,262 @@
+"""Suíte de benchmarks: limpeza, construção dos agregados, filtros e gráficos das páginas.
+
+Para cada tamanho pedido, um train.csv sintético (benchmarks.synthetic) é gerado uma
+vez em --data-dir e cada etapa é medida:
+    - tempo: menor tempo entre --repeat execuções (e a mediana);
+    - vazão: linhas de entrada por segundo;
+    - memória: pico de alocação (tracemalloc) numa execução à parte, para que o
+      rastreamento não distorça o tempo.
+
+Os resultados vão para um json com o commit, as versões das bibliotecas e uma linha
+por (etapa, tamanho). Com --compare, a razão de tempo contra um resultado anterior
+é impressa para cada etapa em comum.
+
+As etapas com versão paralela (cubo e streaming, utils.parallel) são medidas também
+com --workers processos; a linha '<etapa>.parallel' traz o speedup sobre a serial.
+
+Uso: python -m benchmarks.run [--rows 10000 100000 ...] [--repeat 5] [--output resultados.json]
+                              [--compare resultados_anteriores.json] [--workers 4]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_train
+from utils.cube import build_cube, filter_cube, parallel_cube
+from utils.dataset import (ORDEM_SNAPSHOT, add_distance, clean_code, compact_dtypes,
+                           haversine_km, pq, read_snapshot, write_snapshot)
+from utils.distinct import DistinctSketch
+from utils.filters import CLIMA_PADRAO, DATA_PADRAO, TRAFEGO_PADRAO, FilterEngine
+from utils.kpi import compute_kpis
+from utils.maps import build_map, index_points, render_map
+from utils.pages import load_page_functions
+from utils.parallel import get_pool, workers_from
+from utils.quantiles import QuantileSketch
+from utils.shared import RowView
+from utils.spatial import SpatialIndex
+from utils.sqlstore import SqlDistinct, build_database, query_cube, query_quantiles, query_top_k
+from utils.streaming import stream_partials
+
+DIRETORIO_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+TAMANHOS_PADRAO = [10_000, 100_000]
+
+
+def measure(func, repeat):
+    """Executa func `repeat` vezes (tempo) e mais uma vez com tracemalloc (pico de memória).
+
+        Output: (resultado da última execução, dicionário com seconds, median_seconds e peak_mb)
+    """
+    tempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        resultado = func()
+        tempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        func()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return resultado, {'seconds': min(tempos), 'median_seconds': statistics.median(tempos),
+                       'peak_mb': round(pico / 2 ** 20, 2)}
+
+
+def _chart_stages(view, cube, distinct, quantiles, spatial):
+    """Funções das páginas medidas, com os argumentos que as páginas usam: nome -> função."""
+    empresa = load_page_functions('empresa')
+    entregadores = load_page_functions('entregadores')
+    restaurantes = load_page_functions('restaurantes')
+    return {
+        'empresa.order_metric': lambda: empresa.order_metric(cube),
+        'empresa.traffic_order_share': lambda: empresa.traffic_order_share(cube),
+        'empresa.traffic_order_city': lambda: empresa.traffic_order_city(cube),
+        'empresa.order_by_week': lambda: empresa.order_by_week(cube),
+        'empresa.order_share_by_week': lambda: empresa.order_share_by_week(cube, distinct),
+        # country_maps desenha com o streamlit: mede-se a montagem e a serialização do mapa
+        'empresa.country_maps': lambda: render_map(build_map(view.frame(), 'median')),
+        'empresa.country_maps.heatmap': lambda: render_map(build_map(None, 'heatmap', points=index_points(
+            spatial, DATA_PADRAO, TRAFEGO_PADRAO))),
+        'empresa.radius_search': lambda: empresa.radius_search(spatial, *spatial.center(), 5.0,
+                                                               DATA_PADRAO, TRAFEGO_PADRAO),
+        'entregadores.cards': lambda: compute_kpis(cube, entregadores.CARDS),
+        'entregadores.top_delivers': lambda: entregadores.top_delivers(view),
+        'entregadores.avg_ratings_per_deliver': lambda: entregadores.avg_ratings_per_deliver(view),
+        'restaurantes.cards': lambda: compute_kpis(cube, restaurantes.CARDS, distinct, quantiles),
+        'restaurantes.time_percentiles': lambda: restaurantes.time_percentiles(quantiles),
+        'restaurantes.distance_fig': lambda: restaurantes.distance(cube, fig=True),
+        'restaurantes.avg_std_time_graph': lambda: restaurantes.avg_std_time_graph(cube),
+        'restaurantes.avg_std_time_on_traffic': lambda: restaurantes.avg_std_time_on_traffic(cube),
+    }
+
+
+def bench_size(rows, data_dir, repeat, workers=1):
+    """Esta função mede todas as etapas num csv sintético de `rows` linhas e retorna as linhas de resultado."""
+    path = os.path.join(data_dir, 'train_%d.csv' % rows)
+    if not os.path.exists(path):
+        generate_train(path, rows)
+
+    resultados = []
+
+    def registrar(stage, func, rows_in, repeat=repeat):
+        resultado, medida = measure(func, repeat)
+        medida.update({'stage': stage, 'rows': rows, 'rows_in': int(rows_in),
+                       'rows_per_sec': round(rows_in / medida['seconds'], 1)
+                       if medida['seconds'] > 0 else None})
+        resultados.append(medida)
+        print('%10d  %-40s %9.4fs  %8.1f MB' % (rows, stage, medida['seconds'], medida['peak_mb']))
+        return resultado
+
+    def registrar_paralelo(stage, func, rows_in):
+        """Mede a versão paralela de uma etapa já medida e registra o speedup sobre a serial."""
+        serial = next(r for r in reversed(resultados) if r['stage'] == stage)
+        resultado = registrar(stage + '.parallel', func, rows_in)
+        medida = resultados[-1]
+        medida['workers'] = workers
+        medida['speedup'] = round(serial['seconds'] / medida['seconds'], 2)
+        print('%10d  %-40s %8.2fx (%d processos)' % (rows, stage + '.speedup', medida['speedup'], workers))
+        return resultado
+
+    raw = registrar('read_csv', lambda: pd.read_csv(path), rows, repeat=1)
+    limpo = registrar('clean_code', lambda: clean_code(raw), len(raw))
+    df1 = registrar('build_dataset', lambda: compact_dtypes(add_distance(clean_code(raw)))
+                    .sort_values(ORDEM_SNAPSHOT, kind='stable', na_position='first')
+                    .reset_index(drop=True), len(raw))
+    del raw, limpo
+    n = len(df1)
+
+    if pq is not None:
+        snapshot = os.path.join(data_dir, 'train_%d.parquet' % rows)
+        registrar('write_snapshot', lambda: write_snapshot(df1, snapshot), n, repeat=1)
+        registrar('read_snapshot', lambda: read_snapshot(snapshot), n)
+
+    cube = registrar('build_cube', lambda: build_cube(df1), n)
+    if workers > 1:
+        # Os processos do pool são iniciados fora da medição
+        get_pool(workers)
+        registrar_paralelo('build_cube', lambda: parallel_cube(df1, workers, min_rows=0), n)
+        blocos = max(len(df1) // (2 * workers), 1)
+        registrar('stream_partials', lambda: stream_partials(path, chunksize=blocos, workers=1), n,
+                  repeat=1)
+        registrar_paralelo('stream_partials', lambda: stream_partials(path, chunksize=blocos,
+                                                                      workers=workers), n)
+    distinct = registrar('build_distinct', lambda: DistinctSketch(df1), n)
+    quantiles = registrar('build_quantiles', lambda: QuantileSketch(df1), n)
+    engine = registrar('build_filter_engine', lambda: FilterEngine(df1), n)
+    spatial = registrar('build_spatial', lambda: SpatialIndex(df1), n)
+
+    # Filtros da barra lateral: índice, máscaras encadeadas (referência) e cubo
+    registrar('filters.engine', lambda: df1.iloc[engine.select(
+        DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO)], n)
+    registrar('filters.view', lambda: RowView(df1, engine.select(
+        DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO)), n)
+    registrar('filters.masks', lambda: df1.loc[(df1['Order_Date'] < DATA_PADRAO)
+                                               & df1['Road_traffic_density'].isin(TRAFEGO_PADRAO)
+                                               & df1['Weatherconditions'].isin(CLIMA_PADRAO)], n)
+    registrar('filters.cube', lambda: filter_cube(cube, DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO), n)
+    registrar('filters.distinct', lambda: distinct.filter(DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO), n)
+    registrar('filters.quantiles', lambda: quantiles.filter(DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO), n)
+
+    selecao = RowView(df1, engine.select(DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO))
+    cube_filtrado = filter_cube(cube, DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO)
+    distinct_filtrado = distinct.filter(DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO)
+    quantiles_filtrado = quantiles.filter(DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO)
+    for stage, func in _chart_stages(selecao, cube_filtrado, distinct_filtrado,
+                                     quantiles_filtrado, spatial).items():
+        registrar(stage, func, n)
+
+    # Consultas espaciais: índice em grade e varredura de todas as linhas (referência)
+    lat, lng = spatial.center()
+    registrar('spatial.radius', lambda: spatial.deliveries_within(lat, lng, 5.0), n)
+    registrar('spatial.radius_scan', lambda: df1.loc[haversine_km(
+        lat, lng, df1['Delivery_location_latitude'], df1['Delivery_location_longitude']) <= 5.0,
+        'Time_taken(min)'].mean(), n)
+    registrar('spatial.nearest', lambda: spatial.nearest_restaurants(lat, lng, 1), n)
+    registrar('spatial.density', lambda: index_points(spatial, DATA_PADRAO, TRAFEGO_PADRAO), n)
+
+    # Backend SQL (utils.sqlstore): carga do banco e consultas com os filtros padrão
+    filtros = (DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO)
+    registrar('sql.build_database', lambda: build_database(path), n, repeat=1)
+    registrar('sql.cube', lambda: query_cube(*filtros, path=path), n)
+    registrar('sql.distinct', lambda: SqlDistinct(*filtros, path=path).count(), n)
+    registrar('sql.quantiles', lambda: query_quantiles(*filtros, path=path).quantiles(), n)
+    registrar('sql.top_delivers', lambda: query_top_k('Time_taken(min)', 'City', 10, *filtros,
+                                                      path=path), n)
+    return resultados
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=DIRETORIO_BENCHMARKS,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(rows=TAMANHOS_PADRAO, repeat=5, data_dir=None, workers=1):
+    """Executa a suíte para cada tamanho e retorna o documento de resultados."""
+    data_dir = data_dir or os.path.join(DIRETORIO_BENCHMARKS, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    resultados = []
+    for n in rows:
+        resultados.extend(bench_size(n, data_dir, repeat, workers))
+    return {'commit': _git_commit(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'repeat': repeat,
+            'workers': workers,
+            'cpu_count': os.cpu_count(),
+            'results': resultados}
+
+
+def compare(atual, anterior):
+    """Razão de tempo (atual / anterior) por (etapa, tamanho) presentes nos dois resultados."""
+    anteriores = {(r['stage'], r['rows']): r['seconds'] for r in anterior['results']}
+    return {'%s@%d' % chave: round(r['seconds'] / anteriores[chave], 3)
+            for r in atual['results']
+            for chave in [(r['stage'], r['rows'])]
+            if anteriores.get(chave)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks do Growth Dashboard')
+    parser.add_argument('--rows', type=int, nargs='+', default=TAMANHOS_PADRAO,
+                        help='tamanhos do csv sintético (de 10 mil a 10 milhões de linhas)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None, help='json de uma execução anterior')
+    parser.add_argument('--workers', default='auto',
+                        help="processos das etapas paralelas ('auto': um por núcleo; 1: só serial)")
+    args = parser.parse_args(argv)
+
+    documento = run_suite(args.rows, args.repeat, args.data_dir, workers_from(args.workers))
+    output = args.output or os.path.join(
+        DIRETORIO_BENCHMARKS, 'results', '%s-%s.json' % (
+            (documento['commit'] or 'local')[:10],
+            documento['created_at'].replace(':', '').replace('-', '')))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as arquivo:
+        json.dump(documento, arquivo, indent=1)
+    print('resultados:', output)
+
+    if args.compare:
+        with open(args.compare) as arquivo:
+            for chave, razao in compare(documento, json.load(arquivo)).items():
+                print('%-50s %6.3fx' % (chave, razao))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Gerador de um train.csv sintético com o esquema e as peculiaridades do arquivo original.
+
+Peculiaridades reproduzidas:
+    - valores ausentes gravados como o texto 'NaN ' (com espaço), inclusive nas
+      colunas numéricas (idade, avaliação, entregas múltiplas);
+    - 'conditions NaN' no clima e 'NaN ' no horário do pedido;
+    - textos com espaço à direita (ID, Delivery_person_ID, tráfego, cidade, ...);
+    - o prefixo '(min) ' na coluna Time_taken(min);
+    - datas no formato dd-mm-aaaa.
+
+O arquivo é gerado em blocos, então 10 milhões de linhas não precisam caber na memória.
+
+Uso: python -m benchmarks.synthetic <linhas> <arquivo.csv> [semente]
+"""
+import numpy as np
+import pandas as pd
+
+# Prefixos das cidades nos IDs dos entregadores e coordenadas aproximadas dos restaurantes
+CIDADES = {'INDO': (22.72, 75.86), 'BANG': (12.97, 77.59), 'COIMB': (11.02, 76.96),
+           'CHEN': (13.08, 80.27), 'HYD': (17.39, 78.49), 'RANCHI': (23.34, 85.31),
+           'MYS': (12.30, 76.64), 'DEH': (30.32, 78.03), 'KOC': (9.93, 76.27),
+           'PUNE': (18.52, 73.86), 'LUDH': (30.90, 75.86), 'KNP': (26.45, 80.33),
+           'MUM': (19.08, 72.88), 'KOL': (22.57, 88.36), 'JAP': (26.91, 75.79),
+           'SUR': (21.17, 72.83), 'GOA': (15.49, 73.83), 'AURG': (19.88, 75.34),
+           'AGR': (27.18, 78.01), 'VAD': (22.31, 73.18), 'ALH': (25.44, 81.85),
+           'BHP': (23.26, 77.41)}
+
+CLIMAS = ['conditions Cloudy', 'conditions Fog', 'conditions Sandstorms',
+          'conditions Stormy', 'conditions Sunny', 'conditions Windy']
+TRAFEGOS = ['Low ', 'Medium ', 'High ', 'Jam ']
+TIPOS_PEDIDO = ['Snack ', 'Meal ', 'Drinks ', 'Buffet ']
+VEICULOS = ['motorcycle ', 'scooter ', 'electric_scooter ', 'bicycle ']
+TIPOS_CIDADE = ['Metropolitian ', 'Urban ', 'Semi-Urban ']
+
+PRIMEIRO_DIA = pd.Timestamp('2022-02-11')
+DIAS = 54
+
+# Fração de linhas com 'NaN ' (a idade ausente vem junto com avaliação e clima ausentes)
+FRACAO_NAN = 0.03
+
+LINHAS_POR_BLOCO = 500_000
+
+# Horário do pedido (a cada 15 minutos), da coleta (10 minutos depois) e datas dos pedidos
+_MINUTOS = pd.to_datetime(np.arange(24 * 4) * 15, unit='m')
+HORARIOS = np.asarray(_MINUTOS.strftime('%H:%M:%S'), dtype=object)
+COLETAS = np.asarray((_MINUTOS + pd.Timedelta(minutes=10)).strftime('%H:%M:%S'), dtype=object)
+DATAS = np.asarray(pd.date_range(PRIMEIRO_DIA, periods=DIAS).strftime('%d-%m-%Y'), dtype=object)
+
+
+def _texto(valores):
+    return pd.Series(valores).astype(str).to_numpy(dtype=object)
+
+
+def _com_nan(valores, rng, fracao=FRACAO_NAN):
+    valores = np.asarray(valores, dtype=object)
+    valores[rng.random(len(valores)) < fracao] = 'NaN '
+    return valores
+
+
+def synthetic_chunk(inicio, n, rng):
+    """Esta função gera n linhas sintéticas a partir do pedido número `inicio`."""
+    prefixos = np.array(list(CIDADES))
+    centros = np.array(list(CIDADES.values()))
+    cidade = rng.integers(0, len(prefixos), n)
+
+    entregador = (pd.Series(prefixos[cidade]) + 'RES' + _texto(rng.integers(1, 21, n))
+                  + 'DEL0' + _texto(rng.integers(1, 4, n)) + ' ')
+    restaurante = centros[cidade] + rng.normal(0, 0.05, (n, 2))
+    entrega = restaurante + rng.uniform(-0.15, 0.15, (n, 2))
+
+    idade_nan = rng.random(n) < FRACAO_NAN
+    idade = _texto(rng.integers(20, 40, n)).astype(object)
+    idade[idade_nan] = 'NaN '
+    avaliacao = _texto(np.round(rng.uniform(2.5, 5.0, n), 1)).astype(object)
+    avaliacao[idade_nan] = 'NaN '
+    clima = np.array(CLIMAS, dtype=object)[rng.integers(0, len(CLIMAS), n)]
+    clima[idade_nan] = 'conditions NaN'
+
+    # Horários e datas têm poucos valores distintos: formatados uma vez e indexados
+    quarto_hora = rng.integers(0, 24 * 4, n)
+    horario = _com_nan(HORARIOS[quarto_hora], rng)
+    coleta = COLETAS[quarto_hora]
+    data = DATAS[rng.integers(0, DIAS, n)]
+
+    trafego = rng.integers(0, len(TRAFEGOS), n)
+    return pd.DataFrame({
+        'ID': pd.Series(np.arange(inicio, inicio + n)).map('0x{:04x} '.format),
+        'Delivery_person_ID': entregador,
+        'Delivery_person_Age': idade,
+        'Delivery_person_Ratings': avaliacao,
+        'Restaurant_latitude': np.round(restaurante[:, 0], 6),
+        'Restaurant_longitude': np.round(restaurante[:, 1], 6),
+        'Delivery_location_latitude': np.round(entrega[:, 0], 6),
+        'Delivery_location_longitude': np.round(entrega[:, 1], 6),
+        'Order_Date': data,
+        'Time_Orderd': horario,
+        'Time_Order_picked': coleta,
+        'Weatherconditions': clima,
+        'Road_traffic_density': _com_nan(np.array(TRAFEGOS)[trafego], rng),
+        'Vehicle_condition': rng.integers(0, 4, n),
+        'Type_of_order': np.array(TIPOS_PEDIDO)[rng.integers(0, len(TIPOS_PEDIDO), n)],
+        'Type_of_vehicle': np.array(VEICULOS)[rng.integers(0, len(VEICULOS), n)],
+        'multiple_deliveries': _com_nan(_texto(rng.integers(0, 4, n)), rng),
+        'Festival': _com_nan(np.where(rng.random(n) < 0.05, 'Yes ', 'No '), rng),
+        'City': _com_nan(np.array(TIPOS_CIDADE)[rng.integers(0, len(TIPOS_CIDADE), n)], rng),
+        # Pedidos no trânsito pesado demoram mais
+        'Time_taken(min)': '(min) ' + pd.Series(rng.integers(10, 45, n) + 3 * trafego).astype(str),
+    })
+
+
+def generate_train(path, rows, seed=0, chunk_rows=LINHAS_POR_BLOCO):
+    """Esta função grava um train.csv sintético com `rows` linhas, em blocos de chunk_rows linhas."""
+    rng = np.random.default_rng(seed)
+    for inicio in range(0, rows, chunk_rows):
+        df = synthetic_chunk(inicio, min(chunk_rows, rows - inicio), rng)
+        df.to_csv(path, index=False, mode='w' if inicio == 0 else 'a', header=inicio == 0)
+    return path
+
+
+if __name__ == '__main__':
+    import sys
+
+    generate_train(sys.argv[2], int(sys.argv[1]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
@@ -1,100 +1,48 @@
 # Libraries
-import pandas as pd
-import folium
-import plotly_express as px
-from haversine import haversine
-from PIL import Image
 import datetime
 import streamlit as st
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
+from utils.cube import rollup
+from utils.dataset import dataset_version
+from utils.figures import cached_figure
+from utils.filters import DATA_PADRAO, TRAFEGO_PADRAO, filter_state
+from utils.lazy import lazy_import
+from utils.maps import build_map, cached_map_html, index_points
+from utils.refresh import start_refresher
+from utils.shared import load_view
+from utils.spatial import load_spatial
+from utils.sqlstore import filtered_cube, filtered_distinct
+from utils.timing import finish_run, span, start_run, timing_panel
+from utils.views import data_status, lazy_tabs, sidebar_branding
+
+px = lazy_import('plotly_express')
 
 st.set_page_config(page_title='Visão Empresa', page_icon='📈', layout='wide')
 
+# Spans de tempo desta execução (medidos só com o painel de tempos ligado ou CURRY_TIMING=1)
+start_run('empresa', enabled=st.session_state.get('painel_tempos', False))
+
+# Atualização dos dados em segundo plano: a página serve a última versão publicada
+# e não recarrega o csv dentro da requisição quando ele muda
+start_refresher()
+
 # ---------------------------
 # Funções
 # ---------------------------
 
-# Função de limpeza dos dados
-def clean_code(df1):
-    """Esta função tem a responsabilidade de limpar o dataframe
-        Tipos de limpeza:
-        1. Remoção de dados NaN
-        2. Mudança do tipo da coluna de dados
-        3. Remoção dos espaços das variáveis de texto
-        4. Formatação da coluna de datas
-        5. Limpeza da coluna de tempo (remoção do texto da variável)
-
-        Input: Dataframe
-        Output: Dataframe
-    """
-    # Tratando a base
-    # Convertendo idade de texto para int
-    linhas_selecionadas = df1['Delivery_person_Age'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-    df1['Delivery_person_Age'] = df1['Delivery_person_Age'].astype(int)
-
-    # tirando o NaN do Road_traffic_density
-    linhas_selecionadas = df1['Road_traffic_density'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # tirando o NaN do City
-    linhas_selecionadas = df1['City'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # tirando o NaN do Festival
-    linhas_selecionadas = df1['Festival'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # Convertendo a coluna ratings de texto para número decimal
-    df1['Delivery_person_Ratings'] = df1['Delivery_person_Ratings'].astype(
-        float)
-
-    # Convertendo a coluna order_date de texto para data
-    df1['Order_Date'] = pd.to_datetime(df1['Order_Date'], format='%d-%m-%Y')
-
-    # Convertendo multiple_deliveries de texto para int
-    linhas_selecionadas = df1['multiple_deliveries'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-    df1['multiple_deliveries'] = df1['multiple_deliveries'].astype(int)
-
-    # Comando para remover o texte de números
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].apply(
-        lambda x: x.split('(min) ')[1])
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].astype(int)
-
-    # removendo os espaços dentro de strings/texto/object
-    df1.loc[:, 'ID'] = df1.loc[:, 'ID'].str.strip()
-    df1.loc[:, 'Road_traffic_density'] = df1.loc[:,
-                                                 'Road_traffic_density'].str.strip()
-    df1.loc[:, 'Type_of_order'] = df1.loc[:, 'Type_of_order'].str.strip()
-    df1.loc[:, 'Type_of_vehicle'] = df1.loc[:, 'Type_of_vehicle'].str.strip()
-    df1.loc[:, 'City'] = df1.loc[:, 'City'].str.strip()
-    df1.loc[:, 'Festival'] = df1.loc[:, 'Festival'].str.strip()
-
-    return df1
-
-
-def order_metric(df1):
-    """Função que calcula a quantidade de pedidos diárias a partir do dataframe"""
-    df_aux = df1.loc[:, ['ID', 'Order_Date']].groupby(
-        'Order_Date').count().reset_index()
+def order_metric(cube):
+    """Função que calcula a quantidade de pedidos diárias a partir do cubo de pedidos"""
+    df_aux = rollup(cube, 'Order_Date').rename(columns={'orders': 'ID'})
 
     # desenhar gráfico de barras
     fig = px.bar(df_aux, x='Order_Date', y='ID')
     return fig
 
 
-def traffic_order_share(df1):
+def traffic_order_share(cube):
     """Esta função calcula a quantidade de pedidos por densidade de tráfego"""
-    df_aux = (df1.loc[:, ['ID', 'Road_traffic_density']]
-              .groupby('Road_traffic_density')
-              .count()
-              .reset_index())
-    # Criando coluna de representatividade
-    df_aux['entregas_perc'] = df_aux['ID'] / df_aux['ID'].sum()
-
-    # Gráfico de pizza
-    fig = px.pie(df_aux, values='entregas_perc', names='Road_traffic_density')
+    df_aux = rollup(cube, 'Road_traffic_density').rename(
+        columns={'orders': 'ID'})
     # Criando coluna de representatividade
     df_aux['entregas_perc'] = df_aux['ID'] / df_aux['ID'].sum()
 
@@ -104,12 +52,10 @@ def traffic_order_share(df1):
     return fig
 
 
-def traffic_order_city(df1):
+def traffic_order_city(cube):
     """ Esta função calcula a quantidade de pedidos por cidade e tipo de tráfego"""
-    df_aux = (df1.loc[:, ['ID', 'City', 'Road_traffic_density']]
-              .groupby(['City', 'Road_traffic_density'])
-              .count()
-              .reset_index())
+    df_aux = rollup(cube, ['City', 'Road_traffic_density']).rename(
+        columns={'orders': 'ID'})
 
     # Gráfico de bolhas
     fig = px.scatter(df_aux, x='City', y='Road_traffic_density',
@@ -117,14 +63,13 @@ def traffic_order_city(df1):
     return fig
 
 
-def order_by_week(df1):
+def order_by_week(cube):
     """Esta função calcula a a quantidade de pedidos realizados por semana"""
-    # Criando a coluna semana
-    df1['week_of_year'] = df1['Order_Date'].dt.strftime('%U')
+    # Criando a coluna semana (sobre as células diárias do cubo)
+    cube = cube.assign(week_of_year=cube['Order_Date'].dt.strftime('%U'))
 
     # Cálculo da quantidade de pedidos por semana
-    df_aux = df1.loc[:, ['ID', 'week_of_year']].groupby(
-        'week_of_year').count().reset_index()
+    df_aux = rollup(cube, 'week_of_year').rename(columns={'orders': 'ID'})
 
     # Criando o gráfico de linhas
     fig = px.line(df_aux, x='week_of_year', y='ID')
@@ -132,17 +77,13 @@ def order_by_week(df1):
     return fig
 
 
-def order_share_by_week(df1):
+def order_share_by_week(cube, distinct):
     """Esta função calcula a quantidade média de pedidos por entregadores únicos e mostra a visão por semana do ano """
-    # Cálculo da quantidade de pedidos por semana
-    df_aux01 = df1.loc[:, ['ID', 'week_of_year']].groupby(
-        'week_of_year').count().reset_index()
-
-    # Quantidade de entregadores únicos por semana
-    df_aux02 = df1.loc[:, ['Delivery_person_ID', 'week_of_year']
-                       ].groupby('week_of_year').nunique().reset_index()
-
-    df_aux = pd.merge(df_aux01, df_aux02, how='inner')
+    # Quantidade de pedidos por semana (cubo) e de entregadores únicos por semana (sketches combinados)
+    cube = cube.assign(week_of_year=cube['Order_Date'].dt.strftime('%U'))
+    df_aux = rollup(cube, 'week_of_year').rename(columns={'orders': 'ID'})
+    entregadores = distinct.count_by(distinct.cells['Order_Date'].dt.strftime('%U'))
+    df_aux['Delivery_person_ID'] = df_aux['week_of_year'].map(entregadores)
 
     df_aux['order_by_delivery'] = df_aux['ID'] / df_aux['Delivery_person_ID']
 
@@ -152,35 +93,41 @@ def order_share_by_week(df1):
     return fig
 
 
-def country_maps(df1):
+def country_maps(view, mode, filtros, points=None):
     """Esta função cria um gráfico, plotando a localização dos locais de entrega por meio do cálculo da mediana da localização
      Os pontos do mapa são mostrados indicando a Cidade e a densidade de tráfego.
+     Nos modos por pedido, os locais de entrega aparecem agrupados ('cluster') ou como mapa de calor ('heatmap');
+     points() retorna esses pontos já agregados nas células do índice espacial.
+     O html do mapa fica em cache por versão dos dados, modo e filtros: a cópia das linhas
+     selecionadas (view, sobre o dataset compartilhado), o cálculo dos pontos e a serialização
+     só acontecem para combinações novas.
        """
-    # Mediana da latitude e longitude agrupadas por cidade e tipo de tráfego
-    df_aux = (df1.loc[:, ['City', 'Road_traffic_density', 'Delivery_location_latitude', 'Delivery_location_longitude']]
-              .groupby(['City', 'Road_traffic_density'])
-              .median()
-              .reset_index())
-    # Ciando mapa com folium
-    map = folium.Map()
-    for index, location_info in df_aux.iterrows():
-        folium.Marker([
-            location_info['Delivery_location_latitude'],
-            location_info['Delivery_location_longitude']
-        ], popup=location_info[['City', 'Road_traffic_density']]).add_to(map)
-    folium_static(map, width=1024, height=600)
+    chave = ('country_maps', dataset_version(), mode, filtros)
+    if points is None:
+        html = cached_map_html(chave, lambda: build_map(view.frame(), mode))
+    else:
+        html = cached_map_html(chave, lambda: build_map(None, mode, points=points()))
+    components.html(html, width=1024, height=610)
+
+
+def radius_search(index, lat, lng, km, date_slider, traffic_options, k=10):
+    """Esta função resume as entregas num raio em torno de um ponto e lista os restaurantes mais próximos,
+     consultando o índice espacial (só as células próximas do ponto são lidas)
+       """
+    resumo = index.deliveries_within(lat, lng, km, date_slider, traffic_options)
+    restaurantes = len(index.restaurants.within(lat, lng, km)[0])
+    proximos = index.nearest_restaurants(lat, lng, k)
+    return resumo, restaurantes, proximos
 
 # --------------------------- Início da estrutura lógica do código ---------------------------
 
 
 # ---------------------------
-# Import Dataset
-# ---------------------------
-df = pd.read_csv('train.csv')
-# ---------------------------
-# Limpando dados
+# Import Dataset (lido e limpo uma vez por processo)
 # ---------------------------
-df1 = clean_code(df)
+# Colunas usadas nesta página (o snapshot carrega apenas estas, e só na aba do mapa)
+COLUNAS = ['Order_Date', 'City', 'Road_traffic_density',
+           'Delivery_location_latitude', 'Delivery_location_longitude']
 
 # Visão Empresa
 st.header('Marketplace - Visão Cliente')
@@ -189,19 +136,13 @@ st.header('Marketplace - Visão Cliente')
 # Barra Lateral
 # =====================================
 
-# Logo Cury Company da barra lateral
-image_path = 'food_delivery.png'
-image = Image.open(image_path)
-# Markdown Slogan Cury Company
-st.sidebar.image(image,  width=150)
-st.sidebar.markdown('# Cury Company')
-st.sidebar.markdown('### Fastest Delivery in Town')
-st.sidebar.markdown("""---""")
+# Logo e slogan Cury Company da barra lateral
+sidebar_branding()
 
 # Filtro Data
 date_slider = st.sidebar.slider(
     'Selecione até qual data',
-    value=datetime.datetime(2022, 4, 13),
+    value=DATA_PADRAO,
     min_value=datetime.datetime(2022, 2, 11),
     max_value=datetime.datetime(2022, 4, 6),
     format='DD-MM-YYYY'
@@ -210,26 +151,28 @@ date_slider = st.sidebar.slider(
 traffic_options = st.sidebar.multiselect(
     'Quais as condições de trânsito',
     ['Low', 'Medium', 'High', 'Jam'],
-    default=['Low', 'Medium', 'High', 'Jam']
+    default=TRAFEGO_PADRAO
 )
 # Aplicação dos filtros de data e tráfego
-linhas_selecionadas = df1['Order_Date'] < date_slider
-df1 = df1.loc[linhas_selecionadas, :]
-
-linhas_selecionadas = df1['Road_traffic_density'].isin(traffic_options)
-df1 = df1.loc[linhas_selecionadas, :]
+# (as linhas e os sketches de entregadores só são carregados e filtrados nas abas que os usam)
+with span('filters'):
+    # Cubo diário pré-agregado que responde os gráficos de contagem de pedidos
+    # (em cache no processo ou, com CURRY_BACKEND=sqlite, consultado no banco)
+    cube = filtered_cube(date_slider, traffic_options)
+# Estado dos filtros: chave dos gráficos e do mapa em cache
+filtros = filter_state(date_slider, traffic_options)
 
 # =====================================
 # Layout no Streamlit
 # =====================================
 
-tab1, tab2, tab3 = st.tabs(
-    ['Visão Gerencial', 'Visão Tática', 'Visão Geográfica'])
+# Só a aba escolhida é calculada
+aba = lazy_tabs(['Visão Gerencial', 'Visão Tática', 'Visão Geográfica'], key='aba_empresa')
 
-with tab1:
+if aba == 'Visão Gerencial':
     with st.container():
         # Order Metric
-        fig = order_metric(df1)
+        fig = cached_figure('order_metric', filtros, lambda: order_metric(cube))
         st.markdown('### Orders by day')
         st.plotly_chart(fig, use_conatiner_width=True)
 
@@ -237,26 +180,71 @@ with tab1:
         col1, col2 = st.columns(2)
 
         with col1:
-            fig = traffic_order_share(df1)
+            fig = cached_figure('traffic_order_share', filtros, lambda: traffic_order_share(cube))
             st.markdown('### Traffic Order Share')
             st.plotly_chart(fig, use_container_width=True)
 
         with col2:
             st.markdown('### Traffic Order City')
-            fig = traffic_order_city(df1)
+            fig = cached_figure('traffic_order_city', filtros, lambda: traffic_order_city(cube))
             st.plotly_chart(fig, use_container_width=True)
 
-with tab2:
+elif aba == 'Visão Tática':
     with st.container():
         st.markdown('### Order by Week')
-        fig = order_by_week(df1)
+        fig = cached_figure('order_by_week', filtros, lambda: order_by_week(cube))
         st.plotly_chart(fig, use_container_width=True)
 
     with st.container():
         st.markdown('### Order Share by Week')
-        fig = order_share_by_week(df1)
+        # Entregadores distintos por dia, tráfego e clima (sketches ou banco)
+        fig = cached_figure('order_share_by_week', filtros, lambda: order_share_by_week(
+            cube, filtered_distinct(date_slider, traffic_options)))
         st.plotly_chart(fig, use_container_width=True)
 
-with tab3:
+else:
     st.markdown('### Country Maps')
-    country_maps(df1)
\ No newline at end of file
+    modo = st.radio('Visualização', ['Mediana por cidade e tráfego', 'Pedidos agrupados', 'Mapa de calor'],
+                    horizontal=True)
+    modos = {'Mediana por cidade e tráfego': 'median',
+             'Pedidos agrupados': 'cluster',
+             'Mapa de calor': 'heatmap'}
+    if modos[modo] == 'median':
+        # Motor de filtros indexado: uma única seleção de linhas, copiadas pelo mapa só quando
+        # ele não está em cache
+        with span('filters.rows'):
+            linhas = load_view(date_slider, traffic_options, columns=COLUNAS)
+        country_maps(linhas, modos[modo], filtros)
+    else:
+        # Células do índice espacial montado na ingestão
+        indice = load_spatial()
+        country_maps(None, modos[modo], filtros,
+                     points=lambda: index_points(indice, date_slider, traffic_options))
+
+    with st.container():
+        st.markdown('### Busca por Raio')
+        indice = load_spatial()
+        centro = indice.center()
+        col1, col2, col3 = st.columns(3)
+        lat = col1.number_input('Latitude', value=round(centro[0], 4), format='%.4f')
+        lng = col2.number_input('Longitude', value=round(centro[1], 4), format='%.4f')
+        raio = col3.number_input('Raio (km)', min_value=0.1, value=5.0, step=1.0)
+        with span('spatial.radius'):
+            resumo, restaurantes, proximos = radius_search(indice, lat, lng, raio,
+                                                           date_slider, traffic_options)
+        col1.metric('Entregas no raio', int(resumo['orders']))
+        col2.metric('Tempo médio de entrega (min)',
+                    '-' if resumo['count'] == 0 else '{:.1f}'.format(resumo['mean']))
+        col3.metric('Restaurantes no raio', restaurantes)
+        st.markdown('#### Restaurantes mais próximos')
+        st.dataframe(proximos)
+
+# =====================================
+# Painel de tempos (depuração)
+# =====================================
+st.sidebar.markdown("""---""")
+data_status()
+if st.sidebar.checkbox('Painel de tempos', key='painel_tempos'):
+    timing_panel(st.sidebar, finish_run())
+else:
+    finish_run()
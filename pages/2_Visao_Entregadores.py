@@ -1,109 +1,59 @@
-import pandas as pd
-import folium
-import plotly_express as px
-from haversine import haversine
 import streamlit as st
-from PIL import Image
 import datetime
-from streamlit_folium import folium_static
+from utils.cube import mean_std
+from utils.filters import CLIMA_PADRAO, DATA_PADRAO, TRAFEGO_PADRAO, filter_state
+from utils.kpi import KPI, compute_kpis
+from utils.refresh import start_refresher
+from utils.shared import load_view
+from utils.sqlstore import (filtered_cube, query_deliverer_means, query_top_k,
+                            use_sql)
+from utils.tables import paged_table
+from utils.timing import finish_run, span, start_run, timing_panel
+from utils.topk import top_k_per_group
+from utils.views import data_status, lazy_tabs, sidebar_branding
 
 st.set_page_config(page_title='Visão Entregadores', page_icon='🛵', layout='wide')
 
+# Spans de tempo desta execução (medidos só com o painel de tempos ligado ou CURRY_TIMING=1)
+start_run('entregadores', enabled=st.session_state.get('painel_tempos', False))
+
+# Atualização dos dados em segundo plano: a página serve a última versão publicada
+# e não recarrega o csv dentro da requisição quando ele muda
+start_refresher()
+
 # ---------------------------
 # Funções
 # ---------------------------
 
-# Função de limpeza dos dados
-
-
-def clean_code(df1):
-    """Esta função tem a responsabilidade de limpar o dataframe
-        Tipos de limpeza:
-        1. Remoção de dados NaN
-        2. Mudança do tipo da coluna de dados
-        3. Remoção dos espaços das variáveis de texto
-        4. Formatação da coluna de datas
-        5. Limpeza da coluna de tempo (remoção do texto da variável)
-
-        Input: Dataframe
-        Output: Dataframe
-    """
-    # Tratando a base
-    # Convertendo idade de texto para int
-    linhas_selecionadas = df1['Delivery_person_Age'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-    df1['Delivery_person_Age'] = df1['Delivery_person_Age'].astype(int)
-
-    # tirando o NaN do Road_traffic_density
-    linhas_selecionadas = df1['Road_traffic_density'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # tirando o NaN do City
-    linhas_selecionadas = df1['City'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # tirando o NaN do Festival
-    linhas_selecionadas = df1['Festival'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # Convertendo a coluna ratings de texto para número decimal
-    df1['Delivery_person_Ratings'] = df1['Delivery_person_Ratings'].astype(
-        float)
-
-    # Convertendo a coluna order_date de texto para data
-    df1['Order_Date'] = pd.to_datetime(df1['Order_Date'], format='%d-%m-%Y')
-
-    # Convertendo multiple_deliveries de texto para int
-    linhas_selecionadas = df1['multiple_deliveries'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-    df1['multiple_deliveries'] = df1['multiple_deliveries'].astype(int)
-
-    # Comando para remover o texte de números
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].apply(
-        lambda x: x.split('(min) ')[1])
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].astype(int)
-
-    # removendo os espaços dentro de strings/texto/object
-    df1.loc[:, 'ID'] = df1.loc[:, 'ID'].str.strip()
-    df1.loc[:, 'Road_traffic_density'] = df1.loc[:,
-                                                 'Road_traffic_density'].str.strip()
-    df1.loc[:, 'Type_of_order'] = df1.loc[:, 'Type_of_order'].str.strip()
-    df1.loc[:, 'Type_of_vehicle'] = df1.loc[:, 'Type_of_vehicle'].str.strip()
-    df1.loc[:, 'City'] = df1.loc[:, 'City'].str.strip()
-    df1.loc[:, 'Festival'] = df1.loc[:, 'Festival'].str.strip()
-
-    return df1
-
-
-def top_delivers(df1, top_asc):
-    """Esta função calcula os entregadores mais lentos de cada cidade e retorna um dataframe com os 10 entregadores mais lentos
-    para cada uma das cidades"""
-    df_aux = (df1.loc[:, ['Time_taken(min)', 'City', 'Delivery_person_ID']]
-              .groupby(['City', 'Delivery_person_ID'])
-              .mean()
-              .sort_values(['City', 'Delivery_person_ID'], ascending=top_asc)
-              .reset_index())
-
-    df_aux_01 = df_aux.loc[df_aux['City'] == 'Metropolitian', :].head(10)
-    df_aux_02 = df_aux.loc[df_aux['City'] == 'Urban', :].head(10)
-    df_aux_03 = df_aux.loc[df_aux['City'] == 'Semi-Urban', :].head(10)
-
-    df2 = pd.concat([df_aux_01, df_aux_02, df_aux_03])
-
-    return df2
+def top_delivers(view, k=10, metric='Time_taken(min)', by='City'):
+    """Esta função calcula o tempo médio de entrega de cada entregador e retorna, para cada cidade,
+    os k entregadores mais rápidos e os k mais lentos: (mais rápidos, mais lentos)
+    As médias são calculadas direto sobre as linhas selecionadas do dataset compartilhado (RowView)."""
+    df_aux = view.group_mean([by, 'Delivery_person_ID'], metric)
+
+    return top_k_per_group(df_aux, by, metric, k)
+
+
+def avg_ratings_per_deliver(view):
+    """Esta função calcula a avaliação média de cada entregador sobre as linhas selecionadas (RowView)"""
+    return view.group_mean('Delivery_person_ID', 'Delivery_person_Ratings')
 
 # --------------------------- Início da estrutura lógica do código ---------------------------
 
 
 # ---------------------------
-# Import Dataset
-# ---------------------------
-df = pd.read_csv('train.csv')
+# Import Dataset (lido e limpo uma vez por processo)
 # ---------------------------
-# Limpando dados
-# ---------------------------
-df1 = clean_code(df)
-
+# Colunas usadas nesta página (o snapshot carrega apenas estas)
+COLUNAS = ['Order_Date', 'Delivery_person_ID', 'Delivery_person_Ratings',
+           'City', 'Road_traffic_density', 'Weatherconditions', 'Time_taken(min)']
+# Cards da visão gerencial, calculados juntos numa única passada sobre o cubo filtrado
+CARDS = {
+    'maior_idade': KPI('Delivery_person_Age', 'max', decimals=0),
+    'menor_idade': KPI('Delivery_person_Age', 'min', decimals=0),
+    'melhor_condicao': KPI('Vehicle_condition', 'max', decimals=0),
+    'pior_condicao': KPI('Vehicle_condition', 'min', decimals=0),
+}
 
 # Visão Entregadores
 st.header('Marketplace - Visão Entregadores')
@@ -112,19 +62,13 @@ st.header('Marketplace - Visão Entregadores')
 # Barra Lateral
 # =====================================
 
-# Logo Cury Company da barra lateral
-image_path = 'food_delivery.png'
-image = Image.open(image_path)
-# Markdown Slogan Cury Company
-st.sidebar.image(image,  width=150)
-st.sidebar.markdown('# Cury Company')
-st.sidebar.markdown('### Fastest Delivery in Town')
-st.sidebar.markdown("""---""")
+# Logo e slogan Cury Company da barra lateral
+sidebar_branding()
 
 # Filtro Data
 date_slider = st.sidebar.slider(
     'Selecione até qual data',
-    value=datetime.datetime(2022, 4, 13),
+    value=DATA_PADRAO,
     min_value=datetime.datetime(2022, 2, 11),
     max_value=datetime.datetime(2022, 4, 6),
     format='DD-MM-YYYY'
@@ -133,52 +77,54 @@ date_slider = st.sidebar.slider(
 traffic_options = st.sidebar.multiselect(
     'Quais condições de trânsito?',
     ['Low', 'Medium', 'High', 'Jam'],
-    default=['Low', 'Medium', 'High', 'Jam']
+    default=TRAFEGO_PADRAO
 )
 # Filtro condições climáticas
 weather_condition = st.sidebar.multiselect(
     'Quais condições climáticas?',
     ['conditions Cloudy', 'conditions Fog', 'conditions Sandstorms',
         'conditions Stormy', 'conditions Sunny', 'conditions Windy'],
-    default=['conditions Cloudy', 'conditions Fog', 'conditions Sandstorms',
-             'conditions Stormy', 'conditions Sunny', 'conditions Windy']
+    default=CLIMA_PADRAO
 )
 # Aplicação dos filtros de data e tráfego
-linhas_selecionadas = df1['Order_Date'] < date_slider
-df1 = df1.loc[linhas_selecionadas, :]
-
-linhas_selecionadas = df1['Road_traffic_density'].isin(traffic_options)
-df1 = df1.loc[linhas_selecionadas, :]
-
-linhas_selecionadas = df1['Weatherconditions'].isin(weather_condition)
-df1 = df1.loc[linhas_selecionadas, :]
+# (motor de filtros indexado: uma única seleção de linhas, sem cópias intermediárias)
+with span('filters'):
+    # Com CURRY_BACKEND=sqlite as médias por entregador são calculadas no banco e as linhas
+    # não são carregadas no processo
+    if not use_sql():
+        # Visão sem cópia: o dataframe compartilhado do processo mais as linhas selecionadas,
+        # os dois da mesma versão dos dados
+        linhas = load_view(date_slider, traffic_options, weather_condition, columns=COLUNAS)
+
+    # Cubo diário pré-agregado que responde os cards e as avaliações por trânsito e clima
+    cube = filtered_cube(date_slider, traffic_options, weather_condition)
+# Estado dos filtros: chave das tabelas paginadas em cache
+filtros = filter_state(date_slider, traffic_options, weather_condition)
 
 # =====================================
 # Layout no Streamlit
 # =====================================
 
-tab1, tab2, tab3 = st.tabs(['Visão Gerencial', '_', '_'])
+# Só a aba escolhida é calculada
+aba = lazy_tabs(['Visão Gerencial', '_', '_'], key='aba_entregadores')
 
-with tab1:
+if aba == 'Visão Gerencial':
     with st.container():
         st.title('Overall Metrics')
+        cards = compute_kpis(cube, CARDS)
         col1, col2, col3, col4 = st.columns(4, gap='large')
         with col1:
             # A maior idade dos entregadore
-            maior_idade = df1.loc[:, 'Delivery_person_Age'].max()
-            col1.metric('Maior idade', maior_idade)
+            col1.metric('Maior idade', cards.maior_idade)
         with col2:
             # A menor  idade dos entregadore
-            menor_idade = df1.loc[:, 'Delivery_person_Age'].min()
-            col2.metric('Menor idade', menor_idade)
+            col2.metric('Menor idade', cards.menor_idade)
         with col3:
             # A melhor condição dos veículo
-            melhor_condicao = df1.loc[:, 'Vehicle_condition'].max()
-            col3.metric('Melhor Veículo', melhor_condicao)
+            col3.metric('Melhor Veículo', cards.melhor_condicao)
         with col4:
             # A pior condição dos veículos
-            pior_condicao = df1.loc[:, 'Vehicle_condition'].min()
-            col4.metric('Pior Veículo', pior_condicao)
+            col4.metric('Pior Veículo', cards.pior_condicao)
     with st.container():
         st.markdown("""---""")
         st.title('Avaliações')
@@ -187,32 +133,27 @@ with tab1:
 
         with col1:
             st.markdown('##### Avaliação média por Entregador')
-            df_avg_ratings_per_deliver = (df1.loc[:, ['Delivery_person_Ratings', 'Delivery_person_ID']]
-                                          .groupby('Delivery_person_ID')
-                                          .mean().reset_index()
-                                          .sort_values('Delivery_person_Ratings', ascending=False))
-            st.dataframe(df_avg_ratings_per_deliver,
-                         use_container_width=True, height=500)
+            # Tabela paginada: a tabela completa é calculada uma vez por filtro e só a
+            # página visível é enviada ao navegador
+            if use_sql():
+                def df_avg_ratings_per_deliver():
+                    return query_deliverer_means('Delivery_person_Ratings', (), date_slider,
+                                                 traffic_options, weather_condition)
+            else:
+                def df_avg_ratings_per_deliver():
+                    return avg_ratings_per_deliver(linhas)
+            paged_table('avg_ratings_per_deliver', filtros, df_avg_ratings_per_deliver,
+                        ['Delivery_person_Ratings', 'Delivery_person_ID'],
+                        sort='Delivery_person_Ratings', ascending=False, height=500)
         with col2:
             st.markdown('##### Avaliação média por Trânsito')
-            avg_std_rating_by_traffic = (df1.loc[:, ['Delivery_person_Ratings', 'Road_traffic_density']]
-                                         .groupby('Road_traffic_density')
-                                         .agg({'Delivery_person_Ratings': ['mean', 'std']}))
-            # mudança nome de colunas
-            avg_std_rating_by_traffic.columns = [
-                'devlivery_mean', 'delivery_std']
-            # reset de index
-            avg_std_rating_by_traffic = avg_std_rating_by_traffic.reset_index()
+            avg_std_rating_by_traffic = mean_std(cube, 'Road_traffic_density', 'Delivery_person_Ratings',
+                                                 columns=['devlivery_mean', 'delivery_std'])
             st.dataframe(avg_std_rating_by_traffic, use_container_width=True)
 
             st.markdown('##### Avaliação média por Clima')
-            avg_std_rating_by_weather = (df1.loc[:, ['Delivery_person_Ratings', 'Weatherconditions']]
-                                         .groupby('Weatherconditions')
-                                         .agg({'Delivery_person_Ratings': ['mean', 'std']}))
-            # mudança nome de colunas
-            avg_std_rating_by_weather.columns = ['weather_mean', 'weather_std']
-            # reset do index
-            avg_std_rating_by_weather = avg_std_rating_by_weather.reset_index()
+            avg_std_rating_by_weather = mean_std(cube, 'Weatherconditions', 'Delivery_person_Ratings',
+                                                 columns=['weather_mean', 'weather_std'])
 
             st.dataframe(avg_std_rating_by_weather, use_container_width=True)
     with st.container():
@@ -220,12 +161,27 @@ with tab1:
         st.title('Velocidade de Entrega')
 
         col1, col2 = st.columns(2)
+        # Mais rápidos e mais lentos calculados juntos
+        with span('top_delivers'):
+            if use_sql():
+                mais_rapidos, mais_lentos = query_top_k('Time_taken(min)', 'City', 10, date_slider,
+                                                        traffic_options, weather_condition)
+            else:
+                mais_rapidos, mais_lentos = top_delivers(linhas)
 
         with col1:
             st.subheader('Top entregadores mais rápidos')
-            df2 = top_delivers(df1, top_asc=True)
-            st.dataframe(df2, use_container_width=True, height=500)
+            st.dataframe(mais_rapidos, use_container_width=True, height=500)
         with col2:
             st.subheader('Top Entregadores mais lentos')
-            df2 = top_delivers(df1, top_asc=False)
-            st.dataframe(df2, use_container_width=True, height=500)
+            st.dataframe(mais_lentos, use_container_width=True, height=500)
+
+# =====================================
+# Painel de tempos (depuração)
+# =====================================
+st.sidebar.markdown("""---""")
+data_status()
+if st.sidebar.checkbox('Painel de tempos', key='painel_tempos'):
+    timing_panel(st.sidebar, finish_run())
+else:
+    finish_run()
@@ -1,112 +1,44 @@
-import pandas as pd
-import folium
-import plotly_express as px
-from haversine import haversine
 import streamlit as st
-from PIL import Image
 import datetime
-from streamlit_folium import folium_static
-import numpy as np
-import plotly.graph_objects as go
+from utils.cube import mean_std, overall
+from utils.figures import cached_figure
+from utils.filters import CLIMA_PADRAO, DATA_PADRAO, TRAFEGO_PADRAO, filter_state
+from utils.kpi import KPI, compute_kpis
+from utils.lazy import lazy_import
+from utils.refresh import start_refresher
+from utils.sqlstore import filtered_cube, filtered_distinct, filtered_quantiles
+from utils.tables import paged_table
+from utils.timing import finish_run, span, start_run, timing_panel
+from utils.views import data_status, lazy_tabs, sidebar_branding
+
+go = lazy_import('plotly.graph_objects')
+np = lazy_import('numpy')
+px = lazy_import('plotly_express')
 
 st.set_page_config(page_title='Visão Restaurantes', page_icon='🍽️', layout='wide')
 
+# Spans de tempo desta execução (medidos só com o painel de tempos ligado ou CURRY_TIMING=1)
+start_run('restaurantes', enabled=st.session_state.get('painel_tempos', False))
+
+# Atualização dos dados em segundo plano: a página serve a última versão publicada
+# e não recarrega o csv dentro da requisição quando ele muda
+start_refresher()
+
 # ---------------------------
 # Funções
 # ---------------------------
 
-# Função de limpeza dos dados
-
-
-def clean_code(df1):
-    """Esta função tem a responsabilidade de limpar o dataframe
-        Tipos de limpeza:
-        1. Remoção de dados NaN
-        2. Mudança do tipo da coluna de dados
-        3. Remoção dos espaços das variáveis de texto
-        4. Formatação da coluna de datas
-        5. Limpeza da coluna de tempo (remoção do texto da variável)
-
-        Input: Dataframe
-        Output: Dataframe
+def distance(cube, fig):
+    """Esta função calcula a distância média dos restaurantes e os locais de entrega
+        A distância de cada pedido é calculada uma única vez na carga do dataset (coluna 'distance')
+        e a média é recomposta a partir das somas do cubo.
     """
-    # Tratando a base
-    # Convertendo idade de texto para int
-    linhas_selecionadas = df1['Delivery_person_Age'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-    df1['Delivery_person_Age'] = df1['Delivery_person_Age'].astype(int)
-
-    # tirando o NaN do Road_traffic_density
-    linhas_selecionadas = df1['Road_traffic_density'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # tirando o NaN do City
-    linhas_selecionadas = df1['City'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # tirando o NaN do Festival
-    linhas_selecionadas = df1['Festival'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-
-    # Convertendo a coluna ratings de texto para número decimal
-    df1['Delivery_person_Ratings'] = df1['Delivery_person_Ratings'].astype(
-        float)
-
-    # Convertendo a coluna order_date de texto para data
-    df1['Order_Date'] = pd.to_datetime(df1['Order_Date'], format='%d-%m-%Y')
-
-    # Convertendo multiple_deliveries de texto para int
-    linhas_selecionadas = df1['multiple_deliveries'] != 'NaN '
-    df1 = df1.loc[linhas_selecionadas, :].copy()
-    df1['multiple_deliveries'] = df1['multiple_deliveries'].astype(int)
-
-    # Comando para remover o texte de números
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].apply(
-        lambda x: x.split('(min) ')[1])
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].astype(int)
-
-    # removendo os espaços dentro de strings/texto/object
-    df1.loc[:, 'ID'] = df1.loc[:, 'ID'].str.strip()
-    df1.loc[:, 'Road_traffic_density'] = df1.loc[:,
-                                                 'Road_traffic_density'].str.strip()
-    df1.loc[:, 'Type_of_order'] = df1.loc[:, 'Type_of_order'].str.strip()
-    df1.loc[:, 'Type_of_vehicle'] = df1.loc[:, 'Type_of_vehicle'].str.strip()
-    df1.loc[:, 'City'] = df1.loc[:, 'City'].str.strip()
-    df1.loc[:, 'Festival'] = df1.loc[:, 'Festival'].str.strip()
-
-    return df1
-
-
-def distance(df1, fig):
-    """Esta função calcula a distância média dos restaurantes e os locais de entrega"""
     if fig == False:
-        # Calculo da distância entre o restaurante e local de entrega para cada pedido
-        cols = ['Restaurant_latitude', 'Restaurant_longitude',
-                'Delivery_location_latitude', 'Delivery_location_longitude']
-
-        # Criando a coluna que vai armazenar cada uma das distâncias entre o restaurante e o local de entrega
-        df1['distance'] = (df1.loc[:, cols]
-                           .apply(lambda x: haversine(
-                               (x['Restaurant_latitude'],
-                                x['Restaurant_longitude']),
-                               (x['Delivery_location_latitude'], x['Delivery_location_longitude'])), axis=1))
-
-        average_distance = np.round(df1['distance'].mean(), 2)
+        average_distance = np.round(overall(cube, 'distance')['mean'], 2)
         return average_distance
     else:
-        # Calculo da distância entre o restaurante e local de entrega para cada pedido
-        cols = ['Restaurant_latitude', 'Restaurant_longitude',
-                'Delivery_location_latitude', 'Delivery_location_longitude']
-
-        # Criando a coluna que vai armazenar cada uma das distâncias entre o restaurante e o local de entrega
-        df1['distance'] = (df1.loc[:, cols]
-                           .apply(lambda x: haversine(
-                               (x['Restaurant_latitude'],
-                                x['Restaurant_longitude']),
-                               (x['Delivery_location_latitude'], x['Delivery_location_longitude'])), axis=1))
-
-        average_distance = df1.loc[:, ['City', 'distance']].groupby(
-            'City').mean().reset_index()
+        average_distance = mean_std(cube, 'City', 'distance',
+                                    columns=['distance', 'distance_std'])
 
         fig = go.Figure(data=[go.Pie(labels=average_distance['City'],
                                      values=average_distance['distance'], pull=[0, 0.1, 0])])
@@ -114,35 +46,8 @@ def distance(df1, fig):
         return fig
 
 
-def avg_std_time_delivery(df1, festival, op):
-    """Esta função calcula o tempo médio e o desvio padrão deo tempo de entrega.
-    Parâmetros:
-        Input: 
-            - df: Dataframe com os dados necessários para o cálculo
-            - op: Tipo de operação que precisa ser calculado:
-                - 'avg_time': calcula o tempo médio
-                - 'std_time': calcula o desvio padrão do tempo    
-        Output:
-            - df: Dataframe com 2 colunas e 1 linhas
-    """
-    df_aux = (df1.loc[:, ['Time_taken(min)', 'Festival']]
-              .groupby('Festival')
-              .agg({'Time_taken(min)': ['mean', 'std']}))
-
-    df_aux.columns = ['avg_time', 'std_time']
-
-    df_aux = df_aux.reset_index()
-
-    df_aux = np.round(
-        df_aux.loc[df_aux['Festival'] == festival, op], 2)
-    return df_aux
-
-
-def avg_std_time_graph(df1):
-    df_aux = df1.loc[:, ['City', 'Time_taken(min)']].groupby(
-        'City').agg({'Time_taken(min)': ['mean', 'std']})
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = df_aux.reset_index()
+def avg_std_time_graph(cube):
+    df_aux = mean_std(cube, 'City', 'Time_taken(min)')
 
     fig = go.Figure()
     fig.add_trace(go.Bar(name='Control', x=df_aux['City'], y=df_aux['avg_time'], error_y=dict(
@@ -152,11 +57,8 @@ def avg_std_time_graph(df1):
     return fig
 
 
-def avg_std_time_on_traffic(df1):
-    df_aux = df1.loc[:, ['Time_taken(min)', 'City', 'Road_traffic_density']].groupby(
-        ['City', 'Road_traffic_density']).agg({'Time_taken(min)': ['mean', 'std']})
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = df_aux.reset_index()
+def avg_std_time_on_traffic(cube):
+    df_aux = mean_std(cube, ['City', 'Road_traffic_density'], 'Time_taken(min)')
 
     fig = px.sunburst(df_aux, path=['City', 'Road_traffic_density'], values='avg_time',
                       color='std_time', color_continuous_scale='RdBu',
@@ -164,14 +66,27 @@ def avg_std_time_on_traffic(df1):
     return fig
 
 
-# ---------------------------
-# Import Dataset
-# ---------------------------
-df = pd.read_csv('train.csv')
-# ---------------------------
-# Limpando dados
-# ---------------------------
-df1 = clean_code(df)
+def time_percentiles(quantis):
+    """Esta função retorna os percentis (p50, p90 e p99) do tempo de entrega por cidade e densidade de tráfego.
+        Os percentis vêm dos histogramas combinados das células filtradas (utils.quantiles),
+        sem ordenar os pedidos: o erro é menor que a largura da faixa (1 minuto) e é zero
+        com os tempos em minutos inteiros.
+    """
+    return quantis.quantiles_by(['City', 'Road_traffic_density'])
+
+
+# Cards da visão gerencial, calculados juntos numa única passada sobre o cubo filtrado
+CARDS = {
+    'entregadores_unicos': KPI('Delivery_person_ID', 'distinct'),
+    'distancia_media': KPI('distance', 'mean', decimals=2),
+    'tempo_medio_festival': KPI('Time_taken(min)', 'mean', (('Festival', 'Yes'),), 2),
+    'tempo_medio_sem_festival': KPI('Time_taken(min)', 'mean', (('Festival', 'No'),), 2),
+    'std_festival': KPI('Time_taken(min)', 'std', (('Festival', 'Yes'),), 2),
+    'std_sem_festival': KPI('Time_taken(min)', 'std', (('Festival', 'No'),), 2),
+    'tempo_p50': KPI('Time_taken(min)', 'p50', decimals=1),
+    'tempo_p90': KPI('Time_taken(min)', 'p90', decimals=1),
+    'tempo_p99': KPI('Time_taken(min)', 'p99', decimals=1),
+}
 
 
 # Visão Restaurantes
@@ -181,19 +96,13 @@ st.header('Marketplace - Visão Restaurantes')
 # Barra Lateral
 # =====================================
 
-# Logo Cury Company da barra lateral
-image_path = 'food_delivery.png'
-image = Image.open(image_path)
-# Markdown Slogan Cury Company
-st.sidebar.image(image,  width=150)
-st.sidebar.markdown('# Cury Company')
-st.sidebar.markdown('### Fastest Delivery in Town')
-st.sidebar.markdown("""---""")
+# Logo e slogan Cury Company da barra lateral
+sidebar_branding()
 
 # Filtro Data
 date_slider = st.sidebar.slider(
     'Selecione até qual data',
-    value=datetime.datetime(2022, 4, 13),
+    value=DATA_PADRAO,
     min_value=datetime.datetime(2022, 2, 11),
     max_value=datetime.datetime(2022, 4, 6),
     format='DD-MM-YYYY'
@@ -202,64 +111,72 @@ date_slider = st.sidebar.slider(
 traffic_options = st.sidebar.multiselect(
     'Quais condições de trânsito?',
     ['Low', 'Medium', 'High', 'Jam'],
-    default=['Low', 'Medium', 'High', 'Jam']
+    default=TRAFEGO_PADRAO
 )
 # Filtro condições climáticas
 weather_condition = st.sidebar.multiselect(
     'Quais condições climáticas?',
     ['conditions Cloudy', 'conditions Fog', 'conditions Sandstorms',
         'conditions Stormy', 'conditions Sunny', 'conditions Windy'],
-    default=['conditions Cloudy', 'conditions Fog', 'conditions Sandstorms',
-             'conditions Stormy', 'conditions Sunny', 'conditions Windy']
+    default=CLIMA_PADRAO
 )
-# Aplicação dos filtros de data e tráfego
-linhas_selecionadas = df1['Order_Date'] < date_slider
-df1 = df1.loc[linhas_selecionadas, :]
-
-linhas_selecionadas = df1['Road_traffic_density'].isin(traffic_options)
-df1 = df1.loc[linhas_selecionadas, :]
-
-linhas_selecionadas = df1['Weatherconditions'].isin(weather_condition)
-df1 = df1.loc[linhas_selecionadas, :]
+# Aplicação dos filtros de data, tráfego e clima
+# (sobre os agregados calculados uma vez por processo ou, com CURRY_BACKEND=sqlite, no banco)
+with span('filters'):
+    # Cubo diário pré-agregado que responde as métricas de tempo e distância
+    cube = filtered_cube(date_slider, traffic_options, weather_condition)
+    # Entregadores distintos por dia, tráfego e clima
+    distinct = filtered_distinct(date_slider, traffic_options, weather_condition)
+    # Histogramas do tempo de entrega por dia, cidade, tráfego e clima (percentis)
+    quantis = filtered_quantiles(date_slider, traffic_options, weather_condition)
+# Estado dos filtros: chave dos gráficos em cache
+filtros = filter_state(date_slider, traffic_options, weather_condition)
 
 # =====================================
 # Layout no Streamlit
 # =====================================
 
-tab1, tab2, tab3 = st.tabs(['Visão Gerencial', '_', '_'])
+# Só a aba escolhida é calculada
+aba = lazy_tabs(['Visão Gerencial', '_', '_'], key='aba_restaurantes')
 
-with tab1:
+if aba == 'Visão Gerencial':
     with st.container():
         st.title('Overall Metrics')
 
+        cards = compute_kpis(cube, CARDS, distinct, quantis)
+
         col1, col2 = st.columns(2, gap='small')
 
         with col1:
-            delivery_unique = df1['Delivery_person_ID'].nunique()
-            col1.metric('Entregadores únicos', delivery_unique)
+            col1.metric('Entregadores únicos', cards.entregadores_unicos)
         with col2:
-            average_distance = distance(df1, fig=False)
-            col2.metric('Distância média', average_distance)
+            col2.metric('Distância média', cards.distancia_media)
 
     with st.container():
         col1, col2, col3, col4 = st.columns(4)
 
         with col1:
-            df_aux = avg_std_time_delivery(df1, 'Yes', 'avg_time')
-            col1.metric('Tempo Médio entrega c/ Fest', df_aux)
+            col1.metric('Tempo Médio entrega c/ Fest', cards.tempo_medio_festival)
         with col2:
-            df_aux = avg_std_time_delivery(df1, 'No', 'avg_time')
-            col2.metric('Tempo médio entrega s/ Fest', df_aux)
+            col2.metric('Tempo médio entrega s/ Fest', cards.tempo_medio_sem_festival)
         with col3:
-            df_aux = avg_std_time_delivery(df1, 'Yes', 'std_time')
-            col3.metric('STD entrega c/ Fest', df_aux)
+            col3.metric('STD entrega c/ Fest', cards.std_festival)
         with col4:
-            df_aux = avg_std_time_delivery(df1, 'No', 'std_time')
-            col4.metric('STD entrega s/ Fest', df_aux)
+            col4.metric('STD entrega s/ Fest', cards.std_sem_festival)
+
+    with st.container():
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            col1.metric('Tempo de entrega p50', cards.tempo_p50)
+        with col2:
+            col2.metric('Tempo de entrega p90', cards.tempo_p90)
+        with col3:
+            col3.metric('Tempo de entrega p99', cards.tempo_p99)
     with st.container():
         st.markdown("""---""")
         st.title('Tempo Médio de Entrega por Cidade')
-        fig = avg_std_time_graph(df1)
+        fig = cached_figure('avg_std_time_graph', filtros, lambda: avg_std_time_graph(cube))
         st.plotly_chart(fig)
 
     with st.container():
@@ -269,21 +186,33 @@ with tab1:
         col1, col2 = st.columns(2)
 
         with col1:
-            fig = distance(df1, fig=True)
+            fig = cached_figure('distance', filtros, lambda: distance(cube, fig=True))
             st.plotly_chart(fig, use_container_width=True)
 
         with col2:
-            fig = avg_std_time_on_traffic(df1)
+            fig = cached_figure('avg_std_time_on_traffic', filtros, lambda: avg_std_time_on_traffic(cube))
             st.plotly_chart(fig, use_container_width=True)
 
+    with st.container():
+        st.markdown("""---""")
+        st.title('Percentis do Tempo de Entrega por Cidade e Tráfego')
+
+        st.dataframe(time_percentiles(quantis))
+
     with st.container():
         st.markdown("""---""")
         st.title('Distribuição da Distância')
 
-        df_aux = (df1.loc[:, ['Time_taken(min)', 'City', 'Type_of_order']]
-                  .groupby(['City', 'Type_of_order'])
-                  .agg({'Time_taken(min)': ['mean', 'std']}))
-        df_aux.columns = ['avg_time', 'std_time']
-        df_aux = df_aux.reset_index()
+        paged_table('time_by_city_order', filtros,
+                    lambda: mean_std(cube, ['City', 'Type_of_order'], 'Time_taken(min)'),
+                    ['City', 'Type_of_order', 'avg_time', 'std_time'], height=460)
 
-        st.dataframe(df_aux, height=460)
+# =====================================
+# Painel de tempos (depuração)
+# =====================================
+st.sidebar.markdown("""---""")
+data_status()
+if st.sidebar.checkbox('Painel de tempos', key='painel_tempos'):
+    timing_panel(st.sidebar, finish_run())
+else:
+    finish_run()
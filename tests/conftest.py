@@ -0,0 +1,18 @@
+"""Fixtures compartilhadas dos testes.
+
+Os testes usam um train.csv sintético pequeno (benchmarks.synthetic), com o esquema e
+as peculiaridades do arquivo original, gerado uma vez por sessão num diretório temporário.
+"""
+import pytest
+
+from benchmarks.synthetic import generate_train
+
+LINHAS_FIXTURE = 3000
+
+
+@pytest.fixture(scope='session')
+def train_csv(tmp_path_factory):
+    """Caminho do csv sintético da sessão (o snapshot e os bancos são gravados ao lado dele)."""
+    path = str(tmp_path_factory.mktemp('dados') / 'train.csv')
+    generate_train(path, LINHAS_FIXTURE)
+    return path
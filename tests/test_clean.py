@@ -0,0 +1,62 @@
+"""Limpeza vetorizada (clean_code) comparada com a limpeza original, linha a linha."""
+import pandas as pd
+import pytest
+
+from utils.dataset import COLUNAS_CATEGORICAS, clean_code
+
+
+def clean_code_original(df1):
+    """Limpeza original (antes da máscara única e das colunas categóricas), usada como referência."""
+    linhas_selecionadas = df1['Delivery_person_Age'] != 'NaN '
+    df1 = df1.loc[linhas_selecionadas, :].copy()
+    df1['Delivery_person_Age'] = df1['Delivery_person_Age'].astype(int)
+
+    linhas_selecionadas = df1['Road_traffic_density'] != 'NaN '
+    df1 = df1.loc[linhas_selecionadas, :].copy()
+
+    linhas_selecionadas = df1['City'] != 'NaN '
+    df1 = df1.loc[linhas_selecionadas, :].copy()
+
+    linhas_selecionadas = df1['Festival'] != 'NaN '
+    df1 = df1.loc[linhas_selecionadas, :].copy()
+
+    df1['Delivery_person_Ratings'] = df1['Delivery_person_Ratings'].astype(float)
+
+    df1['Order_Date'] = pd.to_datetime(df1['Order_Date'], format='%d-%m-%Y')
+
+    linhas_selecionadas = df1['multiple_deliveries'] != 'NaN '
+    df1 = df1.loc[linhas_selecionadas, :].copy()
+    df1['multiple_deliveries'] = df1['multiple_deliveries'].astype(int)
+
+    df1['Time_taken(min)'] = df1['Time_taken(min)'].apply(lambda x: x.split('(min) ')[1])
+    df1['Time_taken(min)'] = df1['Time_taken(min)'].astype(int)
+
+    for col in ['ID', 'Road_traffic_density', 'Type_of_order', 'Type_of_vehicle', 'City',
+                'Festival']:
+        df1.loc[:, col] = df1.loc[:, col].str.strip()
+    return df1
+
+
+@pytest.fixture
+def bruto(train_csv):
+    return pd.read_csv(train_csv)
+
+
+def test_same_rows_and_values(bruto):
+    esperado = clean_code_original(bruto.copy())
+    obtido = clean_code(bruto.copy())
+
+    # O csv sintético tem registros inválidos: a comparação precisa remover alguma linha
+    assert 0 < len(obtido) < len(bruto)
+    assert list(obtido.columns) == list(esperado.columns)
+    pd.testing.assert_index_equal(obtido.index, esperado.index)
+    for col in COLUNAS_CATEGORICAS:
+        assert isinstance(obtido[col].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(obtido.astype({col: object for col in COLUNAS_CATEGORICAS}),
+                                  esperado.astype({col: object for col in COLUNAS_CATEGORICAS}))
+
+
+def test_input_is_not_modified(bruto):
+    original = bruto.copy()
+    clean_code(bruto)
+    pd.testing.assert_frame_equal(bruto, original)
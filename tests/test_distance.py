@@ -0,0 +1,45 @@
+"""Coluna 'distance' (haversine vetorizado, float32) comparada com o pacote haversine."""
+import haversine
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dataset import build_dataset, clean_code, haversine_km
+
+# A coluna é gravada em float32 (~7 dígitos significativos)
+TOLERANCIA_RELATIVA = 1e-6
+TOLERANCIA_KM = 1e-4
+
+COLUNAS_COORDENADAS = ['Restaurant_latitude', 'Restaurant_longitude',
+                       'Delivery_location_latitude', 'Delivery_location_longitude']
+
+
+def _referencia(lat1, lng1, lat2, lng2):
+    return np.array([haversine.haversine((a, b), (c, d))
+                     for a, b, c, d in zip(lat1, lng1, lat2, lng2)])
+
+
+def test_distance_column_matches_haversine(train_csv):
+    df1 = build_dataset(train_csv)
+    # Coordenadas originais (float64) de cada pedido, antes da conversão para float32
+    limpo = clean_code(pd.read_csv(train_csv)).set_index('ID').loc[df1['ID'], COLUNAS_COORDENADAS]
+    esperado = _referencia(*(limpo[col].to_numpy() for col in COLUNAS_COORDENADAS))
+
+    assert df1['distance'].dtype == np.float32
+    np.testing.assert_allclose(df1['distance'].to_numpy(dtype=np.float64), esperado,
+                               rtol=TOLERANCIA_RELATIVA, atol=TOLERANCIA_KM)
+
+
+@pytest.mark.parametrize('origem, destino', [
+    ((12.97, 77.59), (12.97, 77.59)),      # mesmo ponto
+    ((0.0, 179.9), (0.0, -179.9)),         # cruzando o antimeridiano
+    ((10.0, -180.0), (10.0, 180.0)),       # o mesmo meridiano escrito dos dois lados
+    ((90.0, 0.0), (-90.0, 0.0)),           # de polo a polo
+    ((90.0, 0.0), (90.0, 120.0)),          # o polo com longitudes diferentes
+    ((89.99, 0.0), (89.99, 180.0)),        # perto do polo, passando por ele
+    ((-33.92, 18.42), (40.71, -74.01)),    # distância longa entre hemisférios
+])
+def test_haversine_edge_cases(origem, destino):
+    calculado = np.float32(haversine_km(origem[0], origem[1], destino[0], destino[1]))
+    esperado = haversine.haversine(origem, destino)
+    assert abs(float(calculado) - esperado) <= TOLERANCIA_RELATIVA * esperado + TOLERANCIA_KM
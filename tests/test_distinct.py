@@ -0,0 +1,59 @@
+"""Contagens de entregadores distintos: sketch HyperLogLog, modo exato e pandas."""
+import numpy as np
+import pytest
+
+from utils.dataset import load_dataset
+from utils.distinct import DIMENSOES_DISTINCT, DistinctSketch, load_distinct
+
+COLUNAS = DIMENSOES_DISTINCT + ['Delivery_person_ID']
+
+# Limite do teste: três erros padrão relativos (os hashes são fixos, o resultado é determinístico)
+DESVIOS = 3
+
+
+@pytest.fixture
+def pedidos(train_csv):
+    return load_dataset(train_csv, columns=COLUNAS)
+
+
+def _semanas(sketch):
+    return sketch.cells['Order_Date'].dt.strftime('%U')
+
+
+def test_exact_mode_matches_pandas(train_csv, pedidos):
+    exato = load_distinct(train_csv, exact=True)
+    assert exato.count() == pedidos['Delivery_person_ID'].nunique()
+
+    esperado = (pedidos.groupby(pedidos['Order_Date'].dt.strftime('%U'))['Delivery_person_ID']
+                .nunique())
+    np.testing.assert_array_equal(exato.count_by(_semanas(exato)).to_numpy(), esperado.to_numpy())
+
+
+def test_estimate_within_error_bound(train_csv):
+    estimado = load_distinct(train_csv)
+    exato = load_distinct(train_csv, exact=True)
+    limite = DESVIOS * 1.04 / np.sqrt(1 << estimado.precision)
+
+    assert abs(estimado.count() - exato.count()) <= limite * exato.count()
+    por_semana = estimado.count_by(_semanas(estimado))
+    por_semana_exato = exato.count_by(_semanas(exato))
+    assert ((por_semana - por_semana_exato).abs() <= limite * por_semana_exato).all()
+
+
+@pytest.mark.parametrize('exact', [False, True])
+def test_missing_ids_are_not_counted(pedidos, exact):
+    pedidos = pedidos.iloc[:500].reset_index(drop=True)
+    # Sem os pedidos da última categoria, um ID ausente lido como o código -1 viraria um
+    # entregador a mais
+    ultimo = pedidos['Delivery_person_ID'].cat.categories[-1]
+    ausentes = (pedidos['Delivery_person_ID'] == ultimo).to_numpy() | (np.arange(len(pedidos)) % 3 == 0)
+    com_ausentes = pedidos.assign(Delivery_person_ID=pedidos['Delivery_person_ID'].mask(ausentes))
+    assert com_ausentes['Delivery_person_ID'].isna().any()
+
+    sketch = DistinctSketch(com_ausentes, exact=exact)
+    preenchidos = DistinctSketch(com_ausentes.loc[~ausentes], exact=exact)
+    # As células dos pedidos sem entregador continuam no sketch, mas não contam
+    assert len(sketch.cells) == len(DistinctSketch(pedidos, exact=exact).cells)
+    assert sketch.count() == preenchidos.count()
+    if exact:
+        assert sketch.count() == com_ausentes['Delivery_person_ID'].nunique()
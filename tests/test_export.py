@@ -0,0 +1,81 @@
+"""Tabelas da exportação em lote comparadas com as funções das páginas chamadas diretamente."""
+import datetime
+import os
+
+import pandas as pd
+import pytest
+
+from utils.cube import filter_cube, load_cube
+from utils.distinct import load_distinct
+from utils.export import figure_table, run_export
+from utils.kpi import compute_kpis
+from utils.pages import load_page_functions
+from utils.quantiles import load_quantiles
+from utils.shared import load_view
+
+CUTOFF = datetime.datetime(2022, 4, 6)
+FILTROS = {'traffic_options': ['Low', 'Jam'], 'weather_condition': ['conditions Sunny', 'conditions Fog']}
+COLUNAS_JOB = ['job', 'cutoff', 'traffic_options', 'weather_condition']
+
+
+@pytest.fixture(scope='module')
+def exportado(train_csv, tmp_path_factory):
+    """Diretório e manifesto de uma exportação com um único job."""
+    output = str(tmp_path_factory.mktemp('export'))
+    return output, run_export([CUTOFF], [FILTROS], output, path=train_csv, workers=1)
+
+
+def _tabela(exportado, nome):
+    output, manifesto = exportado
+    assert nome + '.parquet' in manifesto['files']
+    df_aux = pd.read_parquet(os.path.join(output, nome + '.parquet'))
+    assert len(df_aux) > 0
+    assert (df_aux['job'] == manifesto['jobs'][0]['id']).all()
+    return df_aux.drop(columns=COLUNAS_JOB)
+
+
+def _assert_same(obtido, esperado):
+    pd.testing.assert_frame_equal(obtido.reset_index(drop=True), esperado.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
+
+
+def test_manifest(exportado):
+    _, manifesto = exportado
+    assert manifesto['backend'] == 'pandas'
+    assert [job['cutoff'] for job in manifesto['jobs']] == [CUTOFF.isoformat()]
+
+
+def test_empresa(train_csv, exportado):
+    empresa = load_page_functions('empresa')
+    filtros = (CUTOFF, FILTROS['traffic_options'])
+    cube = filter_cube(load_cube(train_csv), *filtros)
+    _assert_same(_tabela(exportado, 'empresa.order_metric'), figure_table(empresa.order_metric(cube)))
+    _assert_same(_tabela(exportado, 'empresa.order_share_by_week'),
+                 figure_table(empresa.order_share_by_week(
+                     cube, load_distinct(train_csv).filter(*filtros))))
+
+
+def test_entregadores(train_csv, exportado):
+    entregadores = load_page_functions('entregadores')
+    filtros = (CUTOFF, FILTROS['traffic_options'], FILTROS['weather_condition'])
+    cube = filter_cube(load_cube(train_csv), *filtros)
+    _assert_same(_tabela(exportado, 'entregadores.cards'),
+                 pd.DataFrame([compute_kpis(cube, entregadores.CARDS)._asdict()]))
+
+    mais_rapidos, mais_lentos = entregadores.top_delivers(
+        load_view(*filtros, columns=entregadores.COLUNAS, path=train_csv))
+    _assert_same(_tabela(exportado, 'entregadores.top_fastest'), mais_rapidos)
+    _assert_same(_tabela(exportado, 'entregadores.top_slowest'), mais_lentos)
+
+
+def test_restaurantes(train_csv, exportado):
+    restaurantes = load_page_functions('restaurantes')
+    filtros = (CUTOFF, FILTROS['traffic_options'], FILTROS['weather_condition'])
+    cube = filter_cube(load_cube(train_csv), *filtros)
+    quantis = load_quantiles(train_csv).filter(*filtros)
+    cards = compute_kpis(cube, restaurantes.CARDS, load_distinct(train_csv).filter(*filtros), quantis)
+    _assert_same(_tabela(exportado, 'restaurantes.cards'), pd.DataFrame([cards._asdict()]))
+    _assert_same(_tabela(exportado, 'restaurantes.time_percentiles'),
+                 restaurantes.time_percentiles(quantis))
+    _assert_same(_tabela(exportado, 'restaurantes.avg_std_time_graph'),
+                 figure_table(restaurantes.avg_std_time_graph(cube)))
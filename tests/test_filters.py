@@ -0,0 +1,50 @@
+"""Motor de filtros comparado com as máscaras encadeadas do pandas."""
+import datetime
+
+import numpy as np
+import pytest
+
+from utils.dataset import load_dataset
+from utils.filters import COLUNAS_FILTRO, FilterEngine, load_filter_engine
+
+FILTROS = [(None, None, None, None, None),
+           (datetime.datetime(2022, 3, 20), ['Low', 'Medium', 'High'],
+            ['conditions Cloudy', 'conditions Fog', 'conditions Sunny'], None, None),
+           (datetime.datetime(2022, 4, 6), ['Jam'], None, ['Urban', 'Semi-Urban'], ['No']),
+           (datetime.datetime(2000, 1, 1), None, None, None, None)]
+
+
+@pytest.fixture(params=FILTROS, ids=['sem_filtros', 'data_trafego_clima', 'todos', 'vazio'])
+def estado(request):
+    return request.param
+
+
+@pytest.fixture
+def pedidos(train_csv):
+    return load_dataset(train_csv, columns=['Order_Date'] + list(COLUNAS_FILTRO.values()))
+
+
+def _mascaras(df1, date_slider, traffic_options, weather_condition, cities, festival):
+    """Posições das linhas que passam nos filtros, com uma máscara por filtro."""
+    linhas = np.ones(len(df1), dtype=bool)
+    if date_slider is not None:
+        linhas &= (df1['Order_Date'] < date_slider).to_numpy()
+    for col, valores in zip(['Road_traffic_density', 'Weatherconditions', 'City', 'Festival'],
+                            [traffic_options, weather_condition, cities, festival]):
+        if valores is not None:
+            linhas &= df1[col].isin(valores).to_numpy()
+    return np.flatnonzero(linhas)
+
+
+def test_select_matches_masks(train_csv, pedidos, estado):
+    posicoes = np.arange(len(pedidos))[load_filter_engine(train_csv).select(*estado)]
+    np.testing.assert_array_equal(posicoes, _mascaras(pedidos, *estado))
+
+
+def test_select_on_unsorted_rows(pedidos, estado):
+    # Linhas fora da ordem do snapshot: a seleção volta para as posições originais
+    embaralhado = pedidos.sample(frac=1, random_state=0).reset_index(drop=True)
+    engine = FilterEngine(embaralhado)
+    assert not engine.sorted
+    posicoes = np.arange(len(embaralhado))[engine.select(*estado)]
+    np.testing.assert_array_equal(posicoes, _mascaras(embaralhado, *estado))
@@ -0,0 +1,33 @@
+"""Cubo calculado em partições no pool de processos comparado com o cálculo serial."""
+import pandas as pd
+import pytest
+
+from utils import parallel
+from utils.cube import DIMENSOES, MEDIDAS, build_cube, parallel_cube
+from utils.dataset import concat_rows, load_dataset
+
+
+@pytest.fixture
+def dois_processos(monkeypatch):
+    # CURRY_WORKERS é lido na importação do módulo
+    monkeypatch.setenv('CURRY_WORKERS', '2')
+    monkeypatch.setattr(parallel, 'WORKERS', parallel.workers_from('2'))
+    yield
+    parallel.shutdown_pool()
+
+
+@pytest.fixture
+def pedidos(train_csv):
+    # Cópias do csv sintético: o dataset precisa passar do limite do cálculo paralelo
+    df1 = load_dataset(train_csv, columns=DIMENSOES + MEDIDAS)
+    return concat_rows([df1] * (parallel.MIN_LINHAS_PARALELO // len(df1) + 1))
+
+
+def test_parallel_cube_equals_serial(dois_processos, pedidos):
+    assert len(pedidos) >= parallel.MIN_LINHAS_PARALELO
+    serial = build_cube(pedidos)
+    paralelo = parallel_cube(pedidos)
+
+    # O cálculo foi mesmo para o pool
+    assert parallel._pool is not None
+    pd.testing.assert_frame_equal(paralelo.reset_index(drop=True), serial.reset_index(drop=True))
@@ -0,0 +1,91 @@
+"""Percentis do sketch de histogramas comparados com os percentis exatos do pandas."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.cube import filter_cube
+from utils.dataset import concat_rows, load_dataset
+from utils.quantiles import (DIMENSOES_PERCENTIS, LARGURA_FAIXA, MEDIDA_PERCENTIS, PERCENTIS,
+                             QuantileSketch, percentile_name)
+
+COLUNAS = DIMENSOES_PERCENTIS + [MEDIDA_PERCENTIS]
+POR_GRUPO = ['City', 'Road_traffic_density']
+
+FILTROS = [(None, None, None),
+           (pd.Timestamp(2022, 3, 20), ['Low', 'Jam'], None),
+           (pd.Timestamp(2022, 4, 6), ['High', 'Medium'], ['conditions Sunny', 'conditions Fog'])]
+
+
+@pytest.fixture(params=FILTROS, ids=['sem_filtros', 'data_trafego', 'data_trafego_clima'])
+def estado(request):
+    return request.param
+
+
+@pytest.fixture
+def pedidos(train_csv):
+    return load_dataset(train_csv, columns=COLUNAS)
+
+
+@pytest.fixture
+def pedidos_fracionados(pedidos):
+    """Pedidos com tempos fracionários: cada faixa passa a ter valores diferentes."""
+    rng = np.random.default_rng(0)
+    tempos = pedidos[MEDIDA_PERCENTIS].to_numpy(dtype=np.float64) + rng.uniform(0, 1, len(pedidos))
+    return pedidos.assign(**{MEDIDA_PERCENTIS: tempos})
+
+
+def _erros(df1, estado):
+    """Maior erro absoluto do sketch contra o pandas: no total e por cidade e tráfego."""
+    linhas = filter_cube(df1, *estado)
+    filtrado = QuantileSketch(df1).filter(*estado)
+    assert len(linhas) > 0
+
+    exato = linhas[MEDIDA_PERCENTIS].quantile(list(PERCENTIS)).to_numpy()
+    erro_total = np.max(np.abs(filtrado.quantiles() - exato))
+
+    exato = (linhas.groupby(POR_GRUPO, observed=True)[MEDIDA_PERCENTIS]
+             .quantile(list(PERCENTIS)).unstack().reset_index().sort_values(POR_GRUPO, ignore_index=True))
+    estimado = filtrado.quantiles_by(POR_GRUPO)
+    # Chaves comparadas como texto: o tipo das colunas de rótulos varia entre versões do pandas
+    np.testing.assert_array_equal(estimado[POR_GRUPO].astype(str).to_numpy(),
+                                  exato[POR_GRUPO].astype(str).to_numpy())
+    colunas = [percentile_name(q) for q in PERCENTIS]
+    erro_grupos = np.max(np.abs(estimado[colunas].to_numpy() - exato[list(PERCENTIS)].to_numpy()))
+    return erro_total, erro_grupos
+
+
+def test_error_below_bin_width(pedidos_fracionados, estado):
+    erro_total, erro_grupos = _erros(pedidos_fracionados, estado)
+    assert erro_total < LARGURA_FAIXA
+    assert erro_grupos < LARGURA_FAIXA
+
+
+def test_whole_minutes_are_exact(pedidos, estado):
+    # O tempo de entrega do csv é um número inteiro de minutos: uma faixa de 1 minuto tem um só valor
+    assert (pedidos[MEDIDA_PERCENTIS] % 1 == 0).all()
+    erro_total, erro_grupos = _erros(pedidos, estado)
+    assert erro_total == pytest.approx(0, abs=1e-9)
+    assert erro_grupos == pytest.approx(0, abs=1e-9)
+
+
+def _histogramas(sketch):
+    """Células (como texto) e histogramas do sketch, na ordem das células."""
+    chaves = sketch.cells.astype(str).agg('|'.join, axis=1).to_numpy()
+    ordem = np.argsort(chaves)
+    return chaves[ordem], sketch.counts[ordem], sketch.sums[ordem]
+
+
+def test_merge_equals_sketch_of_concatenated_rows(pedidos_fracionados):
+    metade = len(pedidos_fracionados) // 2
+    primeira = pedidos_fracionados.iloc[:metade].reset_index(drop=True)
+    segunda = pedidos_fracionados.iloc[metade:].reset_index(drop=True)
+
+    combinado = QuantileSketch(primeira).merge(QuantileSketch(segunda))
+    completo = QuantileSketch(concat_rows([primeira, segunda]))
+
+    celulas, counts, sums = _histogramas(combinado)
+    celulas_completo, counts_completo, sums_completo = _histogramas(completo)
+    np.testing.assert_array_equal(celulas, celulas_completo)
+    np.testing.assert_array_equal(counts, counts_completo)
+    np.testing.assert_allclose(sums, sums_completo, rtol=1e-12)
+    np.testing.assert_allclose(combinado.quantiles(), completo.quantiles(), rtol=1e-12)
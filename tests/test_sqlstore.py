@@ -0,0 +1,106 @@
+"""Consultas do backend SQLite comparadas com o caminho em pandas (referência)."""
+import datetime
+import shutil
+
+import pandas as pd
+import pytest
+
+from utils.cube import filter_cube, load_cube
+from utils.dataset import load_dataset
+from utils.distinct import load_distinct
+from utils.quantiles import load_quantiles
+from utils.shared import RowView
+from utils.sqlstore import (COLUNAS_SQL, SqlDistinct, connect, ensure_database, query_cube,
+                            query_deliverer_means, query_quantiles, query_top_k)
+from utils.topk import top_k_per_group
+
+# Somas e médias em float64 feitas em ordens diferentes
+TOLERANCIA_RELATIVA = 1e-9
+
+FILTROS = [(None, None, None),
+           (datetime.datetime(2022, 3, 20), ['Low', 'Jam'], None),
+           (datetime.datetime(2022, 4, 6), ['High', 'Medium'],
+            ['conditions Sunny', 'conditions Fog'])]
+
+
+def _linhas(df1, date_slider, traffic_options, weather_condition):
+    """Pedidos que passam nos filtros, com máscaras sobre as linhas."""
+    if date_slider is not None:
+        df1 = df1.loc[df1['Order_Date'] < date_slider]
+    if traffic_options is not None:
+        df1 = df1.loc[df1['Road_traffic_density'].isin(traffic_options)]
+    if weather_condition is not None:
+        df1 = df1.loc[df1['Weatherconditions'].isin(weather_condition)]
+    return df1.reset_index(drop=True)
+
+
+def _assert_same(esperado, obtido):
+    pd.testing.assert_frame_equal(esperado.reset_index(drop=True), obtido.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False,
+                                  rtol=TOLERANCIA_RELATIVA)
+
+
+@pytest.fixture(autouse=True)
+def banco(train_csv):
+    # As consultas só abrem o banco publicado: ele é montado antes, como no aquecimento
+    ensure_database(train_csv)
+
+
+@pytest.fixture(params=FILTROS, ids=['sem_filtros', 'data_trafego', 'data_trafego_clima'])
+def estado(request):
+    return request.param
+
+
+def test_cube(train_csv, estado):
+    _assert_same(filter_cube(load_cube(train_csv), *estado), query_cube(*estado, path=train_csv))
+
+
+def test_distinct(train_csv, estado):
+    exato = load_distinct(train_csv, exact=True).filter(*estado)
+    distinct = SqlDistinct(*estado, path=train_csv)
+    linhas = _linhas(load_dataset(train_csv, columns=COLUNAS_SQL), *estado)
+
+    assert distinct.count() == exato.count() == linhas['Delivery_person_ID'].nunique()
+    semanas = exato.cells['Order_Date'].dt.strftime('%U')
+    pd.testing.assert_series_equal(
+        distinct.count_by(distinct.cells['Order_Date'].dt.strftime('%U')),
+        exato.count_by(semanas), check_dtype=False, check_index_type=False, check_names=False)
+
+
+def test_quantiles(train_csv, estado):
+    por_grupo = ['City', 'Road_traffic_density']
+    _assert_same(load_quantiles(train_csv).filter(*estado).quantiles_by(por_grupo),
+                 query_quantiles(*estado, path=train_csv).quantiles_by(por_grupo))
+
+
+def test_top_k(train_csv, estado):
+    linhas = _linhas(load_dataset(train_csv, columns=COLUNAS_SQL), *estado)
+    # Mesmo cálculo da visão entregadores (top_delivers), sem importar a página
+    medias = RowView(linhas).group_mean(['City', 'Delivery_person_ID'], 'Time_taken(min)')
+    mais_rapidos, mais_lentos = top_k_per_group(medias, 'City', 'Time_taken(min)', 10)
+    sql_rapidos, sql_lentos = query_top_k('Time_taken(min)', 'City', 10, *estado, path=train_csv)
+
+    # Entre médias empatadas no limite do top-k o entregador escolhido pode mudar
+    # (pandas: ordem das linhas; SQL: ID), então só os valores são comparados
+    colunas = ['City', 'Time_taken(min)']
+    _assert_same(mais_rapidos.loc[:, colunas], sql_rapidos.loc[:, colunas])
+    _assert_same(mais_lentos.loc[:, colunas], sql_lentos.loc[:, colunas])
+
+
+def test_ratings_by_deliverer(train_csv, estado):
+    linhas = _linhas(load_dataset(train_csv, columns=COLUNAS_SQL), *estado)
+    medias = (linhas.loc[:, ['Delivery_person_Ratings', 'Delivery_person_ID']]
+              .groupby('Delivery_person_ID', observed=True).mean().reset_index())
+    medias['Delivery_person_ID'] = medias['Delivery_person_ID'].astype(str)
+    _assert_same(medias.sort_values('Delivery_person_ID'),
+                 query_deliverer_means('Delivery_person_Ratings', (), *estado, path=train_csv))
+
+
+def test_connect_does_not_build_database(train_csv, tmp_path):
+    copia = str(tmp_path / 'train.csv')
+    shutil.copyfile(train_csv, copia)
+    with pytest.raises(RuntimeError):
+        connect(copia)
+
+    ensure_database(copia)
+    assert connect(copia).execute('SELECT COUNT(*) FROM pedidos').fetchone()[0] > 0
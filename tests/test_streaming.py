@@ -0,0 +1,32 @@
+"""Métricas das páginas calculadas a partir dos parciais do pipeline em streaming."""
+import datetime
+
+import pytest
+
+from utils.dataset import load_dataset
+from utils.filters import CLIMA_PADRAO, DATA_PADRAO, TRAFEGO_PADRAO
+from utils.streaming import page_metrics, stream_partials
+
+
+@pytest.fixture(scope='module')
+def parciais(train_csv):
+    partials, stats = stream_partials(train_csv, chunksize=1000, workers=1)
+    assert stats['chunks'] > 1
+    return partials
+
+
+def test_default_filters_match_whole_history(train_csv, parciais):
+    metricas = page_metrics(parciais, DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO)
+    df1 = load_dataset(train_csv, columns=['Delivery_person_ID'])
+    assert metricas['orders_by_day']['orders'].sum() == len(df1)
+    assert len(metricas['ratings_by_deliverer']) == df1['Delivery_person_ID'].nunique()
+
+
+@pytest.mark.parametrize('filtros', [(datetime.datetime(2022, 3, 20), None, None),
+                                     (None, ['Low', 'Jam'], None),
+                                     (None, None, ['conditions Sunny'])],
+                         ids=['data', 'trafego', 'clima'])
+def test_filters_that_remove_orders_are_rejected(parciais, filtros):
+    # O cubo de entregadores e a grade do mapa não têm essas dimensões
+    with pytest.raises(ValueError):
+        page_metrics(parciais, *filtros)
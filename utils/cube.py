@@ -0,0 +1,163 @@
+"""Cubo diário pré-agregado que responde os gráficos do dashboard.
+
+O cubo guarda, para cada combinação de dia e dimensões (City, tráfego, clima,
+festival e tipo de pedido), a quantidade de pedidos e a contagem, soma, soma dos
+quadrados, mínimo e máximo de cada medida. Filtros e gráficos são calculados sobre
+as células do cubo, com custo proporcional ao número de células e não ao número
+de pedidos. Média e desvio padrão são recompostos a partir das somas.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.dataset import DATA_PATH, concat_rows, load_derived
+from utils.parallel import MIN_LINHAS_PARALELO, parallel_aggregate
+
+DIMENSOES = ['Order_Date', 'City', 'Road_traffic_density',
+             'Weatherconditions', 'Festival', 'Type_of_order']
+
+MEDIDAS = ['Time_taken(min)', 'Delivery_person_Ratings', 'distance',
+           'Delivery_person_Age', 'Vehicle_condition']
+
+# Agregados guardados por medida: sufixo da coluna -> função de combinação das células
+AGREGADOS = {'_count': 'sum', '_sum': 'sum', '_sumsq': 'sum',
+             '_min': 'min', '_max': 'max'}
+
+
+def build_cube(df1, dimensions=DIMENSOES, measures=MEDIDAS):
+    """Esta função agrega os pedidos por dia e dimensões.
+
+        Input: Dataframe limpo
+        Output: Dataframe com as dimensões, a coluna 'orders' e, para cada medida,
+                as colunas <medida>_count, _sum, _sumsq, _min e _max
+    """
+    df_aux = df1.loc[:, dimensions].copy()
+    agregacoes = {'orders': (dimensions[0], 'size')}
+    for measure in measures:
+        valores = df1[measure].astype('float64')
+        df_aux[measure] = valores
+        df_aux[measure + '_sq'] = valores ** 2
+
+        agregacoes[measure + '_count'] = (measure, 'count')
+        agregacoes[measure + '_sum'] = (measure, 'sum')
+        agregacoes[measure + '_sumsq'] = (measure + '_sq', 'sum')
+        agregacoes[measure + '_min'] = (measure, 'min')
+        agregacoes[measure + '_max'] = (measure, 'max')
+
+    cube = (df_aux.groupby(dimensions, observed=True)
+            .agg(**agregacoes)
+            .reset_index())
+    return _sort_cells(cube, dimensions)
+
+
+def _sort_cells(cube, dimensions):
+    """Ordena as células pelas dimensões: o cubo de um mesmo conjunto de pedidos sai sempre igual,
+        calculado de uma vez, em lotes ou em partições paralelas.
+    """
+    return cube.sort_values(list(dimensions), ignore_index=True, kind='stable')
+
+
+def combine_cubes(cubes):
+    """Esta função combina cubos parciais (de lotes ou partições diferentes) somando as células iguais."""
+    cube = concat_rows(cubes)
+    agregacoes = {'orders': 'sum'}
+    for col in cube.columns:
+        for sufixo, funcao in AGREGADOS.items():
+            if col.endswith(sufixo):
+                agregacoes[col] = funcao
+    dimensions = [col for col in cube.columns if col not in agregacoes]
+
+    return _sort_cells(cube.groupby(dimensions, observed=True)
+                       .agg(agregacoes)
+                       .reset_index(), dimensions)
+
+
+def merge_cube(cube, df_new):
+    """Atualiza o cubo com pedidos novos, agregando apenas as linhas novas."""
+    return combine_cubes([cube, build_cube(df_new)])
+
+
+def load_cube(path=DATA_PATH):
+    """Retorna o cubo do dataset atual, calculado uma única vez por versão dos dados.
+        Pedidos incorporados pela ingestão incremental são somados ao cubo em cache.
+        Com CURRY_WORKERS > 1 o cubo é calculado em partições no pool de processos (utils.parallel).
+    """
+    return load_derived('cube', parallel_cube, path, columns=DIMENSOES + MEDIDAS,
+                        merge=merge_cube)
+
+
+def parallel_cube(df1, workers=None, min_rows=MIN_LINHAS_PARALELO):
+    """Calcula o cubo por cidade e faixa de datas no pool de processos (serial com 1 processo)."""
+    return parallel_aggregate(build_cube, combine_cubes, df1, workers, min_rows=min_rows)
+
+
+def filter_cube(cube, date_slider=None, traffic_options=None, weather_condition=None):
+    """Esta função aplica os filtros da barra lateral sobre as células do cubo.
+
+        Input:
+            - date_slider: mantém os dias anteriores a esta data
+            - traffic_options: densidades de tráfego selecionadas
+            - weather_condition: condições climáticas selecionadas
+        Filtros com valor None não são aplicados.
+    """
+    linhas_selecionadas = np.ones(len(cube), dtype=bool)
+    if date_slider is not None:
+        linhas_selecionadas &= (cube['Order_Date'] < date_slider).to_numpy()
+    if traffic_options is not None:
+        linhas_selecionadas &= cube['Road_traffic_density'].isin(
+            traffic_options).to_numpy()
+    if weather_condition is not None:
+        linhas_selecionadas &= cube['Weatherconditions'].isin(
+            weather_condition).to_numpy()
+    return cube.loc[linhas_selecionadas, :]
+
+
+def _statistics(df_aux, measure):
+    """Recompõe contagem, média, desvio padrão (amostral), mínimo e máximo a partir das somas."""
+    n = df_aux[measure + '_count']
+    soma = df_aux[measure + '_sum']
+    media = (soma / n).where(n > 0)
+    variancia = ((df_aux[measure + '_sumsq'] - soma * media) / (n - 1)).where(n > 1)
+    return pd.DataFrame({'orders': df_aux['orders'],
+                         'count': n,
+                         'mean': media,
+                         'std': np.sqrt(variancia.clip(lower=0)),
+                         'min': df_aux[measure + '_min'],
+                         'max': df_aux[measure + '_max']})
+
+
+def rollup(cube, by, measure=None):
+    """Esta função reagrupa as células do cubo pelas dimensões pedidas.
+
+        Input:
+            - by: dimensão ou lista de dimensões
+            - measure: medida a resumir (None retorna apenas a quantidade de pedidos)
+        Output: Dataframe ordenado pelas dimensões, com 'orders' e, se houver medida,
+                'count', 'mean', 'std', 'min' e 'max'
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    grouped = cube.groupby(by, observed=True)
+    if measure is None:
+        df_aux = grouped[['orders']].sum()
+    else:
+        agregacoes = {measure + sufixo: funcao for sufixo, funcao in AGREGADOS.items()}
+        agregacoes['orders'] = 'sum'
+        df_aux = _statistics(grouped.agg(agregacoes), measure)
+
+    # groupby com observed=True e várias categóricas não garante a ordem dos grupos
+    return df_aux.reset_index().sort_values(by, ignore_index=True)
+
+
+def overall(cube, measure):
+    """Retorna contagem, média, desvio padrão, mínimo e máximo da medida em todas as células."""
+    totais = {measure + sufixo: getattr(cube[measure + sufixo], funcao)()
+              for sufixo, funcao in AGREGADOS.items()}
+    totais['orders'] = cube['orders'].sum()
+    return _statistics(pd.DataFrame([totais]), measure).iloc[0]
+
+
+def mean_std(cube, by, measure, columns=('avg_time', 'std_time')):
+    """Retorna a média e o desvio padrão da medida por grupo, com os nomes de coluna usados nas páginas."""
+    by = [by] if isinstance(by, str) else list(by)
+    df_aux = rollup(cube, by, measure).loc[:, by + ['mean', 'std']]
+    df_aux.columns = by + list(columns)
+    return df_aux
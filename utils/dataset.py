@@ -0,0 +1,678 @@
+"""Acesso aos dados compartilhado entre as páginas do dashboard.
+
+O dataset é lido e limpo uma única vez por processo. O resultado fica em cache
+associado à identidade do arquivo de origem (caminho, data de modificação e
+tamanho) e só é recalculado quando o arquivo muda.
+
+Quando o pyarrow está instalado, o dataframe limpo e com tipos compactos é
+gravado num snapshot Parquet ao lado do csv. As próximas cargas leem do snapshot
+apenas as colunas pedidas, sem refazer a limpeza; o snapshot é refeito quando o
+csv é mais novo que ele. O Parquet é comprimido, então as colunas são decodificadas
+para a memória: a conversão para pandas reaproveita os buffers Arrow das colunas
+numéricas e de data sem cópia e libera cada coluna Arrow assim que ela é
+convertida (read_snapshot), de modo que a carga ocupa uma cópia dos dados e não duas.
+
+Pedidos novos podem ser incorporados ao snapshot sem reprocessar o csv
+(append_rows, usado por utils.ingest). Cada lote incorporado é gravado num
+arquivo Parquet à parte (uma parte do snapshot), sem regravar o snapshot: o custo
+de um lote é proporcional ao lote e não ao dataset. A cada MAX_PARTES partes o
+snapshot é regravado com todas elas. Cada incorporação grava um watermark ao lado
+do csv, que lista as partes e também compõe a versão dos dados.
+
+Com a atualização em segundo plano (utils.refresh) ativa, as páginas servem a
+última versão publicada: uma mudança no csv não é recarregada dentro de uma
+requisição. refresh_dataset monta a versão nova fora do caminho das requisições
+(uma atualização por vez) e troca todos os caches e a versão publicada de uma vez.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from utils.timing import span, timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sem pyarrow o dataset é sempre lido do csv
+    pa = None
+    pq = None
+
+DATA_PATH = 'train.csv'
+
+# Versão do formato do snapshot: snapshots de outra versão são refeitos
+SNAPSHOT_VERSION = '3'
+
+# Cache do processo: (caminho absoluto, colunas) -> (identidade do arquivo, dataframe limpo)
+_cache = {}
+# Resultados derivados do dataset: (nome, caminho absoluto) -> (versão, resultado, merge, colunas, builder)
+_derived = {}
+_lock = threading.RLock()
+# Versão publicada de cada csv (atualização em segundo plano): caminho absoluto -> (versão, publicada em)
+_published = {}
+# Garante uma única atualização em andamento por processo
+_refresh_lock = threading.Lock()
+
+
+# Colunas em que o texto 'NaN ' marca um registro inválido
+COLUNAS_NAN = ['Delivery_person_Age', 'Road_traffic_density', 'City',
+               'Festival', 'multiple_deliveries']
+
+# Colunas de baixa cardinalidade armazenadas como categóricas
+COLUNAS_CATEGORICAS = ['City', 'Road_traffic_density', 'Weatherconditions',
+                       'Festival', 'Type_of_order', 'Type_of_vehicle']
+
+# Categóricas cujos valores chegam com espaços no fim do texto
+COLUNAS_CATEGORICAS_STRIP = ['City', 'Road_traffic_density', 'Festival',
+                             'Type_of_order', 'Type_of_vehicle']
+
+# Tipos compactos do dataset limpo
+TIPOS_COMPACTOS = {
+    'Delivery_person_Age': 'int8',
+    'Vehicle_condition': 'int8',
+    'multiple_deliveries': 'int8',
+    'Time_taken(min)': 'int16',
+    'Restaurant_latitude': 'float32',
+    'Restaurant_longitude': 'float32',
+    'Delivery_location_latitude': 'float32',
+    'Delivery_location_longitude': 'float32',
+    'Delivery_person_ID': 'category',
+    'distance': 'float32',
+}
+
+# Ordem das linhas do snapshot: agrupadas pelas categorias dos filtros da barra
+# lateral e ordenadas por data dentro de cada grupo (ver utils.filters)
+ORDEM_SNAPSHOT = ['Road_traffic_density', 'Weatherconditions', 'City', 'Festival',
+                  'Order_Date']
+
+# Partes do snapshot (lotes incorporados) acumuladas antes de regravar o snapshot com elas
+MAX_PARTES = 16
+
+# Raio médio da Terra em km (o mesmo usado pelo pacote haversine)
+RAIO_TERRA_KM = 6371.0088
+
+
+def _parse_repeated(col, parser, dtype):
+    """Converte cada valor distinto da coluna uma única vez e replica o resultado pelos códigos.
+        As colunas numéricas do csv têm poucas dezenas de valores distintos, então o
+        parser em Python roda sobre os valores únicos e não sobre cada linha.
+    """
+    codes, uniques = pd.factorize(col)
+    if (codes < 0).any():
+        return col.map(parser, na_action='ignore').astype(dtype)
+    values = np.array([parser(valor) for valor in uniques], dtype=dtype)
+    return pd.Series(values[codes], index=col.index, name=col.name)
+
+
+def _strip_categorical(col):
+    """Converte a coluna para categórica removendo os espaços apenas das categorias."""
+    col = col.astype('category')
+    categorias = col.cat.categories.str.strip()
+    if not categorias.is_unique:
+        # 'Low' e 'Low ' viram a mesma categoria: remove os espaços linha a linha
+        return col.astype(object).str.strip().astype('category')
+    return col.cat.rename_categories(categorias)
+
+
+# Função de limpeza dos dados
+@timed('clean_code')
+def clean_code(df1):
+    """Esta função tem a responsabilidade de limpar o dataframe
+        Tipos de limpeza:
+        1. Remoção de dados NaN
+        2. Mudança do tipo da coluna de dados
+        3. Remoção dos espaços das variáveis de texto
+        4. Formatação da coluna de datas
+        5. Limpeza da coluna de tempo (remoção do texto da variável)
+
+        A remoção dos registros inválidos usa uma única máscara combinada (uma única
+        cópia do dataframe) e as colunas de baixa cardinalidade viram categóricas.
+
+        Input: Dataframe
+        Output: Dataframe
+    """
+    # Máscara única com as linhas sem 'NaN ' em nenhuma das colunas obrigatórias
+    with span('clean_code.nan', rows_in=len(df1)) as medicao:
+        linhas_selecionadas = np.ones(len(df1), dtype=bool)
+        for col in COLUNAS_NAN:
+            linhas_selecionadas &= (df1[col] != 'NaN ').to_numpy()
+        df1 = df1.loc[linhas_selecionadas, :].copy()
+        medicao.rows_out = len(df1)
+
+    # Convertendo idade, ratings e multiple_deliveries de texto para número
+    with span('clean_code.numbers', rows_in=len(df1)):
+        df1['Delivery_person_Age'] = _parse_repeated(
+            df1['Delivery_person_Age'], int, np.int64)
+        df1['Delivery_person_Ratings'] = _parse_repeated(
+            df1['Delivery_person_Ratings'], float, np.float64)
+        df1['multiple_deliveries'] = _parse_repeated(
+            df1['multiple_deliveries'], int, np.int64)
+
+    # Convertendo a coluna order_date de texto para data
+    with span('clean_code.dates', rows_in=len(df1)):
+        df1['Order_Date'] = pd.to_datetime(df1['Order_Date'], format='%d-%m-%Y')
+
+    # Comando para remover o texto de números
+    with span('clean_code.time_taken', rows_in=len(df1)):
+        df1['Time_taken(min)'] = _parse_repeated(
+            df1['Time_taken(min)'], lambda x: int(x.split('(min) ')[1]), np.int64)
+
+    # removendo os espaços dentro de strings/texto/object
+    with span('clean_code.strings', rows_in=len(df1)):
+        df1['ID'] = df1['ID'].str.strip()
+        for col in COLUNAS_CATEGORICAS:
+            if col in COLUNAS_CATEGORICAS_STRIP:
+                df1[col] = _strip_categorical(df1[col])
+            else:
+                df1[col] = df1[col].astype('category')
+
+    return df1
+
+
+def file_key(path):
+    """Retorna a identidade do arquivo: caminho absoluto, data de modificação e tamanho."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Distância de grande círculo em km entre arrays de coordenadas (graus), calculada de forma vetorizada."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(x, dtype=np.float64))
+                              for x in (lat1, lng1, lat2, lng2))
+    d = (np.sin((lat2 - lat1) * 0.5) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) * 0.5) ** 2)
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(d))
+
+
+@timed('add_distance')
+def add_distance(df1):
+    """Esta função cria a coluna 'distance' com a distância (km) entre o restaurante e o local de entrega."""
+    df1['distance'] = haversine_km(df1['Restaurant_latitude'], df1['Restaurant_longitude'],
+                                   df1['Delivery_location_latitude'], df1['Delivery_location_longitude'])
+    return df1
+
+
+@timed('compact_dtypes')
+def compact_dtypes(df1):
+    """Esta função converte o dataframe limpo para os tipos compactos (int8/int16, float32 e categóricas)."""
+    tipos = {col: tipo for col, tipo in TIPOS_COMPACTOS.items()
+             if col in df1.columns}
+    return df1.astype(tipos)
+
+
+def build_dataset(path=DATA_PATH):
+    """Esta função lê o csv, limpa os dados, calcula a distância de cada pedido e
+        retorna o dataframe com tipos compactos, na ordem de ORDEM_SNAPSHOT.
+
+        Com as linhas agrupadas pelas categorias dos filtros e ordenadas por data
+        dentro de cada grupo, qualquer combinação de filtros da barra lateral
+        vira um conjunto de recortes contínuos (ver utils.filters).
+    """
+    with span('read_csv') as medicao:
+        df = pd.read_csv(path)
+        medicao.rows_out = len(df)
+    df1 = compact_dtypes(add_distance(clean_code(df)))
+    with span('sort_snapshot', rows_in=len(df1)):
+        return (df1.sort_values(ORDEM_SNAPSHOT, kind='stable', na_position='first')
+                .reset_index(drop=True))
+
+
+def snapshot_path(path=DATA_PATH):
+    """Retorna o caminho do snapshot Parquet associado ao csv."""
+    return os.path.splitext(path)[0] + '.parquet'
+
+
+def write_snapshot(df1, path):
+    """Grava o dataframe limpo no snapshot Parquet de forma atômica."""
+    table = pa.Table.from_pandas(df1, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'snapshot_version'] = SNAPSHOT_VERSION.encode()
+    table = table.replace_schema_metadata(metadata)
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def snapshot_is_fresh(path=DATA_PATH):
+    """Indica se o snapshot existe, é da versão atual e não é mais antigo que o csv."""
+    snapshot = snapshot_path(path)
+    if not os.path.exists(snapshot):
+        return False
+    if os.stat(snapshot).st_mtime_ns < os.stat(path).st_mtime_ns:
+        return False
+    metadata = pq.read_schema(snapshot).metadata or {}
+    return metadata.get(b'snapshot_version') == SNAPSHOT_VERSION.encode()
+
+
+def snapshot_files(path=DATA_PATH):
+    """Arquivos do snapshot do csv: o snapshot e as partes incorporadas listadas no watermark."""
+    pasta = os.path.dirname(os.path.abspath(path))
+    partes = (read_watermark(path) or {}).get('parts', [])
+    return [snapshot_path(path)] + [os.path.join(pasta, parte) for parte in partes]
+
+
+def read_snapshot(path, columns=None):
+    """Lê o snapshot carregando apenas as colunas pedidas.
+
+        path é um arquivo Parquet ou uma lista deles (snapshot_files), concatenados na ordem.
+
+        split_blocks mantém as colunas numéricas e de data nos buffers Arrow decodificados
+        (sem cópia para blocos do pandas) e self_destruct libera cada coluna da tabela
+        Arrow logo depois de convertida, então o pico não soma a tabela Arrow inteira
+        ao dataframe.
+    """
+    arquivos = [path] if isinstance(path, (str, os.PathLike)) else list(path)
+    with span('read_snapshot') as medicao:
+        partes = []
+        for arquivo in arquivos:
+            tabela = pq.read_table(arquivo, columns=columns)
+            partes.append(tabela.to_pandas(split_blocks=True, self_destruct=True))
+            del tabela
+        # As partes podem ter categorias diferentes: concat_rows faz a união
+        df1 = partes[0] if len(partes) == 1 else concat_rows(partes)
+        medicao.rows_out = len(df1)
+    return df1
+
+
+def watermark_path(path=DATA_PATH):
+    """Retorna o caminho do watermark da ingestão incremental associado ao csv."""
+    return os.path.splitext(path)[0] + '.watermark.json'
+
+
+def read_watermark(path=DATA_PATH):
+    """Lê o watermark persistido (None se nada foi incorporado desde a última carga do csv)."""
+    try:
+        with open(watermark_path(path), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def _write_watermark(watermark, path):
+    """Grava o watermark de forma atômica."""
+    destino = watermark_path(path)
+    tmp_path = '{}.{}.tmp'.format(destino, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as arquivo:
+        json.dump(watermark, arquivo, indent=2)
+    os.replace(tmp_path, destino)
+
+
+def ensure_snapshot(path=DATA_PATH):
+    """Refaz o snapshot a partir do csv quando ele não está atualizado e retorna o seu caminho.
+
+        Refazer o snapshot descarta o watermark: os lotes já incorporados voltam a
+        ser avaliados na próxima ingestão e os pedidos que já estão no csv são
+        descartados pela deduplicação de ID.
+    """
+    with _lock:
+        _rebuild_snapshot(path)
+    return snapshot_path(path)
+
+
+def _remove_parts(path, parts):
+    pasta = os.path.dirname(os.path.abspath(path))
+    for parte in parts:
+        if os.path.exists(os.path.join(pasta, parte)):
+            os.remove(os.path.join(pasta, parte))
+
+
+def _write_new_snapshot(path):
+    """Grava o snapshot refeito a partir do csv num arquivo à parte e retorna o seu caminho.
+
+        O snapshot em uso, o watermark e as partes não são tocados: _install_snapshot
+        troca os arquivos depois.
+    """
+    novo = '{}.{}.novo'.format(snapshot_path(path), os.getpid())
+    write_snapshot(build_dataset(path), novo)
+    return novo
+
+
+def _install_snapshot(path, novo):
+    """Passa a usar o snapshot novo e descarta o watermark e as partes (chamada com _lock)."""
+    partes = (read_watermark(path) or {}).get('parts', [])
+    os.replace(novo, snapshot_path(path))
+    if os.path.exists(watermark_path(path)):
+        os.remove(watermark_path(path))
+    _remove_parts(path, partes)
+
+
+def _rebuild_snapshot(path):
+    """Refaz o snapshot (e descarta o watermark e as partes) se ele não está atualizado."""
+    if not snapshot_is_fresh(path):
+        _install_snapshot(path, _write_new_snapshot(path))
+
+
+def _read_dataset(path, columns):
+    """Carrega o dataset do snapshot (refazendo-o se necessário) ou, sem pyarrow, do csv."""
+    if pq is None:
+        df1 = build_dataset(path) if columns is None else load_dataset(path)
+        return df1 if columns is None else df1.loc[:, columns]
+
+    if os.path.abspath(path) in _published and os.path.exists(snapshot_path(path)):
+        # Versão publicada: o snapshot é refeito só por refresh_dataset, fora das requisições
+        return read_snapshot(snapshot_files(path), columns)
+    ensure_snapshot(path)
+    return read_snapshot(snapshot_files(path), columns)
+
+
+def concat_rows(frames):
+    """Concatena dataframes limpos preservando as colunas categóricas (união das categorias)."""
+    colunas = frames[0].columns
+    dados = {}
+    for col in colunas:
+        series = [frame[col] for frame in frames]
+        if all(isinstance(serie.dtype, pd.CategoricalDtype) for serie in series):
+            dados[col] = union_categoricals(series, sort_categories=True)
+        else:
+            dados[col] = pd.concat(series, ignore_index=True)
+    # O dicionário já está na ordem das colunas: passar columns= faria o pandas converter
+    # todas as colunas para object antes de montar o dataframe
+    return pd.DataFrame(dados)
+
+
+def source_version(path=DATA_PATH):
+    """Retorna o identificador da versão dos dados no disco.
+
+        A versão muda sempre que o csv muda ou que novos pedidos são incorporados
+        (data de modificação do watermark).
+    """
+    version = file_key(path)
+    try:
+        version += (os.stat(watermark_path(path)).st_mtime_ns,)
+    except FileNotFoundError:
+        pass
+    return version
+
+
+def dataset_version(path=DATA_PATH):
+    """Retorna o identificador da versão dos dados servida pelas páginas.
+
+        Com a atualização em segundo plano ativa é a última versão publicada; sem
+        ela, a versão no disco (source_version).
+    """
+    published = _published.get(os.path.abspath(path))
+    return published[0] if published is not None else source_version(path)
+
+
+def publish_version(path=DATA_PATH, version=None):
+    """Passa a servir a versão informada (None: a versão no disco) em vez de seguir o disco."""
+    version = source_version(path) if version is None else version
+    _published[os.path.abspath(path)] = (version, datetime.datetime.now())
+    return version
+
+
+def version_label(version):
+    """Rótulo curto (8 dígitos hexadecimais) de uma versão dos dados."""
+    return '%08x' % zlib.crc32(repr(version).encode())
+
+
+def dataset_info(path=DATA_PATH):
+    """Versão servida, data dos dados (csv ou último lote incorporado) e quando foi publicada.
+
+        Output: dicionário com 'version', 'updated_at' e 'published_at' (None sem atualização em segundo plano)
+    """
+    version = dataset_version(path)
+    published = _published.get(os.path.abspath(path))
+    return {'version': version_label(version),
+            'updated_at': datetime.datetime.fromtimestamp(max(version[1:2] + version[3:]) / 1e9),
+            'published_at': published[1] if published is not None else None}
+
+
+def load_dataset(path=DATA_PATH, columns=None):
+    """Esta função retorna o dataframe limpo, lendo e limpando o csv apenas quando o arquivo muda.
+
+        Input:
+            - path: caminho do csv de pedidos
+            - columns: lista de colunas usadas pela página (None carrega todas)
+
+        O dataframe retornado é compartilhado entre sessões e páginas e não deve
+        ser alterado: os filtros das páginas criam novos dataframes.
+    """
+    cache_key = (os.path.abspath(path), tuple(columns) if columns is not None else None)
+    with _lock:
+        cached = _cache.get(cache_key)
+        if cached is None or cached[0] != dataset_version(path):
+            df1 = _read_dataset(path, columns)
+            _cache[cache_key] = (dataset_version(path), df1)
+            cached = _cache[cache_key]
+        return cached[1]
+
+
+def load_derived(name, builder, path=DATA_PATH, columns=None, merge=None):
+    """Esta função retorna builder(df1) calculado uma única vez por versão do dataset.
+
+        O dataframe usado no cálculo é lido apenas com as colunas pedidas e descartado
+        em seguida: só o resultado (um agregado, um índice etc.) fica em cache.
+
+        merge(resultado, df_novos) é opcional: quando informado, os pedidos incorporados
+        por append_rows atualizam o resultado em vez de forçar um novo cálculo completo.
+    """
+    key = (name, os.path.abspath(path))
+    with _lock:
+        cached = _derived.get(key)
+        if cached is None or cached[0] != dataset_version(path):
+            result = builder(_read_dataset(path, columns))
+            _derived[key] = (dataset_version(path), result, merge, columns, builder)
+            cached = _derived[key]
+        return cached[1]
+
+
+def _order_ids(df1):
+    """Conjunto dos IDs de pedido do dataset (deduplicação da ingestão)."""
+    return set(df1['ID'])
+
+
+def _merge_order_ids(ids, df_new):
+    ids.update(df_new['ID'])
+    return ids
+
+
+def load_together(*loaders):
+    """Chama os carregadores (funções sem argumentos, ex.: load_dataset e load_derived) segurando
+        o lock dos caches e retorna os resultados.
+
+        A versão publicada só muda com o lock, então todos os resultados são da mesma versão
+        dos dados (ex.: um dataframe e um índice de posições das suas linhas).
+    """
+    with _lock:
+        return tuple(loader() for loader in loaders)
+
+
+def append_rows(df_new, path=DATA_PATH, batches=None):
+    """Esta função incorpora pedidos novos (já limpos e compactados) ao dataset persistido.
+
+        Input:
+            - df_new: pedidos novos, no formato de build_dataset (None: nenhum pedido novo)
+            - batches: estado dos lotes lidos, gravado no watermark
+        Output: (quantidade de pedidos incorporados, watermark gravado)
+
+        Pedidos com ID já existente (ou repetido no próprio lote) são descartados; os
+        IDs existentes ficam num conjunto em cache (load_derived), sem ler o snapshot.
+        Os pedidos novos são gravados numa parte nova do snapshot e o watermark é
+        atualizado; quando as partes passam de MAX_PARTES, o snapshot é regravado com
+        todas elas. Os dataframes em cache recebem as linhas novas e os resultados
+        derivados com merge são atualizados só com elas; os demais são recalculados
+        na próxima leitura.
+    """
+    if pq is None:
+        raise RuntimeError('A ingestão incremental requer o pyarrow (snapshot Parquet).')
+
+    with _lock:
+        snapshot = ensure_snapshot(path)
+        pasta = os.path.dirname(os.path.abspath(path))
+        previous = dataset_version(path)
+        colunas = pq.read_schema(snapshot).names
+        ids = load_derived('order_ids', _order_ids, path, columns=['ID'], merge=_merge_order_ids)
+
+        # Deduplicação pelo ID: mantém a primeira ocorrência de cada pedido
+        df_new = (pd.DataFrame(columns=colunas) if df_new is None
+                  else df_new.loc[:, colunas])
+        existentes = np.fromiter((pedido in ids for pedido in df_new['ID']), dtype=bool,
+                                 count=len(df_new))
+        linhas_selecionadas = ~existentes & ~df_new['ID'].duplicated().to_numpy()
+        df_new = df_new.loc[linhas_selecionadas, :].reset_index(drop=True)
+
+        watermark = read_watermark(path) or {'batches': {}}
+        if watermark.get('order_date') is None:
+            datas = read_snapshot(snapshot_files(path), ['Order_Date'])['Order_Date']
+            watermark['order_date'] = (datas.max().strftime('%Y-%m-%d')
+                                       if len(datas) > 0 else None)
+        partes = list(watermark.get('parts', []))
+        removidas = []
+        if len(df_new) > 0:
+            parte = '%s.part-%d.parquet' % (os.path.splitext(os.path.basename(path))[0],
+                                            time.time_ns())
+            write_snapshot(df_new, os.path.join(pasta, parte))
+            partes.append(parte)
+            if len(partes) > MAX_PARTES:
+                # Compactação: o custo de regravar o dataset fica diluído em MAX_PARTES lotes
+                arquivos = [snapshot] + [os.path.join(pasta, item) for item in partes]
+                write_snapshot(read_snapshot(arquivos), snapshot)
+                removidas, partes = partes, []
+            data_lote = df_new['Order_Date'].max().strftime('%Y-%m-%d')
+            watermark['order_date'] = max(filter(None, [watermark['order_date'], data_lote]))
+
+        watermark['batches'].update(batches or {})
+        watermark['parts'] = partes
+        watermark['rows'] = sum(pq.read_metadata(arquivo).num_rows for arquivo in
+                                [snapshot] + [os.path.join(pasta, item) for item in partes])
+        watermark['updated_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+        _write_watermark(watermark, path)
+        _remove_parts(path, removidas)
+        version = source_version(path)
+        if os.path.abspath(path) in _published:
+            publish_version(path, version)
+
+        # Atualiza os caches do processo que estavam na versão anterior
+        for key, (cached_version, cached_df) in list(_cache.items()):
+            if key[0] != previous[0]:
+                continue
+            if cached_version != previous:
+                del _cache[key]
+                continue
+            columns = list(key[1]) if key[1] is not None else colunas
+            if len(df_new) > 0:
+                cached_df = concat_rows([cached_df, df_new.loc[:, columns]])
+            _cache[key] = (version, cached_df)
+
+        for key, (cached_version, result, merge, columns, builder) in list(_derived.items()):
+            if key[1] != previous[0]:
+                continue
+            if cached_version != previous or merge is None:
+                del _derived[key]
+                continue
+            if len(df_new) > 0:
+                result = merge(result, df_new if columns is None else df_new.loc[:, columns])
+            _derived[key] = (version, result, merge, columns, builder)
+
+        return len(df_new), watermark
+
+
+def refresh_dataset(path=DATA_PATH, prepare=None):
+    """Esta função monta a versão nova dos dados fora das requisições e a publica de forma atômica.
+
+        O snapshot, os dataframes e os resultados derivados que estão em cache são refeitos
+        sem segurar o lock dos caches (as páginas continuam servindo a versão publicada).
+        O snapshot novo é gravado num arquivo à parte: o snapshot publicado, o watermark e
+        as partes só são trocados no fim, com o lock, junto com os caches e a versão
+        publicada, e uma atualização abortada apaga só o arquivo novo. As leituras do
+        snapshot nas requisições também seguram o lock, então nunca veem a troca pela metade.
+        Só uma atualização roda por vez: uma chamada concorrente retorna sem fazer nada.
+
+        Input: prepare - função opcional chamada antes da troca com a versão nova e os arquivos
+               do snapshot dessa versão (None sem pyarrow), ex.: o banco SQLite
+        Output: versão publicada, ou None se os dados não mudaram ou outra atualização está em andamento
+    """
+    if not _refresh_lock.acquire(blocking=False):
+        return None
+    try:
+        chave = os.path.abspath(path)
+        atualizado = pq is None or snapshot_is_fresh(path)
+        if chave in _published and source_version(path) == dataset_version(path) and atualizado:
+            return None
+
+        arquivo = file_key(path)
+        completo = novo = None
+        with span('refresh.snapshot'):
+            if pq is None:
+                completo = build_dataset(path)
+            elif not atualizado:
+                novo = _write_new_snapshot(path)
+        if file_key(path) != arquivo:
+            # O csv mudou durante a leitura (gravação em andamento): tenta no próximo ciclo,
+            # sem tocar no snapshot publicado
+            if novo is not None:
+                os.remove(novo)
+            return None
+        # Com o snapshot refeito o watermark é descartado na troca: a versão é a do csv
+        version = file_key(path) if novo is not None else source_version(path)
+        arquivos = None
+        if pq is not None:
+            arquivos = [novo] if novo is not None else snapshot_files(path)
+
+        def ler(columns):
+            columns = None if columns is None else list(columns)
+            if completo is not None:
+                return completo if columns is None else completo.loc[:, columns]
+            return read_snapshot(arquivos, columns)
+
+        with _lock:
+            em_cache = [key for key in _cache if key[0] == chave]
+            derivados = [(key, entrada[2:]) for key, entrada in _derived.items() if key[1] == chave]
+        with span('refresh.caches'):
+            novo_cache = {key: (version, ler(key[1])) for key in em_cache}
+            novo_derived = {key: (version, builder(ler(columns)), merge, columns, builder)
+                            for key, (merge, columns, builder) in derivados}
+        if prepare is not None:
+            prepare(version, arquivos)
+
+        with _lock:
+            if novo is not None:
+                _install_snapshot(path, novo)
+                novo = None
+            for key in [key for key in _cache if key[0] == chave]:
+                del _cache[key]
+            for key in [key for key in _derived if key[1] == chave]:
+                del _derived[key]
+            _cache.update(novo_cache)
+            _derived.update(novo_derived)
+            publish_version(path, version)
+        return version
+    finally:
+        if novo is not None and os.path.exists(novo):
+            # Falha antes da troca: o snapshot publicado continua em uso
+            os.remove(novo)
+        _refresh_lock.release()
+
+
+def profile_clean(path=DATA_PATH):
+    """Esta função mede a limpeza do csv: linhas por segundo e pico de memória.
+
+        Output: dicionário com linhas lidas, linhas limpas, segundos, linhas/s e pico em MB
+    """
+    df = pd.read_csv(path)
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    df1 = clean_code(df)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'rows_in': len(df),
+            'rows_out': len(df1),
+            'seconds': round(segundos, 4),
+            'rows_per_sec': round(len(df) / segundos, 1),
+            'peak_mb': round(pico / 2 ** 20, 2)}
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(profile_clean(sys.argv[1] if len(sys.argv) > 1 else DATA_PATH))
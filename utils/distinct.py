@@ -0,0 +1,224 @@
+"""Contagem de entregadores distintos por meio de sketches HyperLogLog combináveis.
+
+Os pedidos são agrupados em células (dia x densidade de tráfego x clima, por padrão)
+e cada célula guarda um sketch HyperLogLog dos IDs dos entregadores: 2^p registradores
+de 1 byte com o maior posto do primeiro bit 1 dos hashes que caíram neles. Sketches
+de células diferentes são combinados pelo máximo registrador a registrador, então a
+contagem de qualquer intervalo de datas e combinação de filtros usa apenas as células
+selecionadas, sem voltar às linhas.
+
+O erro padrão relativo da estimativa é 1.04 / sqrt(2^p); a precisão p é escolhida
+a partir do erro pedido. O modo exato guarda os pares (célula, hash de 64 bits do ID)
+e serve para validar as estimativas.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.cube import filter_cube
+from utils.dataset import DATA_PATH, concat_rows, load_derived
+
+# Erro padrão relativo das contagens estimadas
+ERRO_PADRAO = 0.02
+
+# Dimensões das células (os filtros das páginas)
+DIMENSOES_DISTINCT = ['Order_Date', 'Road_traffic_density', 'Weatherconditions']
+
+# Bits do hash usados no posto; os p bits mais altos escolhem o registrador
+BITS_POSTO = 32
+
+
+def precision_for(error):
+    """Retorna a precisão p (registradores = 2^p) necessária para o erro padrão relativo pedido."""
+    p = int(np.ceil(np.log2((1.04 / error) ** 2)))
+    return min(max(p, 4), 18)
+
+
+def hash_ids(ids):
+    """Hash de 64 bits de cada ID, estável entre blocos, processos e versões do dataset.
+
+        IDs categóricos são hasheados uma única vez por categoria. Os IDs não podem estar
+        ausentes (o código -1 de uma categórica seria lido como a última categoria).
+    """
+    ids = pd.Series(ids)
+    if isinstance(ids.dtype, pd.CategoricalDtype):
+        hashes = pd.util.hash_array(np.asarray(ids.cat.categories, dtype=object))
+        return hashes[ids.cat.codes.to_numpy()]
+    return pd.util.hash_array(np.asarray(ids, dtype=object))
+
+
+def cell_ids(df_dims):
+    """Numera as combinações de dimensões (valores ausentes formam células próprias).
+
+        Output: (célula de cada linha, dataframe com as dimensões de cada célula)
+    """
+    chave = np.zeros(len(df_dims), dtype=np.int64)
+    for col in df_dims.columns:
+        codes, uniques = pd.factorize(df_dims[col])
+        chave = chave * (len(uniques) + 1) + (codes + 1)
+    _, primeiras, celulas = np.unique(chave, return_index=True, return_inverse=True)
+    return celulas, df_dims.iloc[primeiras].reset_index(drop=True)
+
+
+def estimate(registers):
+    """Estimativa HyperLogLog para cada linha da matriz de registradores (com a correção de linear counting)."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    bruta = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((bruta <= 2.5 * m) & (zeros > 0), linear, bruta)
+
+
+class DistinctSketch:
+    """Sketches de entregadores distintos por célula, combináveis para qualquer seleção de células.
+
+        Input:
+            - df1: pedidos com as dimensões e 'Delivery_person_ID'
+            - dimensions: dimensões das células
+            - error: erro padrão relativo das estimativas
+            - exact: guarda os hashes dos IDs para contagens exatas (validação)
+    """
+
+    def __init__(self, df1, dimensions=DIMENSOES_DISTINCT, error=ERRO_PADRAO, exact=False):
+        self.dimensions = list(dimensions)
+        self.error = error
+        self.exact = exact
+        self.precision = precision_for(error)
+
+        celulas, self.cells = cell_ids(df1.loc[:, self.dimensions])
+        # Pedidos sem entregador mantêm a célula, mas não contam (como o nunique do pandas)
+        validos = df1['Delivery_person_ID'].notna().to_numpy()
+        celulas = celulas[validos]
+        hashes = hash_ids(df1['Delivery_person_ID'][validos])
+        if exact:
+            pares = pd.DataFrame({'cell': celulas, 'hash': hashes}).drop_duplicates()
+            self.pair_cells = pares['cell'].to_numpy()
+            self.pair_hashes = pares['hash'].to_numpy()
+        else:
+            self.registers = self._registers(celulas, hashes, len(self.cells))
+
+    def _registers(self, celulas, hashes, n_cells):
+        """Matriz (células x 2^p) com o maior posto de cada registrador."""
+        m = 1 << self.precision
+        indice = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        # Posto = zeros à esquerda nos BITS_POSTO bits mais baixos + 1
+        palavra = (hashes & np.uint64((1 << BITS_POSTO) - 1)).astype(np.float64)
+        posto = np.full(len(hashes), BITS_POSTO + 1, dtype=np.uint8)
+        positivos = palavra > 0
+        posto[positivos] = BITS_POSTO - np.floor(np.log2(palavra[positivos])).astype(np.uint8)
+
+        registers = np.zeros((n_cells, m), dtype=np.uint8)
+        maximos = pd.Series(posto).groupby(celulas.astype(np.int64) * m + indice).max()
+        registers.ravel()[maximos.index.to_numpy()] = maximos.to_numpy()
+        return registers
+
+    def _like(self, cells):
+        """Novo sketch vazio com os mesmos parâmetros e as células informadas."""
+        novo = object.__new__(DistinctSketch)
+        novo.dimensions, novo.error = self.dimensions, self.error
+        novo.exact, novo.precision = self.exact, self.precision
+        novo.cells = cells.reset_index(drop=True)
+        return novo
+
+    def _subset(self, cells, celulas_antigas):
+        """Novo sketch com as células informadas (celulas_antigas: posição de cada uma neste sketch)."""
+        novo = self._like(cells)
+        if self.exact:
+            mapa = np.full(len(self.cells), -1, dtype=np.int64)
+            mapa[celulas_antigas] = np.arange(len(celulas_antigas))
+            manter = mapa[self.pair_cells] >= 0
+            novo.pair_cells = mapa[self.pair_cells[manter]]
+            novo.pair_hashes = self.pair_hashes[manter]
+        else:
+            novo.registers = self.registers[celulas_antigas]
+        return novo
+
+    def filter(self, date_slider=None, traffic_options=None, weather_condition=None):
+        """Esta função aplica os filtros da barra lateral sobre as células (como filter_cube)."""
+        cells = filter_cube(self.cells, date_slider, traffic_options, weather_condition)
+        return self._subset(cells, cells.index.to_numpy())
+
+    def merge(self, other):
+        """Combina dois sketches com as mesmas dimensões e precisão (união dos pedidos)."""
+        if (other.dimensions, other.precision, other.exact) != (self.dimensions, self.precision, self.exact):
+            raise ValueError('Sketches com dimensões, precisão ou modo diferentes não podem ser combinados.')
+        celulas, cells = cell_ids(concat_rows([self.cells, other.cells]))
+        novo = self._like(cells)
+        proprias, outras = celulas[:len(self.cells)], celulas[len(self.cells):]
+        if self.exact:
+            pares = pd.DataFrame({'cell': np.concatenate([proprias[self.pair_cells],
+                                                          outras[other.pair_cells]]),
+                                  'hash': np.concatenate([self.pair_hashes, other.pair_hashes])})
+            pares = pares.drop_duplicates()
+            novo.pair_cells = pares['cell'].to_numpy()
+            novo.pair_hashes = pares['hash'].to_numpy()
+        else:
+            novo.registers = np.zeros((len(cells), self.registers.shape[1]), dtype=np.uint8)
+            novo.registers[proprias] = self.registers
+            novo.registers[outras] = np.maximum(novo.registers[outras], other.registers)
+        return novo
+
+    def count(self):
+        """Quantidade (estimada, ou exata no modo exato) de entregadores distintos em todas as células."""
+        if self.exact:
+            return int(np.unique(self.pair_hashes).size)
+        return int(np.round(estimate(self.registers.max(axis=0, initial=0))[0]))
+
+    def count_by(self, by):
+        """Quantidade de entregadores distintos por grupo de células.
+
+            Input: by - nome de uma dimensão ou valores do grupo de cada célula (alinhados com cells)
+            Output: Series com a quantidade por grupo, ordenada pelo grupo
+        """
+        grupos = self.cells[by] if isinstance(by, str) else pd.Series(np.asarray(by))
+        codes, uniques = pd.factorize(grupos, sort=True)
+        if self.exact:
+            contagem = (pd.DataFrame({'grupo': codes[self.pair_cells], 'hash': self.pair_hashes})
+                        .groupby('grupo')['hash'].nunique()
+                        .reindex(range(len(uniques)), fill_value=0).to_numpy())
+        else:
+            # Células ordenadas pelo grupo: o máximo de cada grupo é um reduceat sobre blocos contínuos
+            ordem = np.argsort(codes, kind='stable')
+            inicios = np.searchsorted(codes[ordem], np.arange(len(uniques)))
+            registers = np.zeros((len(uniques), self.registers.shape[1]), dtype=np.uint8)
+            ocupados = inicios < len(ordem)
+            if len(ordem):
+                registers[ocupados] = np.maximum.reduceat(self.registers[ordem], inicios[ocupados], axis=0)
+            contagem = np.round(estimate(registers)).astype(np.int64)
+        return pd.Series(contagem, index=pd.Index(uniques, name=getattr(grupos, 'name', None)),
+                         name='Delivery_person_ID')
+
+
+def merge_sketch(sketch, df_new):
+    """Atualiza o sketch com pedidos novos."""
+    return sketch.merge(DistinctSketch(df_new, sketch.dimensions, sketch.error, sketch.exact))
+
+
+def load_distinct(path=DATA_PATH, error=ERRO_PADRAO, exact=False):
+    """Esta função retorna o sketch de entregadores distintos do dataset, calculado uma vez por versão."""
+    nome = 'distinct_exact' if exact else 'distinct_%g' % error
+    return load_derived(nome, lambda df1: DistinctSketch(df1, error=error, exact=exact), path,
+                        columns=DIMENSOES_DISTINCT + ['Delivery_person_ID'], merge=merge_sketch)
+
+
+def validate_distinct(path=DATA_PATH, error=ERRO_PADRAO):
+    """Compara as contagens estimadas com o modo exato (total e por semana).
+
+        Output: dicionário com o erro relativo máximo observado e o erro padrão esperado
+    """
+    estimado = load_distinct(path, error)
+    exato = load_distinct(path, exact=True)
+    semanas = estimado.cells['Order_Date'].dt.strftime('%U')
+    por_semana = estimado.count_by(semanas)
+    por_semana_exato = exato.count_by(exato.cells['Order_Date'].dt.strftime('%U'))
+    erros = (por_semana - por_semana_exato).abs() / por_semana_exato
+    return {'expected_error': round(1.04 / np.sqrt(1 << estimado.precision), 4),
+            'total_estimate': estimado.count(), 'total_exact': exato.count(),
+            'max_weekly_error': round(float(erros.max()), 4)}
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(validate_distinct(sys.argv[1] if len(sys.argv) > 1 else DATA_PATH))
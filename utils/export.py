@@ -0,0 +1,337 @@
+"""Exportação em lote das métricas do dashboard, sem o Streamlit.
+
+Os relatórios noturnos precisam dos mesmos números das três páginas para várias
+datas de corte. run_export monta um job para cada combinação de data de corte e
+conjunto de filtros. Cada job calcula as métricas das páginas com as funções das
+próprias páginas (utils.pages.load_page_functions), sobre os mesmos agregados e o
+mesmo backend (utils.sqlstore) que elas usam. Os números saem iguais aos da tela.
+
+Os jobs rodam num pool de processos. O processo principal lê o dataset e monta os
+agregados uma única vez (load_all) antes de iniciar o pool:
+    - com o método 'fork' (Linux), os processos herdam esses caches já prontos e
+      compartilham as páginas de memória do dataset (cópia na escrita);
+    - onde só há 'spawn', cada processo carrega os agregados do snapshot Parquet já
+      gravado, sem refazer a limpeza do csv.
+
+Saída (no diretório de --output):
+    - <página>.<métrica>.parquet (ou .json): uma tabela por métrica com as linhas de
+      todos os jobs, identificadas pelas colunas job, cutoff, traffic_options e
+      weather_condition. As figuras viram tabelas com os dados dos traces
+      (figure_table) e os cards viram uma linha por job;
+    - manifest.json: jobs, versão dos dados, arquivos gerados e tempos;
+    - com --html: html/<job>/<página>.<métrica>.html, com as figuras Plotly e o mapa da
+      visão empresa em páginas estáticas.
+
+Uso: python -m utils.export [--data train.csv] [--cutoffs 2022-03-01 2022-04-06 ...]
+                            [--range 2022-03-01 2022-04-06] [--filters filtros.json]
+                            [--format parquet|json] [--html] [--workers 4] [--output export]
+
+O arquivo de --filters é uma lista json de conjuntos de filtros, por exemplo
+[{"traffic_options": ["Low", "Jam"], "weather_condition": null}] (null não filtra).
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils.cube import load_cube, mean_std
+from utils.dataset import DATA_PATH, concat_rows, dataset_info, ensure_snapshot, load_dataset, pq
+from utils.distinct import load_distinct
+from utils.filters import CLIMA_PADRAO, DATA_PADRAO, TRAFEGO_PADRAO, load_filter_engine
+from utils.kpi import compute_kpis
+from utils.maps import build_map, render_map
+from utils.pages import load_page_functions
+from utils.parallel import WORKERS, workers_from
+from utils.quantiles import load_quantiles
+from utils.shared import load_view
+from utils.sqlstore import (ensure_database, filtered_cube, filtered_distinct, filtered_quantiles,
+                            query_deliverer_means, query_top_k, use_sql)
+
+FORMATOS = ('parquet', 'json')
+
+# Propriedades por ponto dos traces copiadas para as tabelas das figuras:
+# nome da coluna -> caminho da propriedade no json do trace
+PROPRIEDADES_TRACE = {'x': ('x',), 'y': ('y',), 'labels': ('labels',), 'values': ('values',),
+                      'ids': ('ids',), 'parents': ('parents',), 'size': ('marker', 'size'),
+                      'color': ('marker', 'colors'), 'error_y': ('error_y', 'array')}
+
+
+def load_all(path=DATA_PATH):
+    """Carrega o dataset e os agregados usados pelas métricas (uma vez por processo)."""
+    ensure_snapshot(path)
+    if use_sql():
+        ensure_database(path)
+        # O mapa da visão empresa continua no caminho em pandas
+        colunas = load_page_functions('empresa').COLUNAS
+    else:
+        load_cube(path)
+        load_distinct(path)
+        load_quantiles(path)
+        # Uma única leitura com as colunas de linha das duas páginas
+        colunas = list(dict.fromkeys(load_page_functions('empresa').COLUNAS
+                                     + load_page_functions('entregadores').COLUNAS))
+    load_dataset(path, columns=colunas)
+    load_filter_engine(path)
+
+
+def make_jobs(cutoffs, filter_sets):
+    """Esta função combina as datas de corte com os conjuntos de filtros.
+
+        Output: lista de jobs (dicionários com 'id', 'cutoff', 'traffic_options' e 'weather_condition')
+    """
+    jobs = []
+    for cutoff in cutoffs:
+        for i, filtros in enumerate(filter_sets):
+            jobs.append({'id': '%s_f%d' % (pd.Timestamp(cutoff).strftime('%Y%m%d'), i),
+                         'cutoff': pd.Timestamp(cutoff).to_pydatetime(),
+                         'traffic_options': filtros.get('traffic_options'),
+                         'weather_condition': filtros.get('weather_condition')})
+    return jobs
+
+
+def figure_table(fig):
+    """Esta função converte os traces da figura numa tabela com uma linha por ponto.
+
+        Output: Dataframe com a coluna 'trace' (nome ou posição do trace) e as
+                propriedades por ponto presentes (PROPRIEDADES_TRACE)
+    """
+    tabelas = []
+    for i, trace in enumerate(fig.data):
+        props = trace.to_plotly_json()
+        colunas = {}
+        for nome, caminho in PROPRIEDADES_TRACE.items():
+            valor = props
+            for chave in caminho:
+                valor = valor.get(chave) if isinstance(valor, dict) else None
+            if valor is not None and not isinstance(valor, (str, int, float)):
+                colunas[nome] = np.asarray(valor)
+        n = max((len(valor) for valor in colunas.values()), default=0)
+        df_aux = pd.DataFrame({nome: valor for nome, valor in colunas.items() if len(valor) == n})
+        df_aux.insert(0, 'trace', trace.name if trace.name is not None else str(i))
+        tabelas.append(df_aux)
+    return pd.concat(tabelas, ignore_index=True) if tabelas else pd.DataFrame({'trace': []})
+
+
+def _empresa(job, path):
+    """Métricas da visão empresa (filtros de data e tráfego, como na página)."""
+    empresa = load_page_functions('empresa')
+    filtros = (job['cutoff'], job['traffic_options'])
+    cube = filtered_cube(*filtros, path=path)
+    return {'order_metric': empresa.order_metric(cube),
+            'traffic_order_share': empresa.traffic_order_share(cube),
+            'traffic_order_city': empresa.traffic_order_city(cube),
+            'order_by_week': empresa.order_by_week(cube),
+            'order_share_by_week': empresa.order_share_by_week(
+                cube, filtered_distinct(*filtros, path=path))}
+
+
+def _entregadores(job, path):
+    """Métricas da visão entregadores."""
+    entregadores = load_page_functions('entregadores')
+    filtros = (job['cutoff'], job['traffic_options'], job['weather_condition'])
+    cube = filtered_cube(*filtros, path=path)
+    resultados = {'cards': compute_kpis(cube, entregadores.CARDS)._asdict()}
+    if use_sql():
+        resultados['avg_ratings_per_deliver'] = query_deliverer_means(
+            'Delivery_person_Ratings', (), *filtros, path=path)
+        mais_rapidos, mais_lentos = query_top_k('Time_taken(min)', 'City', 10, *filtros, path=path)
+    else:
+        linhas = load_view(*filtros, columns=entregadores.COLUNAS, path=path)
+        resultados['avg_ratings_per_deliver'] = entregadores.avg_ratings_per_deliver(linhas)
+        mais_rapidos, mais_lentos = entregadores.top_delivers(linhas)
+    resultados['top_fastest'] = mais_rapidos
+    resultados['top_slowest'] = mais_lentos
+    resultados['avg_std_rating_by_traffic'] = mean_std(cube, 'Road_traffic_density', 'Delivery_person_Ratings',
+                                                       columns=['devlivery_mean', 'delivery_std'])
+    resultados['avg_std_rating_by_weather'] = mean_std(cube, 'Weatherconditions', 'Delivery_person_Ratings',
+                                                       columns=['weather_mean', 'weather_std'])
+    return resultados
+
+
+def _restaurantes(job, path):
+    """Métricas da visão restaurantes."""
+    restaurantes = load_page_functions('restaurantes')
+    filtros = (job['cutoff'], job['traffic_options'], job['weather_condition'])
+    cube = filtered_cube(*filtros, path=path)
+    quantis = filtered_quantiles(*filtros, path=path)
+    return {'cards': compute_kpis(cube, restaurantes.CARDS, filtered_distinct(*filtros, path=path),
+                                  quantis)._asdict(),
+            'distance': restaurantes.distance(cube, fig=True),
+            'avg_std_time_graph': restaurantes.avg_std_time_graph(cube),
+            'avg_std_time_on_traffic': restaurantes.avg_std_time_on_traffic(cube),
+            'time_percentiles': restaurantes.time_percentiles(quantis),
+            'time_by_city_order': mean_std(cube, ['City', 'Type_of_order'], 'Time_taken(min)')}
+
+
+PAGINAS_EXPORTADAS = {'empresa': _empresa, 'entregadores': _entregadores, 'restaurantes': _restaurantes}
+
+
+def _write_html(html_dir, job, nome, html):
+    destino = os.path.join(html_dir, job['id'])
+    os.makedirs(destino, exist_ok=True)
+    with open(os.path.join(destino, nome + '.html'), 'w', encoding='utf-8') as arquivo:
+        arquivo.write(html)
+
+
+def compute_job(job, path=DATA_PATH, html_dir=None):
+    """Esta função calcula todas as métricas exportadas de um job.
+
+        Input:
+            - job: dicionário de make_jobs
+            - html_dir: diretório das figuras em html estático (None: não grava)
+        Output: (id do job, dicionário '<página>.<métrica>' -> Dataframe, segundos)
+    """
+    inicio = time.perf_counter()
+    tabelas = {}
+    for pagina, calcular in PAGINAS_EXPORTADAS.items():
+        for nome, valor in calcular(job, path).items():
+            nome = pagina + '.' + nome
+            if isinstance(valor, go.Figure):
+                if html_dir is not None:
+                    _write_html(html_dir, job, nome, valor.to_html(include_plotlyjs='cdn'))
+                valor = figure_table(valor)
+            elif isinstance(valor, dict):
+                valor = pd.DataFrame([valor])
+            tabelas[nome] = valor.reset_index(drop=True)
+    if html_dir is not None:
+        linhas = load_view(job['cutoff'], job['traffic_options'],
+                           columns=load_page_functions('empresa').COLUNAS, path=path)
+        _write_html(html_dir, job, 'empresa.country_maps', render_map(build_map(linhas.frame(), 'median')))
+    return job['id'], tabelas, time.perf_counter() - inicio
+
+
+def _job_columns(job):
+    """Colunas que identificam o job nas tabelas exportadas."""
+    def texto(valores):
+        return None if valores is None else ','.join(valores)
+
+    return {'job': job['id'], 'cutoff': pd.Timestamp(job['cutoff']),
+            'traffic_options': texto(job['traffic_options']),
+            'weather_condition': texto(job['weather_condition'])}
+
+
+def _write_table(df_aux, destino, formato):
+    if formato == 'parquet':
+        df_aux.to_parquet(destino, index=False)
+    else:
+        df_aux.to_json(destino, orient='records', date_format='iso', force_ascii=False, indent=1)
+
+
+def run_export(cutoffs, filter_sets, output, path=DATA_PATH, formato='parquet', html=False, workers=None):
+    """Esta função calcula as métricas de todos os jobs e grava uma tabela por métrica.
+
+        Input:
+            - cutoffs: datas de corte (filtro 'Selecione até qual data')
+            - filter_sets: lista de conjuntos de filtros (dicionários com 'traffic_options'
+                           e 'weather_condition'; chaves ausentes ou None não filtram)
+            - output: diretório de saída
+            - formato: 'parquet' ou 'json'
+            - html: grava também as figuras em html estático
+            - workers: quantidade de processos (None: CURRY_WORKERS)
+        Output: manifesto gravado em manifest.json
+    """
+    if formato not in FORMATOS:
+        raise ValueError('Formato desconhecido: %r (use um de %s)' % (formato, FORMATOS))
+    if formato == 'parquet' and pq is None:
+        raise RuntimeError('A exportação em Parquet requer o pyarrow (use --format json).')
+    workers = WORKERS if workers is None else workers_from(workers)
+    jobs = make_jobs(cutoffs, filter_sets)
+    html_dir = os.path.join(output, 'html') if html else None
+    os.makedirs(output, exist_ok=True)
+
+    inicio = time.perf_counter()
+    load_all(path)
+    tempos = {'load': round(time.perf_counter() - inicio, 3)}
+
+    inicio = time.perf_counter()
+    if workers <= 1 or len(jobs) <= 1:
+        resultados = [compute_job(job, path, html_dir) for job in jobs]
+    else:
+        # Com 'fork' os processos herdam os caches montados por load_all acima
+        metodo = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        with ProcessPoolExecutor(min(workers, len(jobs)), mp_context=multiprocessing.get_context(metodo),
+                                 initializer=load_all, initargs=(path,)) as pool:
+            resultados = list(pool.map(compute_job, jobs, [path] * len(jobs), [html_dir] * len(jobs)))
+    tempos['jobs'] = round(time.perf_counter() - inicio, 3)
+
+    inicio = time.perf_counter()
+    por_job = {job['id']: job for job in jobs}
+    por_metrica = {}
+    for job_id, tabelas, _ in resultados:
+        for nome, df_aux in tabelas.items():
+            colunas = _job_columns(por_job[job_id])
+            por_metrica.setdefault(nome, []).append(df_aux.assign(
+                **{col: [valor] * len(df_aux) for col, valor in colunas.items()}))
+    arquivos = []
+    for nome, tabelas in por_metrica.items():
+        df_aux = concat_rows(tabelas)
+        # Colunas do job primeiro
+        df_aux = df_aux.loc[:, list(_job_columns(jobs[0])) + [col for col in df_aux.columns
+                                                              if col not in _job_columns(jobs[0])]]
+        arquivo = '%s.%s' % (nome, formato)
+        _write_table(df_aux, os.path.join(output, arquivo), formato)
+        arquivos.append(arquivo)
+    tempos['write'] = round(time.perf_counter() - inicio, 3)
+
+    info = dataset_info(path)
+    manifesto = {'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                 'data': os.path.abspath(path),
+                 'data_version': info['version'],
+                 'backend': 'sqlite' if use_sql() else 'pandas',
+                 'workers': workers,
+                 'format': formato,
+                 'jobs': [dict(job, cutoff=job['cutoff'].isoformat()) for job in jobs],
+                 'job_seconds': {job_id: round(segundos, 3) for job_id, _, segundos in resultados},
+                 'files': sorted(arquivos),
+                 'html': html_dir,
+                 'seconds': tempos}
+    with open(os.path.join(output, 'manifest.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, indent=1, ensure_ascii=False)
+    return manifesto
+
+
+def _date(texto):
+    return datetime.datetime.strptime(texto, '%Y-%m-%d')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exportação em lote das métricas do Growth Dashboard')
+    parser.add_argument('--data', default=DATA_PATH, help='csv do dataset')
+    parser.add_argument('--cutoffs', type=_date, nargs='+', default=None,
+                        help='datas de corte (AAAA-MM-DD)')
+    parser.add_argument('--range', type=_date, nargs=2, default=None, metavar=('INICIO', 'FIM'),
+                        help='uma data de corte por dia, de INICIO a FIM')
+    parser.add_argument('--filters', default=None,
+                        help='json com a lista de conjuntos de filtros (padrão: filtros padrão das páginas)')
+    parser.add_argument('--format', choices=FORMATOS, default='parquet')
+    parser.add_argument('--html', action='store_true', help='grava as figuras em html estático')
+    parser.add_argument('--workers', default=None,
+                        help="processos ('auto': um por núcleo; padrão: CURRY_WORKERS)")
+    parser.add_argument('--output', default='export')
+    args = parser.parse_args(argv)
+
+    cutoffs = list(args.cutoffs or [])
+    if args.range is not None:
+        cutoffs += list(pd.date_range(*args.range, freq='D').to_pydatetime())
+    cutoffs = cutoffs or [DATA_PADRAO]
+    if args.filters is None:
+        filter_sets = [{'traffic_options': TRAFEGO_PADRAO, 'weather_condition': CLIMA_PADRAO}]
+    else:
+        with open(args.filters, encoding='utf-8') as arquivo:
+            filter_sets = json.load(arquivo)
+
+    manifesto = run_export(cutoffs, filter_sets, args.output, args.data, args.format, args.html,
+                           args.workers)
+    print('%d jobs, %d arquivos em %s: %s' % (len(manifesto['jobs']), len(manifesto['files']),
+                                             args.output, manifesto['seconds']))
+
+
+if __name__ == '__main__':
+    main()
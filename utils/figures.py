@@ -0,0 +1,124 @@
+"""Cache de figuras Plotly e redução do tamanho das séries enviadas ao navegador.
+
+As figuras ficam num cache LRU limitado em memória, com chave (gráfico, estado dos
+filtros, versão do dataset): um rerun com os mesmos filtros reaproveita a figura
+pronta, sem recalcular os dados nem montar os traces de novo.
+
+Antes de entrar no cache, cada figura passa por reduce_payload:
+    - séries de linha com mais de MAX_PONTOS_SERIE pontos são reduzidas por
+      mínimo/máximo em blocos (os picos e vales continuam visíveis);
+    - traces scatter com mais de LIMIAR_WEBGL pontos passam a ser scattergl (WebGL).
+"""
+import numpy as np
+import pandas as pd
+
+from utils.dataset import dataset_version
+from utils.lazy import lazy_import
+from utils.lru import LRUCache
+from utils.timing import span
+
+# Só as figuras com séries grandes são remontadas: o import fica para a primeira delas
+go = lazy_import('plotly.graph_objects')
+
+# Memória máxima (MB) ocupada pelas figuras em cache
+MEMORIA_FIGURAS_MB = 64
+
+# Pontos por série de linha a partir dos quais a série é reduzida
+MAX_PONTOS_SERIE = 5000
+
+# Pontos por trace scatter a partir dos quais o trace passa a ser desenhado em WebGL
+LIMIAR_WEBGL = 2000
+
+TRACES_SCATTER = ('scatter', 'scattergl')
+
+# Propriedades por ponto que acompanham x e y na redução
+PROPRIEDADES_POR_PONTO = ('customdata', 'text', 'hovertext', 'ids')
+
+
+# Propriedades com um valor por ponto, contadas no tamanho da figura em cache
+PROPRIEDADES_TAMANHO = ('x', 'y', 'z', 'lat', 'lon', 'labels', 'values', 'parents',
+                        'marker.size', 'marker.color', 'marker.colors', 'error_y.array',
+                        'error_x.array') + PROPRIEDADES_POR_PONTO
+
+# Bytes estimados de um valor texto ou data (arrays de objetos guardam só o ponteiro)
+BYTES_POR_OBJETO = 32
+
+# Bytes estimados do layout e das propriedades escalares de cada figura
+BYTES_FIXOS_FIGURA = 8192
+
+
+def _array_nbytes(valores):
+    if valores is None or isinstance(valores, (str, int, float)):
+        return 0
+    valores = np.asarray(valores)
+    if valores.dtype == object:
+        return valores.size * BYTES_POR_OBJETO
+    return valores.nbytes
+
+
+def figure_nbytes(fig):
+    """Tamanho aproximado da figura: bytes dos arrays por ponto dos traces, sem serializar a figura."""
+    total = BYTES_FIXOS_FIGURA
+    for trace in fig.data:
+        for nome in PROPRIEDADES_TAMANHO:
+            valor = trace
+            for chave in nome.split('.'):
+                # Propriedades que não existem neste tipo de trace são ignoradas
+                valor = valor[chave] if valor is not None and chave in valor else None
+            total += _array_nbytes(valor)
+    return total
+
+
+_figure_cache = LRUCache(MEMORIA_FIGURAS_MB * 2 ** 20, sizeof=figure_nbytes)
+
+
+def minmax_indices(y, max_pontos=MAX_PONTOS_SERIE):
+    """Posições mantidas na redução: primeiro, último, mínimo e máximo de cada bloco, em ordem."""
+    n = len(y)
+    if n <= max_pontos:
+        return np.arange(n)
+    blocos = max(max_pontos // 2 - 1, 1)
+    bloco = np.repeat(np.arange(blocos), np.diff(np.linspace(0, n, blocos + 1).astype(np.int64)))
+    grupos = pd.Series(np.asarray(y, dtype=np.float64)).groupby(bloco)
+    extremos = pd.concat([grupos.idxmin(), grupos.idxmax()]).dropna().to_numpy(dtype=np.int64)
+    return np.unique(np.concatenate([[0, n - 1], extremos]))
+
+
+def _reduce_trace(trace):
+    """Retorna o trace com menos pontos e/ou em WebGL (ou o próprio trace, se não precisar)."""
+    if trace.type not in TRACES_SCATTER or trace.y is None:
+        return trace
+    n = len(trace.y)
+    props = trace.to_plotly_json()
+    if n > MAX_PONTOS_SERIE and 'lines' in (trace.mode or 'lines'):
+        manter = minmax_indices(trace.y)
+        for nome in ('x', 'y') + PROPRIEDADES_POR_PONTO:
+            valores = props.get(nome)
+            if valores is not None and not isinstance(valores, str) and len(valores) == n:
+                props[nome] = np.asarray(valores)[manter]
+        n = len(manter)
+    props.pop('type')
+    if n > LIMIAR_WEBGL or trace.type == 'scattergl':
+        return go.Scattergl(props, skip_invalid=True)
+    return go.Scatter(props)
+
+
+def reduce_payload(fig):
+    """Esta função reduz as séries grandes da figura (redução por mínimo/máximo e WebGL)."""
+    if not any(trace.type in TRACES_SCATTER and trace.y is not None
+               and len(trace.y) > min(MAX_PONTOS_SERIE, LIMIAR_WEBGL) for trace in fig.data):
+        return fig
+    return go.Figure(data=[_reduce_trace(trace) for trace in fig.data], layout=fig.layout)
+
+
+def cached_figure(chart_id, filtros, build):
+    """Retorna a figura do gráfico para o estado dos filtros, calculando build() só na primeira vez.
+
+        Input:
+            - chart_id: identificador do gráfico (ex.: 'order_metric')
+            - filtros: estado dos filtros (utils.filters.filter_state)
+            - build: função sem argumentos que monta a figura
+    """
+    chave = (chart_id, filtros, dataset_version())
+    with span('figure.' + chart_id):
+        return _figure_cache.get_or_build(chave, lambda: reduce_payload(build()))
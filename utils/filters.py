@@ -0,0 +1,187 @@
+"""Motor de filtros da barra lateral.
+
+O motor é montado uma vez por versão do dataset. Cada pedido recebe uma chave que
+combina os códigos das colunas categóricas dos filtros (tráfego, clima, cidade e
+festival) e as linhas são indexadas por (chave, Order_Date): cada célula de
+categorias é um bloco contínuo ordenado por data. O snapshot já é gravado nessa
+ordem (ORDEM_SNAPSHOT), então o índice coincide com a ordem física das linhas.
+
+Numa seleção, os bitmaps das categorias escolhidas em cada filtro são combinados
+numa tabela chave -> selecionado e o corte de data vira uma busca binária dentro
+de cada célula selecionada. O custo depende do número de células (poucas
+centenas) e não do número de pedidos; o resultado é uma seleção de linhas (slice
+ou array de posições) e não uma cópia do dataframe.
+
+Uso (micro-benchmark contra as máscaras encadeadas): python -m utils.filters [csv]
+"""
+import datetime
+import time
+
+import numpy as np
+
+from utils.dataset import DATA_PATH, ORDEM_SNAPSHOT, load_derived
+
+# Filtro da barra lateral -> coluna categórica do dataset, na ordem de ORDEM_SNAPSHOT:
+# a chave das categorias segue a ordem física das linhas do snapshot
+COLUNAS_FILTRO = dict(sorted({'traffic_options': 'Road_traffic_density',
+                              'weather_condition': 'Weatherconditions',
+                              'cities': 'City',
+                              'festival': 'Festival'}.items(),
+                             key=lambda filtro: ORDEM_SNAPSHOT.index(filtro[1])))
+
+# Estado padrão da barra lateral das páginas (todas as opções marcadas)
+DATA_PADRAO = datetime.datetime(2022, 4, 13)
+TRAFEGO_PADRAO = ['Low', 'Medium', 'High', 'Jam']
+CLIMA_PADRAO = ['conditions Cloudy', 'conditions Fog', 'conditions Sandstorms',
+                'conditions Stormy', 'conditions Sunny', 'conditions Windy']
+
+
+class FilterEngine:
+    """Índice de filtros de um dataframe limpo: linhas ordenadas por (chave das categorias, data)."""
+
+    def __init__(self, df1):
+        # Chave combinada: código de cada coluna + 1 (0 = valor ausente) em base mista
+        self.categories = {}
+        chave = np.zeros(len(df1), dtype=np.int64)
+        for col in COLUNAS_FILTRO.values():
+            self.categories[col] = df1[col].cat.categories
+            codes = df1[col].cat.codes.to_numpy().astype(np.int64) + 1
+            chave = chave * (len(self.categories[col]) + 1) + codes
+
+        # Datas trocadas pela posição entre as datas distintas, para caber na mesma chave
+        self.dates, dia = np.unique(df1['Order_Date'].to_numpy(), return_inverse=True)
+        self.order = np.lexsort((dia, chave))
+        # Com o snapshot gravado em ORDEM_SNAPSHOT a ordem é a identidade
+        self.sorted = bool(np.array_equal(self.order, np.arange(len(df1))))
+
+        chave = chave[self.order]
+        self.composite = chave * len(self.dates) + dia[self.order]
+        self.keys, self.starts = np.unique(chave, return_index=True)
+        self.ends = np.append(self.starts[1:], len(chave))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _bitmap(self, col, values):
+        """Bitmap das categorias selecionadas da coluna; a posição 0 é o valor ausente."""
+        if values is None:
+            return np.ones(len(self.categories[col]) + 1, dtype=bool)
+        return np.append(False, np.isin(self.categories[col], list(values)))
+
+    def select_ranges(self, date_slider=None, traffic_options=None, weather_condition=None,
+                      cities=None, festival=None):
+        """Retorna os recortes (início, fim) do índice que atendem os filtros, um por célula selecionada."""
+        filtros = {'traffic_options': traffic_options, 'weather_condition': weather_condition,
+                   'cities': cities, 'festival': festival}
+        # Tabela chave -> selecionado: produto dos bitmaps de cada filtro
+        tabela = np.ones(1, dtype=bool)
+        for nome, col in COLUNAS_FILTRO.items():
+            tabela = np.logical_and.outer(tabela, self._bitmap(col, filtros[nome])).ravel()
+
+        selecionadas = tabela[self.keys]
+        inicio = self.starts[selecionadas]
+        fim = self.ends[selecionadas]
+        if date_slider is not None:
+            # Dentro de cada célula as datas estão ordenadas: o corte é uma busca binária
+            corte = np.searchsorted(self.dates, np.datetime64(date_slider, 'ns'), side='left')
+            fim = np.searchsorted(self.composite,
+                                  self.keys[selecionadas] * len(self.dates) + corte,
+                                  side='left')
+        nao_vazios = fim > inicio
+        return inicio[nao_vazios], fim[nao_vazios]
+
+    def select(self, date_slider=None, traffic_options=None, weather_condition=None,
+               cities=None, festival=None):
+        """Esta função retorna as linhas que atendem todos os filtros informados.
+
+            Input:
+                - date_slider: mantém os pedidos anteriores a esta data
+                - traffic_options, weather_condition, cities, festival: valores
+                  selecionados de cada categoria (None não filtra)
+            Output: slice (quando a seleção é um único recorte) ou array de posições
+                    em ordem crescente, para uso em df1.iloc
+        """
+        inicio, fim = self.select_ranges(date_slider, traffic_options, weather_condition,
+                                         cities, festival)
+        if len(inicio) == 0:
+            return np.array([], dtype=np.intp)
+        if self.sorted and np.array_equal(inicio[1:], fim[:-1]):
+            return slice(int(inicio[0]), int(fim[-1]))
+
+        # Concatena os recortes sem laço em Python: arange + deslocamento de cada recorte
+        tamanhos = fim - inicio
+        deslocamento = inicio - (np.cumsum(tamanhos) - tamanhos)
+        posicoes = np.arange(tamanhos.sum()) + np.repeat(deslocamento, tamanhos)
+        if self.sorted:
+            return posicoes
+        return np.sort(self.order[posicoes])
+
+
+def load_filter_engine(path=DATA_PATH):
+    """Retorna o motor de filtros do dataset atual, montado uma única vez por versão dos dados."""
+    return load_derived('filter_engine', FilterEngine, path,
+                        columns=['Order_Date'] + list(COLUNAS_FILTRO.values()))
+
+
+def filter_state(date_slider=None, traffic_options=None, weather_condition=None,
+                 cities=None, festival=None):
+    """Chave canônica (hashable) de uma combinação de filtros, para caches de resultados.
+
+        A ordem das opções marcadas num multiselect não muda a chave.
+    """
+    opcoes = (traffic_options, weather_condition, cities, festival)
+    return (date_slider,) + tuple(None if valores is None else tuple(sorted(valores))
+                                  for valores in opcoes)
+
+
+def benchmark_filters(path=DATA_PATH, repeticoes=20):
+    """Compara o motor de filtros com as máscaras encadeadas usadas antes nas páginas.
+
+        Output: dicionário com o tempo médio (ms) de cada abordagem
+    """
+    from utils.dataset import load_dataset
+
+    df1 = load_dataset(path, columns=['Order_Date'] + list(COLUNAS_FILTRO.values()))
+    engine = load_filter_engine(path)
+    date_slider = datetime.datetime(2022, 3, 20)
+    traffic_options = ['Low', 'Medium', 'High']
+    weather_condition = ['conditions Cloudy', 'conditions Fog', 'conditions Sunny']
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        df_aux = df1.loc[df1['Order_Date'] < date_slider, :]
+        df_aux = df_aux.loc[df_aux['Road_traffic_density'].isin(traffic_options), :]
+        df_aux = df_aux.loc[df_aux['Weatherconditions'].isin(weather_condition), :]
+    mascaras = (time.perf_counter() - inicio) / repeticoes
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        engine.select_ranges(date_slider, traffic_options, weather_condition)
+    motor_recortes = (time.perf_counter() - inicio) / repeticoes
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        engine.select(date_slider, traffic_options, weather_condition)
+    motor = (time.perf_counter() - inicio) / repeticoes
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        df_engine = df1.iloc[engine.select(date_slider, traffic_options, weather_condition)]
+    motor_iloc = (time.perf_counter() - inicio) / repeticoes
+
+    # Verificação mantida fora de assert: o resultado não pode ser ignorado com python -O
+    if not df_engine.index.equals(df_aux.index):
+        raise RuntimeError('O motor de filtros selecionou linhas diferentes das máscaras '
+                           '(%d x %d linhas).' % (len(df_engine), len(df_aux)))
+    return {'rows': len(df1),
+            'rows_selected': len(df_aux),
+            'masks_ms': round(mascaras * 1000, 3),
+            'engine_ranges_ms': round(motor_recortes * 1000, 3),
+            'engine_ms': round(motor * 1000, 3),
+            'engine_iloc_ms': round(motor_iloc * 1000, 3)}
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(benchmark_filters(sys.argv[1] if len(sys.argv) > 1 else DATA_PATH))
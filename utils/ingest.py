@@ -0,0 +1,93 @@
+"""Ingestão incremental de lotes de pedidos.
+
+Lotes novos chegam como arquivos csv (no mesmo formato do train.csv) no
+diretório de entrada. Cada execução lê apenas o que ainda não foi incorporado:
+arquivos novos e as linhas acrescentadas ao final de arquivos já lidos. Apenas
+essas linhas são limpas e incorporadas ao snapshot e aos agregados em cache.
+
+O watermark (ao lado do csv) guarda, para cada lote (pelo caminho absoluto), até
+qual byte ele já foi lido, além da maior Order_Date e do total de pedidos do dataset.
+
+Uso: python -m utils.ingest [lote.csv ...]
+"""
+import glob
+import io
+import os
+
+import pandas as pd
+
+from utils.dataset import (DATA_PATH, add_distance, append_rows, clean_code,
+                           compact_dtypes, ensure_snapshot, read_watermark)
+
+INCOMING_DIR = 'incoming'
+
+
+def _read_new_lines(arquivo, offset):
+    """Lê as linhas completas do lote a partir do byte offset.
+
+        Output: (texto csv com o cabeçalho, novo offset)
+    """
+    with open(arquivo, 'rb') as lote:
+        cabecalho = lote.readline()
+        if offset < len(cabecalho) or offset > os.path.getsize(arquivo):
+            # Lote novo ou substituído por um arquivo menor: lê desde o início
+            offset = len(cabecalho)
+        lote.seek(offset)
+        conteudo = lote.read()
+
+    # Uma linha ainda sendo escrita (sem quebra de linha no fim) fica para a próxima leitura
+    fim = conteudo.rfind(b'\n') + 1
+    return (cabecalho + conteudo[:fim]).decode('utf-8'), offset + fim
+
+
+def pending_batches(path=DATA_PATH, incoming=INCOMING_DIR):
+    """Lista os lotes do diretório de entrada que têm linhas ainda não incorporadas."""
+    watermark = read_watermark(path) or {'batches': {}}
+    pendentes = []
+    for arquivo in sorted(glob.glob(os.path.join(incoming, '*.csv'))):
+        lido = watermark['batches'].get(os.path.abspath(arquivo), {})
+        if lido.get('offset', 0) != os.path.getsize(arquivo):
+            pendentes.append(arquivo)
+    return pendentes
+
+
+def ingest_batches(files=None, path=DATA_PATH, incoming=INCOMING_DIR):
+    """Esta função incorpora ao dataset os pedidos novos dos lotes csv.
+
+        Input:
+            - files: lotes a ler (None lê os lotes pendentes do diretório de entrada)
+            - path: csv base do dataset
+        Output: dicionário com linhas lidas, linhas válidas, pedidos incorporados e o watermark
+    """
+    # Com o csv base alterado o snapshot é refeito e o watermark anterior descartado
+    ensure_snapshot(path)
+    watermark = read_watermark(path) or {'batches': {}}
+    if files is None:
+        files = pending_batches(path, incoming)
+
+    partes = []
+    batches = {}
+    for arquivo in files:
+        nome = os.path.abspath(arquivo)
+        offset = watermark['batches'].get(nome, {}).get('offset', 0)
+        texto, offset = _read_new_lines(arquivo, offset)
+        partes.append(pd.read_csv(io.StringIO(texto)))
+        batches[nome] = {'offset': offset}
+
+    df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+    df_new = compact_dtypes(add_distance(clean_code(df))) if len(df) > 0 else None
+
+    appended = 0
+    if batches:
+        appended, watermark = append_rows(df_new, path, batches)
+
+    return {'rows_read': len(df),
+            'rows_valid': 0 if df_new is None else len(df_new),
+            'rows_appended': appended,
+            'watermark': watermark}
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(ingest_batches(sys.argv[1:] or None))
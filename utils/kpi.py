@@ -0,0 +1,158 @@
+"""Métricas escalares dos cards das páginas calculadas numa única passada sobre o cubo.
+
+A página declara os seus cards como um dicionário nome -> KPI (medida, estatística,
+condição e casas decimais). compute_kpis monta uma máscara por condição distinta
+(ex.: Festival == 'Yes') e calcula, de uma vez para todas as condições e medidas:
+    - as somas (pedidos, contagem, soma e soma dos quadrados) com um único produto
+      matricial máscaras x colunas do cubo;
+    - os mínimos e máximos com uma redução vetorizada sobre as mesmas máscaras.
+Média e desvio padrão (amostral) são recompostos a partir das somas, como em
+utils.cube. O custo é proporcional ao número de células do cubo filtrado, e não ao
+número de cards x pedidos.
+
+Percentis ('p50', 'p90', 'p99' etc.) vêm do sketch de histogramas filtrado
+(utils.quantiles), um cálculo por condição distinta para todos os percentis dela.
+
+O resultado é uma NamedTuple com um campo por card, na ordem da declaração.
+"""
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Estatística -> sufixos das colunas do cubo de que ela depende
+ESTATISTICAS = {'orders': (), 'count': ('_count',), 'sum': ('_sum',),
+                'mean': ('_count', '_sum'), 'std': ('_count', '_sum', '_sumsq'),
+                'min': ('_min',), 'max': ('_max',), 'distinct': ()}
+
+
+class KPI(NamedTuple):
+    """Declaração de um card.
+
+        - measure: medida do cubo (ignorada em 'orders' e 'distinct')
+        - stat: 'orders', 'count', 'sum', 'mean', 'std', 'min', 'max', 'distinct'
+          (entregadores distintos, a partir do sketch de utils.distinct) ou um
+          percentil 'pNN' (ex.: 'p90', a partir do sketch de utils.quantiles)
+        - where: pares (dimensão, valor) que as células precisam satisfazer (não se aplica
+          a 'distinct')
+        - decimals: casas decimais do valor (0 retorna int; None não arredonda)
+    """
+    measure: Optional[str]
+    stat: str
+    where: Tuple = ()
+    decimals: Optional[int] = None
+
+
+def percentile_of(stat):
+    """Percentil (entre 0 e 1) de uma estatística 'pNN', ou None para as demais."""
+    if stat.startswith('p'):
+        try:
+            q = float(stat[1:]) / 100
+        except ValueError:
+            return None
+        if 0 <= q <= 1:
+            return q
+    return None
+
+
+def kpi_type(specs, name='KPIs'):
+    """Tipo NamedTuple do resultado: um campo por card (int para contagens e decimals=0)."""
+    def _tipo(spec):
+        if spec.stat in ('orders', 'count', 'distinct') or spec.decimals == 0:
+            return int
+        return float
+    return NamedTuple(name, [(nome, _tipo(spec)) for nome, spec in specs.items()])
+
+
+def _arredondar(valor, spec, tipo):
+    if np.isnan(valor):
+        return valor
+    if spec.decimals is not None:
+        valor = round(float(valor), spec.decimals)
+    return tipo(valor)
+
+
+def compute_kpis(cube, specs, distinct=None, quantiles=None, name='KPIs'):
+    """Esta função calcula todos os cards declarados numa única passada sobre as células do cubo.
+
+        Input:
+            - cube: cubo já filtrado (utils.cube)
+            - specs: dicionário nome do card -> KPI
+            - distinct: sketch já filtrado (utils.distinct), para os cards 'distinct'
+            - quantiles: sketch já filtrado (utils.quantiles), para os cards de percentil
+        Output: NamedTuple com o valor de cada card
+    """
+    for nome, spec in specs.items():
+        if spec.stat not in ESTATISTICAS and percentile_of(spec.stat) is None:
+            raise ValueError('Estatística desconhecida no card %r: %r' % (nome, spec.stat))
+        if spec.stat == 'distinct' and spec.where:
+            # O sketch de distintos não tem as dimensões das condições: a contagem seria a do total
+            raise ValueError('O card %r de entregadores distintos não aceita condição' % nome)
+    percentis = {nome: spec for nome, spec in specs.items() if spec.stat not in ESTATISTICAS}
+    specs_cubo = {nome: spec for nome, spec in specs.items() if nome not in percentis}
+
+    # Máscaras: células x condições distintas
+    condicoes = list(dict.fromkeys(spec.where for spec in specs_cubo.values()))
+    mascaras = np.ones((len(condicoes), len(cube)), dtype=bool)
+    for j, condicao in enumerate(condicoes):
+        for dimensao, valor in condicao:
+            mascaras[j] &= (cube[dimensao] == valor).to_numpy()
+
+    # Colunas necessárias de cada tipo de agregado
+    colunas = {'soma': ['orders'], '_min': [], '_max': []}
+    for spec in specs_cubo.values():
+        for sufixo in ESTATISTICAS[spec.stat]:
+            grupo = sufixo if sufixo in ('_min', '_max') else 'soma'
+            if spec.measure + sufixo not in colunas[grupo]:
+                colunas[grupo].append(spec.measure + sufixo)
+
+    # Passada única: somas por produto matricial, mínimos e máximos por redução mascarada
+    agregados = {}
+    valores = cube[colunas['soma']].to_numpy(dtype=np.float64)
+    somas = mascaras.astype(np.float64) @ np.nan_to_num(valores)
+    for i, coluna in enumerate(colunas['soma']):
+        agregados[coluna] = somas[:, i]
+    for grupo, neutro, reducao in (('_min', np.inf, np.min), ('_max', -np.inf, np.max)):
+        if colunas[grupo]:
+            valores = np.nan_to_num(cube[colunas[grupo]].to_numpy(dtype=np.float64), nan=neutro)
+            extremos = reducao(np.where(mascaras[:, :, None], valores[None], neutro), axis=1,
+                               initial=neutro)
+            extremos[np.isinf(extremos)] = np.nan
+            for i, coluna in enumerate(colunas[grupo]):
+                agregados[coluna] = extremos[:, i]
+
+    # Percentis: todos os de uma mesma condição num único cálculo sobre o histograma combinado
+    valores_percentis = {}
+    for condicao in dict.fromkeys(spec.where for spec in percentis.values()):
+        nomes = [nome for nome, spec in percentis.items() if spec.where == condicao]
+        if quantiles is None:
+            valores = [np.nan] * len(nomes)
+        else:
+            valores = quantiles.where(condicao).quantiles([percentile_of(percentis[nome].stat)
+                                                           for nome in nomes])
+        valores_percentis.update(zip(nomes, valores))
+
+    tipo = kpi_type(specs, name)
+    resultado = {}
+    for nome, spec in specs.items():
+        if nome in valores_percentis:
+            resultado[nome] = _arredondar(valores_percentis[nome], spec, tipo.__annotations__[nome])
+            continue
+        j = condicoes.index(spec.where)
+        medida = spec.measure
+        if spec.stat == 'orders':
+            valor = agregados['orders'][j]
+        elif spec.stat == 'distinct':
+            valor = distinct.count() if distinct is not None else np.nan
+        elif spec.stat in ('min', 'max', 'count', 'sum'):
+            valor = agregados[medida + ESTATISTICAS[spec.stat][0]][j]
+        else:
+            n = agregados[medida + '_count'][j]
+            soma = agregados[medida + '_sum'][j]
+            media = soma / n if n > 0 else np.nan
+            if spec.stat == 'mean':
+                valor = media
+            else:
+                variancia = (agregados[medida + '_sumsq'][j] - soma * media) / (n - 1) if n > 1 else np.nan
+                valor = np.sqrt(max(variancia, 0)) if n > 1 else np.nan
+        resultado[nome] = _arredondar(valor, spec, tipo.__annotations__[nome])
+    return tipo(**resultado)
@@ -0,0 +1,37 @@
+"""Imports preguiçosos de bibliotecas pesadas.
+
+lazy_import retorna um substituto do módulo que só faz o import de verdade no
+primeiro acesso a um atributo. As páginas declaram, por exemplo,
+`px = lazy_import('plotly_express')` no topo e continuam usando px.bar(...): o custo
+do import só é pago quando um gráfico é de fato montado (e não quando a figura
+já está em cache ou a aba que a usa não está visível).
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """Substituto de um módulo, importado no primeiro acesso a um atributo."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+    def __repr__(self):
+        estado = 'importado' if self._module is not None else 'não importado'
+        return '<LazyModule %r (%s)>' % (self._name, estado)
+
+
+def lazy_import(name):
+    """Retorna o módulo `name` com import adiado até o primeiro uso."""
+    return LazyModule(name)
@@ -0,0 +1,67 @@
+"""Cache LRU com limite de memória, compartilhado pelos caches de resultados renderizados."""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Cache LRU limitado pela soma dos tamanhos dos valores (e, opcionalmente, pela quantidade).
+
+        Input:
+            - max_bytes: memória máxima ocupada pelos valores
+            - sizeof: função que retorna o tamanho em bytes de um valor
+            - max_items: quantidade máxima de valores (None: sem limite)
+        Valores maiores que max_bytes não são guardados.
+    """
+
+    def __init__(self, max_bytes, sizeof=len, max_items=None):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Retorna o valor da chave (marcando-o como o mais recente) ou default."""
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        """Guarda o valor e descarta os menos usados até caber no limite."""
+        tamanho = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            if tamanho > self.max_bytes:
+                return
+            self._items[key] = (value, tamanho)
+            self.nbytes += tamanho
+            while self.nbytes > self.max_bytes or (self.max_items is not None
+                                                   and len(self._items) > self.max_items):
+                self.nbytes -= self._items.popitem(last=False)[1][1]
+
+    def get_or_build(self, key, build):
+        """Retorna o valor em cache ou calcula build(), guarda e retorna."""
+        faltando = object()
+        value = self.get(key, faltando)
+        if value is faltando:
+            value = build()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
@@ -0,0 +1,146 @@
+"""Mapas das localizações de entrega com html renderizado em cache.
+
+Os pontos saem de arrays numpy, sem iterrows, em três modos:
+    - 'median': um marcador por (cidade, densidade de tráfego) na mediana das
+      coordenadas de entrega (o mapa original da visão empresa);
+    - 'cluster': marcadores agrupados (FastMarkerCluster) por local de entrega;
+    - 'heatmap': mapa de calor ponderado pela quantidade de pedidos.
+
+Nos modos por pedido as coordenadas são agregadas numa grade de GRADE_GRAUS graus
+(~100 m), alargada se preciso até caber em MAX_PONTOS células: o navegador recebe um
+ponto por célula com a contagem de pedidos, e não um ponto por pedido, o que mantém
+o html pequeno com centenas de milhares de pedidos.
+
+Com o índice espacial (utils.spatial), os modos por pedido usam as células da grade
+já agregadas na ingestão (index_points), sem copiar as linhas selecionadas; o popup
+dos marcadores agrupados mostra também o tempo médio de entrega da célula.
+
+O html do mapa é guardado num cache LRU (limitado em memória) por chave (versão do dataset, modo e filtros):
+repetir uma visão não recalcula os pontos nem serializa o mapa de novo.
+
+O folium só é importado quando um mapa é montado (utils.lazy): as páginas que
+importam este módulo não pagam o import enquanto a aba do mapa não é aberta.
+"""
+import numpy as np
+
+from utils.lazy import lazy_import
+from utils.lru import LRUCache
+from utils.timing import span, timed
+
+folium = lazy_import('folium')
+folium_plugins = lazy_import('folium.plugins')
+
+MODOS_MAPA = ('median', 'cluster', 'heatmap')
+
+# Quantidade máxima de mapas renderizados guardados em cache e memória ocupada por eles (MB)
+MAX_MAPAS = 32
+MEMORIA_MAPAS_MB = 64
+
+# Tamanho (graus) da célula da grade dos modos por pedido e quantidade máxima de pontos
+# enviados ao navegador
+GRADE_GRAUS = 0.001
+MAX_PONTOS = 20000
+
+# Popup dos marcadores agrupados, criados no navegador a partir de [lat, lng, pedidos]
+# ou [lat, lng, pedidos, tempo médio] (tempo negativo: célula sem tempo registrado)
+CALLBACK_CLUSTER = """\
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    var texto = row[2] + ' pedido(s)';
+    if (row.length > 3 && row[3] >= 0) {
+        texto += ', ' + row[3] + ' min em média';
+    }
+    marker.bindPopup(texto);
+    return marker;
+};
+"""
+
+_html_cache = LRUCache(MEMORIA_MAPAS_MB * 2 ** 20, sizeof=len, max_items=MAX_MAPAS)
+
+
+def median_points(df1):
+    """Mediana da latitude e longitude de entrega por cidade e densidade de tráfego."""
+    return (df1.loc[:, ['City', 'Road_traffic_density', 'Delivery_location_latitude',
+                        'Delivery_location_longitude']]
+            .groupby(['City', 'Road_traffic_density'], observed=True)
+            .median()
+            .reset_index())
+
+
+def grid_points(df1, grade=GRADE_GRAUS, max_pontos=MAX_PONTOS):
+    """Agrega as localizações de entrega numa grade regular.
+
+        A célula começa com `grade` graus e dobra de tamanho até haver no máximo
+        max_pontos células ocupadas.
+        Output: matriz (células x 3) com latitude, longitude do centro da célula e quantidade de pedidos
+    """
+    lat = df1['Delivery_location_latitude'].to_numpy(dtype=np.float64)
+    lng = df1['Delivery_location_longitude'].to_numpy(dtype=np.float64)
+    validos = ~(np.isnan(lat) | np.isnan(lng))
+    lat, lng = lat[validos], lng[validos]
+    while True:
+        # Chave inteira única por célula (longitudes em [-180, 180] cabem em 2^32 células)
+        linha = np.round(lat / grade).astype(np.int64)
+        coluna = np.round(lng / grade).astype(np.int64)
+        chaves, pedidos = np.unique(linha * (1 << 32) + coluna, return_counts=True)
+        if len(chaves) <= max_pontos:
+            break
+        grade *= 2
+    centros = np.column_stack([np.floor_divide(chaves + (1 << 31), 1 << 32),
+                               (chaves + (1 << 31)) % (1 << 32) - (1 << 31)]) * grade
+    return np.column_stack([centros, pedidos])
+
+
+def index_points(index, date_slider=None, traffic_options=None, max_pontos=MAX_PONTOS):
+    """Agrega as entregas filtradas nas células do índice espacial (utils.spatial).
+
+        Usa o nível mais fino da grade com no máximo max_pontos células ocupadas.
+        Output: matriz (células x 4) com latitude, longitude do centro da célula, quantidade
+                de pedidos e tempo médio de entrega (-1 sem tempo registrado)
+    """
+    nivel = index.density_level(max_pontos, date_slider, traffic_options)
+    df_aux = index.density(nivel, date_slider, traffic_options)
+    return np.column_stack([df_aux['lat'].to_numpy(), df_aux['lng'].to_numpy(),
+                            df_aux['orders'].to_numpy(), df_aux['mean'].round(1).fillna(-1).to_numpy()])
+
+
+@timed('map.build')
+def build_map(df1, mode='median', points=None):
+    """Esta função monta o mapa folium das localizações de entrega no modo pedido (MODOS_MAPA).
+
+        Nos modos por pedido, points são os pontos já agregados (index_points); sem eles,
+        as linhas de df1 são agregadas por grid_points.
+    """
+    if mode not in MODOS_MAPA:
+        raise ValueError('Modo de mapa desconhecido: %r (use um de %s)' % (mode, MODOS_MAPA))
+
+    map = folium.Map()
+    if mode == 'median':
+        df_aux = median_points(df1)
+        for lat, lng, cidade, trafego in zip(df_aux['Delivery_location_latitude'].to_numpy(),
+                                             df_aux['Delivery_location_longitude'].to_numpy(),
+                                             df_aux['City'], df_aux['Road_traffic_density']):
+            folium.Marker([lat, lng], popup='%s - %s' % (cidade, trafego)).add_to(map)
+        return map
+
+    pontos = grid_points(df1) if points is None else points
+    if len(pontos) == 0:
+        return map
+    if mode == 'cluster':
+        folium_plugins.FastMarkerCluster(pontos.tolist(), callback=CALLBACK_CLUSTER).add_to(map)
+    else:
+        folium_plugins.HeatMap(pontos[:, :3].tolist()).add_to(map)
+    map.fit_bounds([pontos[:, :2].min(axis=0).tolist(), pontos[:, :2].max(axis=0).tolist()])
+    return map
+
+
+def render_map(map):
+    """Serializa o mapa num documento html completo (o mesmo que o folium_static exibe)."""
+    with span('map.render'):
+        return folium.Figure().add_child(map).render()
+
+
+def cached_map_html(key, build):
+    """Retorna o html em cache para a chave; build() só é chamado (e serializado) para chaves novas."""
+    with span('map'):
+        return _html_cache.get_or_build(key, lambda: render_map(build()))
@@ -0,0 +1,42 @@
+"""Acesso às funções de cálculo das páginas sem executar o layout Streamlit.
+
+As páginas são scripts: importá-las executaria a barra lateral e o layout. Aqui o
+código da página é lido e só os imports (inclusive os preguiçosos, `x = lazy_import(...)`),
+as constantes (nomes em maiúsculas) e as definições de funções são executados, para
+que benchmarks e exportações usem exatamente as mesmas funções que as páginas.
+"""
+import ast
+import functools
+import os
+import types
+
+DIRETORIO_PAGINAS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 'pages')
+
+PAGINAS = {'empresa': '1_Visao_Empresa.py',
+           'entregadores': '2_Visao_Entregadores.py',
+           'restaurantes': '3_Visao_Restaurantes.py'}
+
+
+def _definicao(node):
+    """Indica se o nó do código da página é um import, uma função ou uma constante."""
+    if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef)):
+        return True
+    if not isinstance(node, ast.Assign):
+        return False
+    if (isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name)
+            and node.value.func.id == 'lazy_import'):
+        return True
+    return all(isinstance(alvo, ast.Name) and alvo.id.isupper() for alvo in node.targets)
+
+
+@functools.lru_cache(maxsize=None)
+def load_page_functions(page):
+    """Retorna um namespace com as funções e constantes da página ('empresa', 'entregadores' ou 'restaurantes')."""
+    path = os.path.join(DIRETORIO_PAGINAS, PAGINAS[page])
+    with open(path, encoding='utf-8') as arquivo:
+        tree = ast.parse(arquivo.read(), path)
+    modulo = ast.Module(body=[node for node in tree.body if _definicao(node)], type_ignores=[])
+    namespace = {'__name__': 'pages.' + os.path.splitext(PAGINAS[page])[0], '__file__': path}
+    exec(compile(modulo, path, 'exec'), namespace)
+    return types.SimpleNamespace(**namespace)
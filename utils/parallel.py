@@ -0,0 +1,131 @@
+"""Agregação paralela opcional do dataset limpo num pool de processos.
+
+O dataset é particionado por cidade e faixa de datas e cada partição é agregada
+(build_cube, build_partials etc.) num processo do pool. Os parciais (contagens,
+somas, somas dos quadrados, mínimos e máximos) são combinados pela mesma função de
+combinação da ingestão incremental e do streaming.
+
+City e Order_Date são dimensões de todos os agregados, então cada célula cai numa
+única partição e recebe as suas linhas na ordem original: a combinação não soma
+valores de partições diferentes. Como as células dos agregados são ordenadas pelas
+dimensões, o resultado é idêntico ao cálculo serial.
+
+Configuração (variável de ambiente):
+    - CURRY_WORKERS: quantidade de processos ('auto': um por núcleo). O padrão, 1,
+      mantém o cálculo serial no próprio processo.
+
+O pool usa o método 'spawn' (seguro com as threads do Streamlit) e é criado uma vez
+por processo: o custo de iniciar os processos é pago só no primeiro cálculo.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.timing import span
+
+# Dimensões usadas para particionar o dataset
+DIMENSOES_PARTICAO = ('City', 'Order_Date')
+
+# Partições por processo: partições menores equilibram melhor a carga entre os processos
+PARTICOES_POR_PROCESSO = 2
+
+# Abaixo desta quantidade de linhas o custo de enviar as partições supera o ganho
+MIN_LINHAS_PARALELO = 100_000
+
+
+def workers_from(valor):
+    """Converte a configuração de processos ('auto', '4', 4, None) numa quantidade >= 1."""
+    if valor in (None, ''):
+        return 1
+    if valor == 'auto':
+        return os.cpu_count() or 1
+    return max(int(valor), 1)
+
+
+WORKERS = workers_from(os.environ.get('CURRY_WORKERS'))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """Retorna o pool de processos do módulo, recriado apenas se a quantidade mudar."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    """Encerra o pool de processos (se existir)."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool, _pool_workers = None, 0
+
+
+def partition(df1, parts, by=DIMENSOES_PARTICAO):
+    """Esta função divide as linhas em cerca de `parts` partições por cidade e/ou faixa de datas.
+
+        Input:
+            - parts: quantidade de partições desejada
+            - by: 'City', 'Order_Date' ou ambas; as faixas de datas são dias contíguos
+        Output: lista de arrays com as posições das linhas de cada partição (na ordem original)
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    chave = np.zeros(len(df1), dtype=np.int64)
+    grupos = 1
+    if 'City' in by:
+        codes, uniques = df1['City'].factorize(sort=True)
+        chave = codes.astype(np.int64)
+        grupos = max(len(uniques), 1)
+    if 'Order_Date' in by:
+        faixas = max(-(-parts // grupos), 1)
+        dias = df1['Order_Date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        if len(dias):
+            dias = dias - dias.min()
+            faixa = dias * faixas // (dias.max() + 1)
+        else:
+            faixa = dias
+        chave = chave * faixas + faixa
+
+    # Ordenação estável: cada partição mantém a ordem original das suas linhas
+    ordem = np.argsort(chave, kind='stable')
+    _, inicios = np.unique(chave[ordem], return_index=True)
+    return [p for p in np.split(ordem, inicios[1:]) if len(p)]
+
+
+def parallel_aggregate(builder, combine, df1, workers=None, by=DIMENSOES_PARTICAO,
+                       min_rows=MIN_LINHAS_PARALELO):
+    """Esta função calcula builder(df1) particionando as linhas e agregando as partições no pool.
+
+        Input:
+            - builder: função de nível de módulo (enviada aos processos) que agrega um dataframe
+            - combine: função que combina a lista de parciais
+            - workers: quantidade de processos (None: CURRY_WORKERS)
+            - by: dimensões das partições; devem ser dimensões do agregado para o
+              resultado ser idêntico ao serial
+            - min_rows: abaixo desta quantidade de linhas o cálculo é serial
+        Output: o agregado combinado
+    """
+    workers = WORKERS if workers is None else workers_from(workers)
+    if workers <= 1 or len(df1) < min_rows:
+        return builder(df1)
+
+    with span('parallel.' + getattr(builder, '__name__', 'aggregate'), rows_in=len(df1)):
+        particoes = partition(df1, workers * PARTICOES_POR_PROCESSO, by)
+        if len(particoes) <= 1:
+            return builder(df1)
+        pool = get_pool(workers)
+        futuros = [pool.submit(builder, df1.take(linhas)) for linhas in particoes]
+        return combine([futuro.result() for futuro in futuros])
+
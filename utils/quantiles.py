@@ -0,0 +1,249 @@
+"""Percentis do tempo de entrega por meio de histogramas de faixas fixas combináveis.
+
+Os pedidos são agrupados em células (dia x cidade x densidade de tráfego x clima, por
+padrão) e cada célula guarda um histograma da medida em faixas fixas de LARGURA_FAIXA
+entre LIMITE_INFERIOR e LIMITE_SUPERIOR: a quantidade de pedidos e a soma dos valores
+de cada faixa. Como as faixas são as mesmas em todas as células, combinar células
+(qualquer intervalo de datas e combinação de filtros, ou lotes novos) é somar os
+histogramas, sem voltar às linhas.
+
+O percentil segue a definição do pandas (interpolação linear entre os valores
+ordenados nas posições vizinhas a (n - 1) * q), com cada valor trocado pela média
+da sua faixa. Precisão: para valores dentro dos limites o erro absoluto é menor que
+LARGURA_FAIXA, e é zero quando todos os valores de cada faixa são iguais, como os
+tempos de entrega em minutos inteiros com faixas de 1 minuto. Valores fora dos
+limites entram na primeira ou na última faixa (ainda contados, mas sem o limite de erro).
+Escolhemos faixas fixas em vez de t-digest porque o tempo de entrega é limitado e
+discreto: o histograma é exato nesse caso, e a combinação é uma soma de matrizes.
+
+Uso (comparação com os percentis exatos; os limites de erro são testados em
+tests/test_quantiles.py): python -m utils.quantiles [csv]
+"""
+import numpy as np
+import pandas as pd
+
+from utils.cube import filter_cube
+from utils.dataset import DATA_PATH, concat_rows, load_derived
+from utils.distinct import cell_ids
+
+MEDIDA_PERCENTIS = 'Time_taken(min)'
+
+# Dimensões das células: os filtros da barra lateral e a quebra por cidade e tráfego
+DIMENSOES_PERCENTIS = ['Order_Date', 'City', 'Road_traffic_density', 'Weatherconditions']
+
+# Faixas do histograma (minutos)
+LARGURA_FAIXA = 1.0
+LIMITE_INFERIOR = 0.0
+LIMITE_SUPERIOR = 120.0
+
+# Percentis mostrados nas páginas
+PERCENTIS = (0.5, 0.9, 0.99)
+
+
+def percentile_name(q):
+    """Nome da coluna de um percentil: 0.9 -> 'p90'."""
+    return 'p%g' % round(q * 100, 6)
+
+
+def bin_index(valores, width=LARGURA_FAIXA, low=LIMITE_INFERIOR, high=LIMITE_SUPERIOR):
+    """Faixa de cada valor; valores fora dos limites vão para a primeira ou a última faixa."""
+    n_faixas = int(np.ceil((high - low) / width))
+    faixas = np.floor((np.asarray(valores, dtype=np.float64) - low) / width)
+    return np.clip(faixas, 0, n_faixas - 1).astype(np.int64)
+
+
+def histogram_quantiles(counts, sums, qs=PERCENTIS):
+    """Percentis de cada linha de uma matriz de histogramas (linhas x faixas).
+
+        Output: matriz (linhas x percentis); NaN nas linhas sem valores
+    """
+    counts = np.atleast_2d(counts)
+    sums = np.atleast_2d(sums)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        medias = np.where(counts > 0, sums / counts, np.nan)
+    acumulado = np.cumsum(counts, axis=1)
+    total = acumulado[:, -1]
+    linhas = np.arange(len(counts))
+
+    def valor(posto):
+        # Faixa do valor de posto (base 0) = primeira faixa com acumulado > posto
+        faixa = np.minimum((acumulado > posto[:, None]).argmax(axis=1), counts.shape[1] - 1)
+        return medias[linhas, faixa]
+
+    resultado = np.full((len(counts), len(qs)), np.nan)
+    for j, q in enumerate(qs):
+        h = (total - 1) * q
+        baixo = np.floor(h)
+        valor_baixo, valor_alto = valor(baixo), valor(np.ceil(h))
+        resultado[:, j] = valor_baixo + (h - baixo) * (valor_alto - valor_baixo)
+    resultado[total == 0] = np.nan
+    return resultado
+
+
+def _sum_rows(matriz, grupos, n_grupos):
+    """Soma as linhas da matriz por grupo (todos os grupos de 0 a n_grupos - 1 têm alguma linha)."""
+    if n_grupos == 0:
+        return np.zeros((0,) + matriz.shape[1:], dtype=matriz.dtype)
+    ordem = np.argsort(grupos, kind='stable')
+    inicios = np.searchsorted(grupos[ordem], np.arange(n_grupos))
+    return np.add.reduceat(matriz[ordem], inicios, axis=0)
+
+
+class QuantileSketch:
+    """Histogramas de faixas fixas por célula, combináveis para qualquer seleção de células.
+
+        Input:
+            - df1: pedidos com as dimensões e a medida
+            - measure: medida resumida
+            - dimensions: dimensões das células
+            - width, low, high: largura e limites das faixas
+    """
+
+    def __init__(self, df1, measure=MEDIDA_PERCENTIS, dimensions=DIMENSOES_PERCENTIS,
+                 width=LARGURA_FAIXA, low=LIMITE_INFERIOR, high=LIMITE_SUPERIOR):
+        self.measure = measure
+        self.dimensions = list(dimensions)
+        self.width, self.low, self.high = width, low, high
+
+        valores = df1[measure].to_numpy(dtype=np.float64)
+        validos = ~np.isnan(valores)
+        celulas, self.cells = cell_ids(df1.loc[validos, self.dimensions])
+        self._fill(celulas, bin_index(valores[validos], width, low, high), None, valores[validos])
+
+    @classmethod
+    def from_bins(cls, df_bins, measure=MEDIDA_PERCENTIS, dimensions=DIMENSOES_PERCENTIS,
+                  width=LARGURA_FAIXA, low=LIMITE_INFERIOR, high=LIMITE_SUPERIOR):
+        """Monta o sketch a partir de histogramas já agregados (colunas: dimensões, 'bin', 'count' e 'sum')."""
+        novo = object.__new__(cls)
+        novo.measure, novo.dimensions = measure, list(dimensions)
+        novo.width, novo.low, novo.high = width, low, high
+        celulas, novo.cells = cell_ids(df_bins.loc[:, novo.dimensions])
+        novo._fill(celulas, df_bins['bin'].to_numpy(dtype=np.int64),
+                   df_bins['count'].to_numpy(dtype=np.float64), df_bins['sum'].to_numpy(dtype=np.float64))
+        return novo
+
+    @property
+    def n_bins(self):
+        return int(np.ceil((self.high - self.low) / self.width))
+
+    def _fill(self, celulas, faixas, pesos, somas):
+        """Soma as contagens e os valores de cada (célula, faixa)."""
+        tamanho = len(self.cells) * self.n_bins
+        posicao = celulas.astype(np.int64) * self.n_bins + faixas
+        self.counts = (np.bincount(posicao, weights=pesos, minlength=tamanho)
+                       .astype(np.int64).reshape(len(self.cells), self.n_bins))
+        self.sums = np.bincount(posicao, weights=somas, minlength=tamanho).reshape(len(self.cells), self.n_bins)
+
+    def _like(self, cells, counts, sums):
+        """Novo sketch com os mesmos parâmetros e as células e histogramas informados."""
+        novo = object.__new__(QuantileSketch)
+        novo.measure, novo.dimensions = self.measure, self.dimensions
+        novo.width, novo.low, novo.high = self.width, self.low, self.high
+        novo.cells = cells.reset_index(drop=True)
+        novo.counts, novo.sums = counts, sums
+        return novo
+
+    def filter(self, date_slider=None, traffic_options=None, weather_condition=None):
+        """Esta função aplica os filtros da barra lateral sobre as células (como filter_cube)."""
+        cells = filter_cube(self.cells, date_slider, traffic_options, weather_condition)
+        linhas = cells.index.to_numpy()
+        return self._like(cells, self.counts[linhas], self.sums[linhas])
+
+    def where(self, condicao):
+        """Células que satisfazem os pares (dimensão, valor) da condição (ex.: (('City', 'Urban'),))."""
+        linhas = np.ones(len(self.cells), dtype=bool)
+        for dimensao, valor in condicao:
+            if dimensao not in self.dimensions:
+                raise ValueError('O sketch de percentis não tem a dimensão %r.' % dimensao)
+            linhas &= (self.cells[dimensao] == valor).to_numpy()
+        return self._like(self.cells.loc[linhas], self.counts[linhas], self.sums[linhas])
+
+    def merge(self, other):
+        """Combina dois sketches com as mesmas dimensões e faixas (união dos pedidos)."""
+        parametros = (self.measure, self.dimensions, self.width, self.low, self.high)
+        if (other.measure, other.dimensions, other.width, other.low, other.high) != parametros:
+            raise ValueError('Sketches com medida, dimensões ou faixas diferentes não podem ser combinados.')
+        celulas, cells = cell_ids(concat_rows([self.cells, other.cells]))
+        return self._like(cells,
+                          _sum_rows(np.concatenate([self.counts, other.counts]), celulas, len(cells)),
+                          _sum_rows(np.concatenate([self.sums, other.sums]), celulas, len(cells)))
+
+    def count(self):
+        """Quantidade de pedidos com a medida preenchida em todas as células."""
+        return int(self.counts.sum())
+
+    def quantiles(self, qs=PERCENTIS):
+        """Percentis da medida em todas as células (array na ordem de qs)."""
+        return histogram_quantiles(self.counts.sum(axis=0), self.sums.sum(axis=0), qs)[0]
+
+    def quantiles_by(self, by, qs=PERCENTIS):
+        """Esta função calcula os percentis da medida por grupo de dimensões.
+
+            Output: Dataframe ordenado pelas dimensões, com 'count' e uma coluna por percentil (ex.: 'p90')
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        grupos, df_aux = cell_ids(self.cells.loc[:, by])
+        counts = _sum_rows(self.counts, grupos, len(df_aux))
+        sums = _sum_rows(self.sums, grupos, len(df_aux))
+
+        df_aux = df_aux.copy()
+        df_aux['count'] = counts.sum(axis=1)
+        for j, valores in enumerate(histogram_quantiles(counts, sums, qs).T):
+            df_aux[percentile_name(qs[j])] = valores
+        # Como no groupby do pandas, grupos com alguma dimensão ausente são descartados
+        df_aux = df_aux.loc[df_aux[by].notna().all(axis=1).to_numpy()]
+        return df_aux.sort_values(by, ignore_index=True)
+
+
+def merge_quantiles(sketch, df_new):
+    """Atualiza o sketch com pedidos novos."""
+    return sketch.merge(QuantileSketch(df_new, sketch.measure, sketch.dimensions,
+                                       sketch.width, sketch.low, sketch.high))
+
+
+def load_quantiles(path=DATA_PATH):
+    """Esta função retorna o sketch de percentis do tempo de entrega, calculado uma vez por versão."""
+    return load_derived('quantiles', QuantileSketch, path,
+                        columns=DIMENSOES_PERCENTIS + [MEDIDA_PERCENTIS], merge=merge_quantiles)
+
+
+def validate_quantiles(path=DATA_PATH, filtros=None, qs=PERCENTIS):
+    """Compara os percentis do sketch com os percentis exatos das linhas (pandas).
+
+        Output: dicionário com o limite de erro (LARGURA_FAIXA) e o maior erro absoluto
+                observado no total e na quebra por cidade e tráfego
+    """
+    from utils.dataset import load_dataset
+
+    if filtros is None:
+        filtros = [(None, None, None),
+                   (pd.Timestamp(2022, 3, 20), ['Low', 'Jam'], None),
+                   (pd.Timestamp(2022, 4, 6), ['High', 'Medium'], ['conditions Sunny', 'conditions Fog'])]
+    df1 = load_dataset(path, columns=DIMENSOES_PERCENTIS + [MEDIDA_PERCENTIS])
+    sketch = load_quantiles(path)
+    por_grupo = ['City', 'Road_traffic_density']
+    colunas = [percentile_name(q) for q in qs]
+    erros = {'total': 0.0, 'city_traffic': 0.0}
+    for date_slider, traffic_options, weather_condition in filtros:
+        linhas = filter_cube(df1, date_slider, traffic_options, weather_condition)
+        filtrado = sketch.filter(date_slider, traffic_options, weather_condition)
+
+        exato = linhas[MEDIDA_PERCENTIS].quantile(list(qs)).to_numpy()
+        erros['total'] = max(erros['total'], float(np.nanmax(np.abs(filtrado.quantiles(qs) - exato))))
+
+        exato = (linhas.groupby(por_grupo, observed=True)[MEDIDA_PERCENTIS]
+                 .quantile(list(qs)).unstack().reset_index().sort_values(por_grupo, ignore_index=True))
+        estimado = filtrado.quantiles_by(por_grupo, qs)
+        if len(exato) != len(estimado):
+            erros['city_traffic'] = float('inf')
+            continue
+        diferenca = np.abs(estimado[colunas].to_numpy() - exato[list(qs)].to_numpy())
+        erros['city_traffic'] = max(erros['city_traffic'], float(np.nanmax(diferenca, initial=0.0)))
+    return {'error_bound': LARGURA_FAIXA, 'max_error_total': erros['total'],
+            'max_error_city_traffic': erros['city_traffic']}
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(validate_quantiles(sys.argv[1] if len(sys.argv) > 1 else DATA_PATH))
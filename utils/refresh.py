@@ -0,0 +1,120 @@
+"""Atualização dos dados em segundo plano.
+
+Uma thread por csv verifica a versão dos dados no disco a cada INTERVALO_SEGUNDOS.
+Quando o csv muda (ou um lote é incorporado por outro processo), a versão nova é
+montada fora das requisições por utils.dataset.refresh_dataset (snapshot,
+dataframes, agregados em cache e, com CURRY_BACKEND=sqlite, o banco da versão) e
+publicada de uma vez. Até lá as páginas servem a última versão publicada; uma
+atualização que falha mantém a versão anterior e é tentada de novo no próximo ciclo.
+
+Só existe uma atualização em andamento por processo: várias sessões iniciando o
+agendador ou um refresh_now concorrente não refazem o mesmo trabalho.
+
+Configuração: CURRY_REFRESH_SECONDS (intervalo em segundos; 0 desliga a atualização
+em segundo plano e as páginas voltam a recarregar os dados na requisição)
+"""
+import logging
+import os
+import threading
+import time
+import traceback
+
+from utils.dataset import DATA_PATH, publish_version, refresh_dataset
+from utils.sqlstore import ensure_database, remove_old_databases, use_sql
+
+INTERVALO_SEGUNDOS = float(os.environ.get('CURRY_REFRESH_SECONDS', '30'))
+
+logger = logging.getLogger(__name__)
+
+# Agendadores em execução: caminho absoluto do csv -> RefreshScheduler
+_agendadores = {}
+_lock = threading.Lock()
+
+
+class RefreshScheduler(threading.Thread):
+    """Thread que atualiza os dados de um csv em segundo plano.
+
+        Input:
+            - path: caminho do csv
+            - interval: segundos entre as verificações
+            - on_refresh: função opcional chamada com a versão nova depois de publicada
+                          (ex.: recalcular os gráficos do estado padrão)
+    """
+
+    def __init__(self, path=DATA_PATH, interval=INTERVALO_SEGUNDOS, on_refresh=None):
+        super().__init__(name='curry-refresh', daemon=True)
+        self.path = path
+        self.interval = interval
+        self.on_refresh = on_refresh
+        self.last_error = None
+        self.refreshes = 0
+        self._parar = threading.Event()
+
+    def _prepare(self, version, files):
+        # O banco da versão nova fica pronto antes da troca, lido dos arquivos dessa versão
+        if use_sql():
+            ensure_database(self.path, version, files)
+
+    def refresh_now(self):
+        """Verifica o csv e, se ele mudou, monta e publica a versão nova.
+
+            Output: versão publicada ou None (nada mudou, outra atualização em andamento ou falha)
+        """
+        try:
+            inicio = time.perf_counter()
+            version = refresh_dataset(self.path, prepare=self._prepare)
+            if version is None:
+                return None
+            if use_sql():
+                remove_old_databases(self.path, {ensure_database(self.path)[0]})
+            self.refreshes += 1
+            self.last_error = None
+            logger.info('Dados atualizados em %.2f s', time.perf_counter() - inicio)
+            if self.on_refresh is not None:
+                self.on_refresh(version)
+            return version
+        except Exception:
+            # Continua servindo a última versão publicada
+            self.last_error = traceback.format_exc()
+            logger.exception('Atualização dos dados falhou')
+            return None
+
+    def run(self):
+        while not self._parar.wait(self.interval):
+            self.refresh_now()
+
+    def stop(self):
+        self._parar.set()
+
+
+def start_refresher(path=DATA_PATH, interval=None, on_refresh=None):
+    """Inicia (uma única vez por csv) a atualização em segundo plano e retorna o agendador.
+
+        A versão dos dados no disco passa a ser a versão publicada. Retorna None se a
+        atualização em segundo plano está desligada (CURRY_REFRESH_SECONDS=0).
+    """
+    interval = INTERVALO_SEGUNDOS if interval is None else interval
+    if interval <= 0:
+        return None
+    chave = os.path.abspath(path)
+    with _lock:
+        agendador = _agendadores.get(chave)
+        if agendador is None:
+            publish_version(path)
+            agendador = _agendadores[chave] = RefreshScheduler(path, interval, on_refresh)
+            agendador.start()
+        return agendador
+
+
+def refresh_error(path=DATA_PATH):
+    """Erro (traceback) da última tentativa de atualização do csv, ou None se ela deu certo."""
+    agendador = _agendadores.get(os.path.abspath(path))
+    return agendador.last_error if agendador is not None else None
+
+
+def stop_refresher(path=DATA_PATH):
+    """Para a atualização em segundo plano do csv (a versão publicada continua sendo servida)."""
+    with _lock:
+        agendador = _agendadores.pop(os.path.abspath(path), None)
+    if agendador is not None:
+        agendador.stop()
@@ -0,0 +1,95 @@
+"""Visões de linhas sem cópia sobre o dataset compartilhado do processo.
+
+O dataframe limpo de load_dataset é um só por processo e é compartilhado, somente
+leitura, por todas as sessões e páginas. Uma sessão não guarda um dataframe
+filtrado: guarda uma RowView, que é o dataframe compartilhado mais a seleção de
+linhas do motor de filtros (um slice ou um array de posições). As agregações das
+páginas leem só as colunas de que precisam, direto dos arrays compartilhados, e a
+memória de cada sessão fica limitada à seleção e aos resultados pequenos.
+
+Nenhuma página escreve no dataframe compartilhado: a distância de cada pedido já é
+uma coluna do snapshot e a semana do ano é calculada sobre o cubo diário.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.dataset import DATA_PATH, load_dataset, load_together
+from utils.filters import load_filter_engine
+
+
+class RowView:
+    """Seleção de linhas do dataset compartilhado, sem cópia do dataframe.
+
+        Input:
+            - df1: dataframe compartilhado (somente leitura)
+            - rows: slice ou array de posições (FilterEngine.select)
+    """
+
+    __slots__ = ('df1', 'rows')
+
+    def __init__(self, df1, rows=slice(None)):
+        self.df1 = df1
+        self.rows = rows
+
+    def __len__(self):
+        if isinstance(self.rows, slice):
+            return len(range(*self.rows.indices(len(self.df1))))
+        return len(self.rows)
+
+    def values(self, col, dtype=None):
+        """Valores da coluna nas linhas selecionadas (um slice é uma visão do array compartilhado)."""
+        valores = self.df1[col].to_numpy()[self.rows]
+        return valores if dtype is None else valores.astype(dtype, copy=False)
+
+    def codes(self, col):
+        """Códigos e categorias de uma coluna categórica nas linhas selecionadas."""
+        coluna = self.df1[col]
+        return coluna.cat.codes.to_numpy()[self.rows], coluna.cat.categories
+
+    def frame(self, columns=None):
+        """Dataframe com as colunas pedidas das linhas selecionadas (cópia: use só quando necessário)."""
+        columns = list(self.df1.columns) if columns is None else list(columns)
+        return pd.DataFrame({col: self.df1[col].iloc[self.rows].reset_index(drop=True)
+                             for col in columns})
+
+    def group_mean(self, by, metric):
+        """Esta função calcula a média da métrica por grupo de colunas categóricas, sem copiar as linhas.
+
+            Output: Dataframe como df.groupby(by, observed=True)[metric].mean().reset_index(),
+                    com os grupos na ordem dos códigos das categorias
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        chave = np.zeros(len(self), dtype=np.int64)
+        categorias = []
+        for col in by:
+            codes, categories = self.codes(col)
+            chave = chave * (len(categories) + 1) + (codes.astype(np.int64) + 1)
+            categorias.append(categories)
+
+        valores = self.values(metric, dtype=np.float64)
+        validos = ~np.isnan(valores)
+        chaves, grupo = np.unique(chave, return_inverse=True)
+        soma = np.bincount(grupo, weights=np.where(validos, valores, 0.0), minlength=len(chaves))
+        contagem = np.bincount(grupo, weights=validos, minlength=len(chaves))
+
+        df_aux = {}
+        for col, categories in zip(reversed(by), reversed(categorias)):
+            chaves, codes = np.divmod(chaves, len(categories) + 1)
+            df_aux[col] = pd.Categorical.from_codes(codes - 1, categories)
+        df_aux = pd.DataFrame({col: df_aux[col] for col in by})
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df_aux[metric] = np.where(contagem > 0, soma / contagem, np.nan)
+        # Como no groupby do pandas, grupos com alguma chave ausente são descartados
+        return df_aux.loc[df_aux[by].notna().all(axis=1).to_numpy()].reset_index(drop=True)
+
+
+def load_view(date_slider=None, traffic_options=None, weather_condition=None, columns=None,
+              path=DATA_PATH):
+    """Retorna a visão das linhas do dataset compartilhado que passam nos filtros da barra lateral.
+
+        O dataframe e o motor de filtros são lidos da mesma versão dos dados: uma atualização
+        publicada entre as duas leituras trocaria as posições das linhas.
+    """
+    engine, df1 = load_together(lambda: load_filter_engine(path),
+                                lambda: load_dataset(path, columns=columns))
+    return RowView(df1, engine.select(date_slider, traffic_options, weather_condition))
@@ -0,0 +1,307 @@
+"""Índice espacial em grade das localizações de restaurantes e de entrega.
+
+As coordenadas são agrupadas numa grade regular em graus, montada uma vez por versão
+dos dados (utils.dataset.load_derived) e atualizada com os lotes da ingestão
+incremental. A célula base (nível 0) tem GRADE_BASE graus; o nível k junta 2^k x 2^k
+células base, então a mesma grade responde mapas de densidade em qualquer escala.
+
+O índice guarda:
+    - cells: cubo espacial das entregas (dia x cidade x tráfego x célula base) com a
+      quantidade de pedidos e os agregados do tempo de entrega (utils.cube). O mapa de
+      densidade filtra e reagrupa estas células, sem voltar às linhas;
+    - deliveries e restaurants: os pontos ordenados pela chave da célula (PointGrid).
+      Numa mesma linha de latitude, as células vizinhas têm chaves consecutivas, então
+      os pontos de uma faixa de células são um bloco contínuo do array: uma consulta
+      por raio lê só as linhas de células do retângulo que envolve o círculo (busca
+      binária) e calcula a distância exata apenas desses candidatos.
+
+O restaurante mais próximo é procurado em raios que dobram a partir do tamanho de uma
+célula até haver candidatos suficientes dentro do círculo. Escolhemos a grade em graus
+em vez de geohash porque ela tem a mesma propriedade de vizinhança sem codificação em
+texto e reaproveita os bins inteiros do cubo. Retângulos que cruzam o antimeridiano
+usam todas as longitudes (correto, só mais candidatos).
+
+Uso (comparação com a varredura de todas as linhas): python -m utils.spatial [csv]
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.cube import build_cube, combine_cubes, filter_cube, rollup
+from utils.dataset import DATA_PATH, RAIO_TERRA_KM, concat_rows, haversine_km, load_derived
+
+# Tamanho da célula base (graus, ~1,1 km de latitude) e nível mais grosso do mapa de densidade
+GRADE_BASE = 0.01
+MAX_NIVEL = 14
+
+# Quilômetros por grau de latitude (e de longitude no equador)
+KM_POR_GRAU = np.pi * RAIO_TERRA_KM / 180
+
+# Metade da circunferência: um raio maior que este cobre todo o globo
+MAX_RAIO_KM = np.pi * RAIO_TERRA_KM
+
+# Colunas de uma linha de células na chave (longitudes em [-180, 180] cabem em 2^32 células)
+LARGURA_CHAVE = 1 << 32
+
+MEDIDA_ESPACIAL = 'Time_taken(min)'
+DIMENSOES_ESPACIAIS = ['Order_Date', 'City', 'Road_traffic_density', 'lat_bin', 'lng_bin']
+COLUNAS_ESPACIAIS = ['Order_Date', 'City', 'Road_traffic_density', MEDIDA_ESPACIAL,
+                     'Restaurant_latitude', 'Restaurant_longitude',
+                     'Delivery_location_latitude', 'Delivery_location_longitude']
+
+
+def cell_bins(lat, lng, grade=GRADE_BASE):
+    """Linha e coluna (inteiros) da célula de cada coordenada; a célula (i, j) começa em (i * grade, j * grade)."""
+    return (np.floor(np.asarray(lat, dtype=np.float64) / grade).astype(np.int64),
+            np.floor(np.asarray(lng, dtype=np.float64) / grade).astype(np.int64))
+
+
+def cell_key(lat_bin, lng_bin):
+    """Chave inteira da célula: células vizinhas na mesma linha de latitude têm chaves consecutivas."""
+    return lat_bin * LARGURA_CHAVE + (lng_bin + LARGURA_CHAVE // 2)
+
+
+class PointGrid:
+    """Pontos ordenados pela chave da célula da grade.
+
+        Input:
+            - data: Dataframe com as colunas 'lat' e 'lng' (graus) e as colunas extras
+                    devolvidas pelas consultas; pontos sem coordenada são descartados
+            - grade: tamanho da célula (graus)
+    """
+
+    def __init__(self, data, grade=GRADE_BASE):
+        self.grade = grade
+        data = data.loc[data['lat'].notna().to_numpy() & data['lng'].notna().to_numpy()]
+        chaves = cell_key(*cell_bins(data['lat'], data['lng'], grade))
+        ordem = np.argsort(chaves, kind='stable')
+        self.keys = chaves[ordem]
+        self.data = data.iloc[ordem].reset_index(drop=True)
+        self.lat = self.data['lat'].to_numpy(dtype=np.float64)
+        self.lng = self.data['lng'].to_numpy(dtype=np.float64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def merge(self, other):
+        """Une os pontos de duas grades de mesmo tamanho de célula."""
+        if other.grade != self.grade:
+            raise ValueError('Grades com tamanhos de célula diferentes não podem ser combinadas.')
+        return PointGrid(concat_rows([self.data, other.data]), self.grade)
+
+    def candidates(self, lat, lng, km):
+        """Posições dos pontos nas células do retângulo que envolve o círculo (lat, lng, km)."""
+        dlat = km / KM_POR_GRAU
+        cosseno = np.cos(np.radians(min(abs(lat) + dlat, 90.0)))
+        dlng = km / (KM_POR_GRAU * cosseno) if cosseno > 1e-9 else 360.0
+        linha_min, coluna_min = cell_bins(max(lat - dlat, -90.0), lng - dlng, self.grade)
+        linha_max, coluna_max = cell_bins(min(lat + dlat, 90.0), lng + dlng, self.grade)
+        if lng - dlng < -180 or lng + dlng > 180:
+            coluna_min, coluna_max = cell_bins(0, [-180.0, 180.0], self.grade)[1]
+
+        linhas = np.arange(linha_min, linha_max + 1, dtype=np.int64)
+        inicios = np.searchsorted(self.keys, cell_key(linhas, coluna_min), side='left')
+        fins = np.searchsorted(self.keys, cell_key(linhas, coluna_max), side='right')
+        tamanhos = fins - inicios
+        if tamanhos.sum() == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Concatena os intervalos [início, fim) de cada linha de células sem laço em Python
+        tamanhos, inicios = tamanhos[tamanhos > 0], inicios[tamanhos > 0]
+        deslocamento = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos)
+        return np.arange(tamanhos.sum(), dtype=np.int64) + deslocamento
+
+    def within(self, lat, lng, km):
+        """Posições (em self.data) e distâncias (km) dos pontos a até km de (lat, lng)."""
+        posicoes = self.candidates(lat, lng, km)
+        distancias = haversine_km(lat, lng, self.lat[posicoes], self.lng[posicoes])
+        dentro = distancias <= km
+        return posicoes[dentro], distancias[dentro]
+
+    def nearest(self, lat, lng, k=1):
+        """Posições e distâncias dos k pontos mais próximos de (lat, lng), do mais próximo ao mais distante."""
+        k = min(k, len(self))
+        raio = self.grade * KM_POR_GRAU
+        while True:
+            posicoes, distancias = self.within(lat, lng, raio)
+            # Dentro do círculo todos os pontos mais próximos que o k-ésimo já foram vistos
+            if len(posicoes) >= k or raio >= MAX_RAIO_KM:
+                ordem = np.argsort(distancias, kind='stable')[:k]
+                return posicoes[ordem], distancias[ordem]
+            raio *= 2
+
+
+def _restaurant_points(df1):
+    """Um ponto por local de restaurante, com a quantidade de pedidos e a soma dos tempos de entrega."""
+    df_aux = pd.DataFrame({'lat': df1['Restaurant_latitude'].to_numpy(dtype=np.float64),
+                           'lng': df1['Restaurant_longitude'].to_numpy(dtype=np.float64),
+                           'orders': np.ones(len(df1), dtype=np.int64),
+                           'time_count': df1[MEDIDA_ESPACIAL].notna().to_numpy().astype(np.int64),
+                           'time_sum': df1[MEDIDA_ESPACIAL].fillna(0).to_numpy(dtype=np.float64)})
+    return df_aux.groupby(['lat', 'lng'], sort=False).sum().reset_index()
+
+
+class SpatialIndex:
+    """Índice em grade das entregas e dos restaurantes de um conjunto de pedidos.
+
+        Input:
+            - df1: pedidos com as colunas COLUNAS_ESPACIAIS
+            - grade: tamanho da célula base (graus)
+    """
+
+    def __init__(self, df1, grade=GRADE_BASE):
+        self.grade = grade
+        if df1 is None:
+            return
+        lat = df1['Delivery_location_latitude'].to_numpy(dtype=np.float64)
+        lng = df1['Delivery_location_longitude'].to_numpy(dtype=np.float64)
+
+        df_aux = df1.loc[:, ['Order_Date', 'City', 'Road_traffic_density', MEDIDA_ESPACIAL]].copy()
+        df_aux['lat_bin'], df_aux['lng_bin'] = cell_bins(lat, lng, grade)
+        validos = ~(np.isnan(lat) | np.isnan(lng))
+        self.cells = build_cube(df_aux.loc[validos], DIMENSOES_ESPACIAIS, [MEDIDA_ESPACIAL])
+
+        entregas = df1.loc[:, ['Order_Date', 'City', 'Road_traffic_density', MEDIDA_ESPACIAL]].copy()
+        entregas.insert(0, 'lat', lat)
+        entregas.insert(1, 'lng', lng)
+        self.deliveries = PointGrid(entregas.reset_index(drop=True), grade)
+        self.restaurants = PointGrid(_restaurant_points(df1), grade)
+
+    def merge(self, other):
+        """Combina dois índices com a mesma célula base (união dos pedidos)."""
+        novo = SpatialIndex(None, self.grade)
+        novo.cells = combine_cubes([self.cells, other.cells])
+        novo.deliveries = self.deliveries.merge(other.deliveries)
+        # Restaurantes já conhecidos somam os pedidos novos
+        novo.restaurants = PointGrid(concat_rows([self.restaurants.data, other.restaurants.data])
+                                     .groupby(['lat', 'lng'], sort=False).sum().reset_index(), self.grade)
+        return novo
+
+    def center(self):
+        """Latitude e longitude medianas das células de entrega ocupadas (ponto inicial das buscas)."""
+        if len(self.cells) == 0:
+            return 0.0, 0.0
+        return ((float(self.cells['lat_bin'].median()) + 0.5) * self.grade,
+                (float(self.cells['lng_bin'].median()) + 0.5) * self.grade)
+
+    def density(self, level=0, date_slider=None, traffic_options=None):
+        """Esta função calcula a densidade das entregas nas células do nível pedido.
+
+            Input:
+                - level: nível da grade (célula de grade * 2^level graus)
+                - date_slider, traffic_options: filtros da barra lateral (None não filtra)
+            Output: Dataframe com 'lat' e 'lng' do centro da célula, 'orders' e as estatísticas
+                    do tempo de entrega ('count', 'mean', 'std', 'min', 'max')
+        """
+        cells = filter_cube(self.cells, date_slider, traffic_options)
+        cells = cells.assign(lat_bin=cells['lat_bin'].to_numpy() >> level,
+                             lng_bin=cells['lng_bin'].to_numpy() >> level)
+        df_aux = rollup(cells, ['lat_bin', 'lng_bin'], MEDIDA_ESPACIAL)
+        tamanho = self.grade * (1 << level)
+        df_aux.insert(0, 'lat', (df_aux.pop('lat_bin') + 0.5) * tamanho)
+        df_aux.insert(1, 'lng', (df_aux.pop('lng_bin') + 0.5) * tamanho)
+        return df_aux
+
+    def density_level(self, max_cells, date_slider=None, traffic_options=None):
+        """Menor nível da grade com no máximo max_cells células ocupadas depois dos filtros."""
+        cells = filter_cube(self.cells, date_slider, traffic_options)
+        linhas = cells['lat_bin'].to_numpy()
+        colunas = cells['lng_bin'].to_numpy()
+        for level in range(MAX_NIVEL + 1):
+            if len(np.unique(cell_key(linhas >> level, colunas >> level))) <= max_cells:
+                return level
+        return MAX_NIVEL
+
+    def deliveries_within(self, lat, lng, km, date_slider=None, traffic_options=None):
+        """Esta função resume as entregas a até km de (lat, lng) que passam nos filtros.
+
+            Output: Series com 'orders' e as estatísticas do tempo de entrega (como utils.cube.overall)
+        """
+        posicoes, distancias = self.deliveries.within(lat, lng, km)
+        df_aux = filter_cube(self.deliveries.data.iloc[posicoes], date_slider, traffic_options)
+        tempos = df_aux[MEDIDA_ESPACIAL].astype('float64')
+        return pd.Series({'orders': len(df_aux), 'count': tempos.count(), 'mean': tempos.mean(),
+                          'std': tempos.std(), 'min': tempos.min(), 'max': tempos.max()})
+
+    def _restaurant_table(self, posicoes, distancias):
+        df_aux = self.restaurants.data.iloc[posicoes].reset_index(drop=True)
+        df_aux['distance_km'] = distancias
+        df_aux['avg_time'] = (df_aux['time_sum'] / df_aux['time_count']).where(df_aux['time_count'] > 0)
+        return df_aux.loc[:, ['lat', 'lng', 'distance_km', 'orders', 'avg_time']]
+
+    def restaurants_within(self, lat, lng, km):
+        """Restaurantes a até km de (lat, lng), do mais próximo ao mais distante.
+
+            Output: Dataframe com 'lat', 'lng', 'distance_km', 'orders' e 'avg_time'
+        """
+        posicoes, distancias = self.restaurants.within(lat, lng, km)
+        ordem = np.argsort(distancias, kind='stable')
+        return self._restaurant_table(posicoes[ordem], distancias[ordem])
+
+    def nearest_restaurants(self, lat, lng, k=1):
+        """Os k restaurantes mais próximos de (lat, lng) (mesmas colunas de restaurants_within)."""
+        return self._restaurant_table(*self.restaurants.nearest(lat, lng, k))
+
+
+def merge_spatial(index, df_new):
+    """Atualiza o índice com pedidos novos, indexando apenas as linhas novas."""
+    return index.merge(SpatialIndex(df_new, index.grade))
+
+
+def load_spatial(path=DATA_PATH):
+    """Esta função retorna o índice espacial dos pedidos, montado uma vez por versão dos dados."""
+    return load_derived('spatial', SpatialIndex, path, columns=COLUNAS_ESPACIAIS,
+                        merge=merge_spatial)
+
+
+def validate_spatial(path=DATA_PATH, consultas=20, km=5.0, seed=0):
+    """Compara as consultas do índice com a varredura de todas as linhas.
+
+        Output: dicionário com as divergências encontradas (todas devem ser zero) e o
+                tempo médio (ms) de cada consulta no índice e na varredura
+    """
+    from utils.dataset import load_dataset
+
+    df1 = load_dataset(path, columns=COLUNAS_ESPACIAIS)
+    index = load_spatial(path)
+    entrega = (df1['Delivery_location_latitude'].to_numpy(dtype=np.float64),
+               df1['Delivery_location_longitude'].to_numpy(dtype=np.float64))
+    restaurante = (df1['Restaurant_latitude'].to_numpy(dtype=np.float64),
+                   df1['Restaurant_longitude'].to_numpy(dtype=np.float64))
+    # Centros das consultas: locais de entrega sorteados
+    sorteio = np.random.default_rng(seed).choice(len(df1), size=min(consultas, len(df1)), replace=False)
+
+    tempos = {'radius_index': 0.0, 'radius_scan': 0.0, 'nearest_index': 0.0, 'nearest_scan': 0.0}
+    erros = {'radius_orders': 0, 'radius_mean_time': 0.0, 'nearest_km': 0.0}
+    for i in sorteio:
+        lat, lng = entrega[0][i], entrega[1][i]
+
+        inicio = time.perf_counter()
+        resumo = index.deliveries_within(lat, lng, km)
+        tempos['radius_index'] += time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        dentro = haversine_km(lat, lng, *entrega) <= km
+        exato = df1.loc[dentro, MEDIDA_ESPACIAL].astype('float64')
+        tempos['radius_scan'] += time.perf_counter() - inicio
+        erros['radius_orders'] = max(erros['radius_orders'], abs(int(resumo['orders']) - int(dentro.sum())))
+        erros['radius_mean_time'] = max(erros['radius_mean_time'], abs(float(resumo['mean'] - exato.mean())))
+
+        inicio = time.perf_counter()
+        proximo = index.nearest_restaurants(lat, lng, k=1)
+        tempos['nearest_index'] += time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        exato = np.nanmin(haversine_km(lat, lng, *restaurante))
+        tempos['nearest_scan'] += time.perf_counter() - inicio
+        erros['nearest_km'] = max(erros['nearest_km'], abs(float(proximo['distance_km'].iloc[0]) - exato))
+
+    erros['density_orders'] = int(index.density(3)['orders'].sum()
+                                  - (~(np.isnan(entrega[0]) | np.isnan(entrega[1]))).sum())
+    resultado = dict(erros)
+    resultado.update({nome + '_ms': round(1000 * total / len(sorteio), 3) for nome, total in tempos.items()})
+    return resultado
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(validate_spatial(sys.argv[1] if len(sys.argv) > 1 else DATA_PATH))
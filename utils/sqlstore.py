@@ -0,0 +1,528 @@
+"""Backend SQL embarcado (SQLite) para os filtros e agregações das páginas.
+
+Com CURRY_BACKEND=sqlite, o dataset limpo é gravado uma vez por versão dos dados
+num banco SQLite ao lado do csv (train.<versão>.sqlite), em lotes de tamanho limitado:
+    - tabela 'pedidos': as colunas usadas pelas páginas, uma linha por pedido;
+    - tabela 'cubo': o cubo diário (utils.cube) agregado pelo próprio SQLite;
+    - tabela 'histograma': os histogramas do tempo de entrega por célula (utils.quantiles).
+
+Os filtros da barra lateral viram cláusulas WHERE e as agregações (cubo filtrado,
+entregadores distintos, médias e top-k por entregador) rodam no banco: o processo
+do Streamlit recebe apenas os resultados pequenos e não carrega os pedidos em
+memória. O caminho em pandas (padrão, CURRY_BACKEND=pandas) continua sendo a
+referência: validate_sql (e tests/test_sqlstore.py) compara os dois.
+
+Cada thread (sessão do Streamlit) usa a sua própria conexão somente leitura com o
+banco já publicado: uma requisição nunca monta o banco e falha se ele não existe.
+Cada versão dos dados tem o seu arquivo: o banco de uma versão nova é montado
+(por utils.refresh, fora das requisições) enquanto as páginas consultam o da versão
+publicada, e os bancos de versões antigas são apagados depois.
+O mapa da visão empresa continua no caminho em pandas.
+
+Uso (comparação com o caminho em pandas): python -m utils.sqlstore [csv]
+"""
+import datetime
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.cube import AGREGADOS, DIMENSOES, MEDIDAS, filter_cube, load_cube
+from utils.dataset import (DATA_PATH, dataset_version, ensure_snapshot, pq, snapshot_files,
+                           version_label)
+from utils.distinct import DIMENSOES_DISTINCT, load_distinct
+from utils.quantiles import (DIMENSOES_PERCENTIS, LARGURA_FAIXA, LIMITE_INFERIOR, LIMITE_SUPERIOR,
+                             MEDIDA_PERCENTIS, QuantileSketch, load_quantiles)
+from utils.streaming import iter_clean_chunks
+from utils.timing import span
+
+BACKENDS = ('pandas', 'sqlite')
+BACKEND = os.environ.get('CURRY_BACKEND', 'pandas')
+
+# Colunas da tabela de pedidos
+COLUNAS_SQL = DIMENSOES + MEDIDAS + ['Delivery_person_ID']
+
+# Colunas guardadas como texto (as demais são números)
+COLUNAS_TEXTO = ['Order_Date', 'City', 'Road_traffic_density', 'Weatherconditions',
+                 'Festival', 'Type_of_order', 'Delivery_person_ID']
+
+# Linhas gravadas por lote na carga do banco
+LINHAS_POR_LOTE = 200_000
+
+# Datas gravadas como texto comparável com os filtros de data
+FORMATO_DATA = '%Y-%m-%d %H:%M:%S'
+
+_lock = threading.RLock()
+# Versão dos dados gravada em cada banco: caminho do banco -> versão
+_versoes = {}
+
+
+class _Conexoes(threading.local):
+    """Conexões somente leitura de cada thread: caminho do banco -> (versão, conexão)."""
+
+    def __init__(self):
+        self.abertas = {}
+
+
+_conexoes = _Conexoes()
+
+
+def use_sql():
+    """Indica se as páginas devem consultar o backend SQL."""
+    if BACKEND not in BACKENDS:
+        raise ValueError('CURRY_BACKEND deve ser um de %s, não %r.' % (BACKENDS, BACKEND))
+    return BACKEND == 'sqlite'
+
+
+def _q(col):
+    """Nome de coluna entre aspas (algumas têm parênteses, como 'Time_taken(min)')."""
+    return '"%s"' % col
+
+
+def database_path(path=DATA_PATH, version=None):
+    """Retorna o caminho do banco SQLite de uma versão dos dados do csv (None: a versão servida)."""
+    version = dataset_version(path) if version is None else version
+    return '%s.%s.sqlite' % (os.path.splitext(path)[0], version_label(version))
+
+
+def _version_text(version):
+    return json.dumps(list(version))
+
+
+def _batches(path, files=None):
+    """Lotes do dataset limpo com as colunas do banco: do snapshot (com pyarrow) ou do csv em blocos.
+
+        files: arquivos do snapshot a ler (None: os do snapshot atual do csv)
+    """
+    if pq is not None:
+        if files is None:
+            ensure_snapshot(path)
+            files = snapshot_files(path)
+        for arquivo in files:
+            for lote in pq.ParquetFile(arquivo).iter_batches(LINHAS_POR_LOTE, columns=COLUNAS_SQL):
+                yield lote.to_pandas()
+    else:
+        for _, df1 in iter_clean_chunks(path, LINHAS_POR_LOTE):
+            yield df1.loc[:, COLUNAS_SQL]
+
+
+def _to_sql_frame(df1):
+    """Converte um lote para os tipos do banco: datas e categorias como texto, números como float/int."""
+    df_aux = df1.loc[:, COLUNAS_SQL].copy()
+    df_aux['Order_Date'] = df_aux['Order_Date'].dt.strftime(FORMATO_DATA)
+    for col in COLUNAS_TEXTO[1:]:
+        df_aux[col] = df_aux[col].astype(object).where(df_aux[col].notna(), None)
+    for col in MEDIDAS:
+        df_aux[col] = df_aux[col].astype('float64')
+    return df_aux
+
+
+def _cube_sql():
+    """SELECT que agrega a tabela de pedidos no formato do cubo (utils.cube.build_cube)."""
+    colunas = [_q(dim) for dim in DIMENSOES] + ['COUNT(*) AS orders']
+    for measure in MEDIDAS:
+        m = _q(measure)
+        colunas += ['COUNT(%s) AS %s' % (m, _q(measure + '_count')),
+                    'SUM(%s) AS %s' % (m, _q(measure + '_sum')),
+                    'SUM(%s * %s) AS %s' % (m, m, _q(measure + '_sumsq')),
+                    'MIN(%s) AS %s' % (m, _q(measure + '_min')),
+                    'MAX(%s) AS %s' % (m, _q(measure + '_max'))]
+    dims = ', '.join(_q(dim) for dim in DIMENSOES)
+    return 'SELECT %s FROM pedidos GROUP BY %s' % (', '.join(colunas), dims)
+
+
+def _histogram_sql():
+    """SELECT que agrega a tabela de pedidos nos histogramas de utils.quantiles (mesmas faixas de bin_index)."""
+    m = _q(MEDIDA_PERCENTIS)
+    n_faixas = int(np.ceil((LIMITE_SUPERIOR - LIMITE_INFERIOR) / LARGURA_FAIXA))
+    # Truncar difere do floor só abaixo de LIMITE_INFERIOR, que cai na primeira faixa de qualquer forma
+    faixa = 'MIN(MAX(CAST((%s - %r) / %r AS INTEGER), 0), %d)' % (
+        m, float(LIMITE_INFERIOR), float(LARGURA_FAIXA), n_faixas - 1)
+    dims = ', '.join(_q(dim) for dim in DIMENSOES_PERCENTIS)
+    return ('SELECT %s, %s AS bin, COUNT(*) AS count, SUM(%s) AS sum FROM pedidos '
+            'WHERE %s IS NOT NULL GROUP BY %s, bin' % (dims, faixa, m, m, dims))
+
+
+def build_database(path=DATA_PATH, version=None, files=None):
+    """Esta função grava o dataset limpo no banco SQLite (de forma atômica) e retorna o caminho do banco.
+
+        Os pedidos são gravados em lotes de LINHAS_POR_LOTE linhas, então a memória usada
+        não depende do tamanho do histórico. O cubo é agregado pelo próprio SQLite.
+        version: versão dos dados gravada no banco (None: a versão servida)
+        files: arquivos do snapshot dessa versão (None: os do snapshot atual, ver _batches)
+    """
+    version = dataset_version(path) if version is None else version
+    destino = database_path(path, version)
+    tmp_path = '{}.{}.tmp'.format(destino, os.getpid())
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    versao = _version_text(version)
+    con = sqlite3.connect(tmp_path)
+    try:
+        tipos = ['%s %s' % (_q(col), 'TEXT' if col in COLUNAS_TEXTO else 'REAL')
+                 for col in COLUNAS_SQL]
+        con.execute('CREATE TABLE pedidos (%s)' % ', '.join(tipos))
+        with span('sql.load') as medicao:
+            linhas = 0
+            for lote in _batches(path, files):
+                lote = _to_sql_frame(lote)
+                con.executemany('INSERT INTO pedidos VALUES (%s)' % ', '.join('?' * len(COLUNAS_SQL)),
+                                lote.itertuples(index=False, name=None))
+                linhas += len(lote)
+            medicao.rows_out = linhas
+
+        with span('sql.cube'):
+            con.execute('CREATE TABLE cubo AS ' + _cube_sql())
+            con.execute('CREATE TABLE histograma AS ' + _histogram_sql())
+        # Índices dos filtros da barra lateral (a data aparece em todas as combinações)
+        con.execute('CREATE INDEX pedidos_data ON pedidos ("Order_Date")')
+        con.execute('CREATE INDEX pedidos_filtros ON pedidos '
+                    '("Road_traffic_density", "Weatherconditions", "Order_Date")')
+        con.execute('CREATE INDEX cubo_data ON cubo ("Order_Date")')
+        con.execute('CREATE INDEX histograma_data ON histograma ("Order_Date")')
+        con.execute('CREATE TABLE meta (chave TEXT PRIMARY KEY, valor TEXT)')
+        con.execute("INSERT INTO meta VALUES ('version', ?)", (versao,))
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp_path, destino)
+    _versoes[destino] = versao
+    return destino
+
+
+def _stored_version(destino):
+    """Versão dos dados gravada no banco (None se o banco não existe ou é de outro formato)."""
+    if not os.path.exists(destino):
+        return None
+    try:
+        con = sqlite3.connect('file:%s?mode=ro' % destino, uri=True)
+        try:
+            return con.execute("SELECT valor FROM meta WHERE chave = 'version'").fetchone()[0]
+        finally:
+            con.close()
+    except (sqlite3.Error, TypeError):
+        return None
+
+
+def remove_old_databases(path=DATA_PATH, keep=()):
+    """Apaga os bancos de outras versões do csv, exceto os caminhos em keep.
+
+        Conexões já abertas num banco apagado continuam lendo o arquivo até serem
+        reabertas (onde o sistema não permite apagar um arquivo aberto, ele fica para a próxima vez).
+    """
+    for arquivo in glob.glob(glob.escape(os.path.splitext(path)[0]) + '.*.sqlite'):
+        if arquivo not in keep:
+            try:
+                os.remove(arquivo)
+            except OSError:
+                pass
+            _versoes.pop(arquivo, None)
+
+
+def ensure_database(path=DATA_PATH, version=None, files=None):
+    """Monta o banco da versão dos dados (None: a versão servida) se ele ainda não existe.
+
+        files: arquivos do snapshot da versão (None: os do snapshot atual, ver _batches)
+        Output: (caminho, versão gravada no banco)
+    """
+    version = dataset_version(path) if version is None else version
+    destino = database_path(path, version)
+    versao = _version_text(version)
+    if _versoes.get(destino) == versao:
+        return destino, versao
+    with _lock:
+        if _versoes.get(destino) != versao:
+            _versoes[destino] = _stored_version(destino)
+        if _versoes[destino] != versao:
+            build_database(path, version, files)
+            # Mantém só o banco servido e o recém-montado
+            remove_old_databases(path, {destino, database_path(path)})
+    return destino, versao
+
+
+def published_database(path=DATA_PATH):
+    """Retorna o banco da versão servida dos dados sem montá-lo.
+
+        O banco é montado fora das requisições (ensure_database: utils.warmup,
+        utils.export.load_all e a atualização em segundo plano antes de publicar a versão).
+        Output: (caminho, versão gravada no banco); RuntimeError se ele não existe
+    """
+    destino = database_path(path)
+    versao = _version_text(dataset_version(path))
+    if _versoes.get(destino) != versao:
+        _versoes[destino] = _stored_version(destino)
+        if _versoes[destino] != versao:
+            raise RuntimeError('O banco SQLite da versão servida dos dados não existe (%s). Ele é '
+                               'montado fora das requisições: suba o dashboard com python -m '
+                               'utils.warmup ou rode ensure_database antes.' % destino)
+    return destino, versao
+
+
+def connect(path=DATA_PATH):
+    """Retorna a conexão somente leitura desta thread com o banco publicado da versão atual dos dados."""
+    destino, versao = published_database(path)
+    aberta = _conexoes.abertas.get(destino)
+    if aberta is None or aberta[0] != versao:
+        if aberta is not None:
+            aberta[1].close()
+        con = sqlite3.connect('file:%s?mode=ro' % destino, uri=True)
+        # Tabelas temporárias (grupos de células) ficam na memória da conexão
+        con.execute('PRAGMA temp_store = MEMORY')
+        aberta = _conexoes.abertas[destino] = (versao, con)
+    return aberta[1]
+
+
+def where_clause(date_slider=None, traffic_options=None, weather_condition=None, prefix=''):
+    """Esta função traduz os filtros da barra lateral numa cláusula WHERE (como filter_cube).
+
+        Output: (texto da cláusula, parâmetros); filtros com valor None não são aplicados
+    """
+    condicoes, params = [], []
+    if date_slider is not None:
+        condicoes.append('%s"Order_Date" < ?' % prefix)
+        params.append(pd.Timestamp(date_slider).strftime(FORMATO_DATA))
+    for col, valores in (('Road_traffic_density', traffic_options),
+                         ('Weatherconditions', weather_condition)):
+        if valores is not None:
+            condicoes.append('%s%s IN (%s)' % (prefix, _q(col), ', '.join('?' * len(valores))))
+            params.extend(valores)
+    return ('WHERE ' + ' AND '.join(condicoes)) if condicoes else '', params
+
+
+def _from_sql(df_aux):
+    """Converte datas e dimensões de texto de um resultado para os tipos do caminho em pandas."""
+    for col in df_aux.columns:
+        if col == 'Order_Date':
+            df_aux[col] = pd.to_datetime(df_aux[col], format=FORMATO_DATA)
+        elif col in COLUNAS_TEXTO:
+            df_aux[col] = df_aux[col].astype('category')
+    return df_aux
+
+
+def query(sql, params=(), path=DATA_PATH):
+    """Executa uma consulta no banco e retorna o resultado como dataframe."""
+    with span('sql.query') as medicao:
+        cursor = connect(path).execute(sql, params)
+        colunas = [descricao[0] for descricao in cursor.description]
+        df_aux = pd.DataFrame.from_records(cursor.fetchall(), columns=colunas)
+        medicao.rows_out = len(df_aux)
+    return df_aux
+
+
+def query_cube(date_slider=None, traffic_options=None, weather_condition=None, path=DATA_PATH):
+    """Esta função retorna as células do cubo que passam nos filtros (como filter_cube(load_cube(), ...))."""
+    where, params = where_clause(date_slider, traffic_options, weather_condition)
+    dims = ', '.join(_q(dim) for dim in DIMENSOES)
+    cube = _from_sql(query('SELECT * FROM cubo %s ORDER BY %s' % (where, dims), params, path))
+    for col in cube.columns:
+        if col == 'orders' or col.endswith('_count'):
+            cube[col] = cube[col].astype(np.int64)
+        elif any(col.endswith(sufixo) for sufixo in AGREGADOS):
+            cube[col] = cube[col].astype(np.float64)
+    return cube
+
+
+def query_quantiles(date_slider=None, traffic_options=None, weather_condition=None, path=DATA_PATH):
+    """Esta função retorna o sketch de percentis das células que passam nos filtros, lido do banco."""
+    where, params = where_clause(date_slider, traffic_options, weather_condition)
+    df_bins = _from_sql(query('SELECT * FROM histograma %s' % where, params, path))
+    return QuantileSketch.from_bins(df_bins)
+
+
+class SqlDistinct:
+    """Entregadores distintos (contagem exata) dos pedidos que passam nos filtros, calculados no banco.
+
+        Tem a mesma interface usada pelas páginas do DistinctSketch filtrado: cells, count() e count_by().
+    """
+
+    def __init__(self, date_slider=None, traffic_options=None, weather_condition=None,
+                 path=DATA_PATH):
+        self.path = path
+        self.filters = (date_slider, traffic_options, weather_condition)
+        self.where, self.params = where_clause(*self.filters)
+        dims = ', '.join(_q(dim) for dim in DIMENSOES_DISTINCT)
+        self.cells = _from_sql(query('SELECT %s FROM cubo %s GROUP BY %s ORDER BY %s'
+                                     % (dims, self.where, dims, dims), self.params, path))
+
+    def count(self):
+        """Quantidade de entregadores distintos em todas as células."""
+        sql = 'SELECT COUNT(DISTINCT "Delivery_person_ID") FROM pedidos %s' % self.where
+        return int(connect(self.path).execute(sql, self.params).fetchone()[0])
+
+    def count_by(self, by):
+        """Quantidade de entregadores distintos por grupo de células.
+
+            Input: by - nome de uma dimensão ou valores do grupo de cada célula (alinhados com cells)
+            Output: Series com a quantidade por grupo, ordenada pelo grupo
+        """
+        con = connect(self.path)
+        if isinstance(by, str):
+            nome = by
+            where, params = self.where, self.params
+            sql = ('SELECT %s AS grupo, COUNT(DISTINCT "Delivery_person_ID") AS n FROM pedidos %s '
+                   'GROUP BY 1' % (_q(by), where))
+        else:
+            # Grupo de cada célula numa tabela temporária, juntada aos pedidos pelas dimensões
+            nome = None
+            celulas = self.cells.assign(grupo=list(by))
+            celulas['Order_Date'] = celulas['Order_Date'].dt.strftime(FORMATO_DATA)
+            con.execute('CREATE TEMP TABLE IF NOT EXISTS grupos_celulas (%s, grupo)'
+                        % ', '.join(_q(dim) for dim in DIMENSOES_DISTINCT))
+            con.execute('DELETE FROM grupos_celulas')
+            con.executemany('INSERT INTO grupos_celulas VALUES (%s)'
+                            % ', '.join('?' * (len(DIMENSOES_DISTINCT) + 1)),
+                            celulas.astype(object).itertuples(index=False, name=None))
+            juncao = ' AND '.join('p.{0} IS g.{0}'.format(_q(dim)) for dim in DIMENSOES_DISTINCT)
+            where, params = where_clause(*self.filters, prefix='p.')
+            sql = ('SELECT g.grupo, COUNT(DISTINCT p."Delivery_person_ID") AS n '
+                   'FROM pedidos AS p JOIN grupos_celulas AS g ON %s %s GROUP BY 1' % (juncao, where))
+        df_aux = pd.DataFrame(con.execute(sql, params).fetchall(), columns=['grupo', 'n'])
+        df_aux = df_aux.sort_values('grupo', ignore_index=True)
+        return pd.Series(df_aux['n'].to_numpy(dtype=np.int64),
+                         index=pd.Index(df_aux['grupo'].to_numpy(), name=nome), name='Delivery_person_ID')
+
+
+def query_deliverer_means(metric, by=(), date_slider=None, traffic_options=None,
+                          weather_condition=None, path=DATA_PATH):
+    """Média da métrica por entregador (e pelas dimensões em by) dos pedidos que passam nos filtros."""
+    by = [by] if isinstance(by, str) else list(by)
+    where, params = where_clause(date_slider, traffic_options, weather_condition)
+    chaves = ', '.join(_q(col) for col in by + ['Delivery_person_ID'])
+    return _from_sql(query('SELECT %s, AVG(%s) AS %s FROM pedidos %s GROUP BY %s ORDER BY %s'
+                           % (chaves, _q(metric), _q(metric), where, chaves, chaves), params, path))
+
+
+def query_top_k(metric, by, k=10, date_slider=None, traffic_options=None, weather_condition=None,
+                path=DATA_PATH):
+    """Esta função calcula no banco os k entregadores de menor e de maior média da métrica em cada grupo.
+
+        Output: (menores, maiores) - como utils.topk.top_k_per_group sobre as médias por entregador;
+                empates são resolvidos pelo ID do entregador (no pandas, pela ordem das linhas)
+    """
+    where, params = where_clause(date_slider, traffic_options, weather_condition)
+    g, m = _q(by), _q(metric)
+    medias = ('SELECT %s, "Delivery_person_ID", AVG(%s) AS %s FROM pedidos %s GROUP BY 1, 2'
+              % (g, m, m, where))
+    resultado = []
+    for ordem in ('ASC', 'DESC'):
+        sql = ('SELECT %s, "Delivery_person_ID", %s FROM ('
+               'SELECT *, ROW_NUMBER() OVER (PARTITION BY %s ORDER BY %s %s, "Delivery_person_ID") AS posicao '
+               'FROM (%s) WHERE %s IS NOT NULL) WHERE posicao <= ? ORDER BY %s, posicao'
+               % (g, m, g, m, ordem, medias, m, g))
+        resultado.append(_from_sql(query(sql, params + [k], path)))
+    return tuple(resultado)
+
+
+def filtered_cube(date_slider=None, traffic_options=None, weather_condition=None, path=DATA_PATH):
+    """Cubo filtrado pelo backend configurado: consulta SQL ou filter_cube sobre o cubo em cache."""
+    if use_sql():
+        return query_cube(date_slider, traffic_options, weather_condition, path)
+    return filter_cube(load_cube(path), date_slider, traffic_options, weather_condition)
+
+
+def filtered_distinct(date_slider=None, traffic_options=None, weather_condition=None, path=DATA_PATH):
+    """Entregadores distintos filtrados pelo backend configurado: SqlDistinct ou o sketch em cache."""
+    if use_sql():
+        return SqlDistinct(date_slider, traffic_options, weather_condition, path)
+    return load_distinct(path).filter(date_slider, traffic_options, weather_condition)
+
+
+def filtered_quantiles(date_slider=None, traffic_options=None, weather_condition=None, path=DATA_PATH):
+    """Sketch de percentis filtrado pelo backend configurado: histogramas do banco ou o sketch em cache."""
+    if use_sql():
+        return query_quantiles(date_slider, traffic_options, weather_condition, path)
+    return load_quantiles(path).filter(date_slider, traffic_options, weather_condition)
+
+
+def _max_difference(esperado, obtido):
+    """Maior diferença relativa entre as colunas numéricas de dois resultados com as mesmas linhas."""
+    if esperado.shape != obtido.shape:
+        return float('inf')
+    maior = 0.0
+    for col in esperado.columns:
+        a, b = esperado[col], obtido[col]
+        if pd.api.types.is_numeric_dtype(a):
+            a, b = a.to_numpy(dtype=np.float64), b.to_numpy(dtype=np.float64)
+            if not np.array_equal(np.isnan(a), np.isnan(b)):
+                return float('inf')
+            escala = np.maximum(np.abs(a), 1.0)
+            maior = max(maior, float(np.nanmax(np.abs(a - b) / escala, initial=0.0)))
+        elif not (a.astype(str).to_numpy() == b.astype(str).to_numpy()).all():
+            return float('inf')
+    return maior
+
+
+def validate_sql(path=DATA_PATH, filtros=None):
+    """Compara o backend SQL com o caminho em pandas (referência) para alguns estados dos filtros.
+
+        Output: dicionário resultado -> maior diferença relativa observada (inf: linhas diferentes)
+    """
+    from utils.dataset import load_dataset
+    from utils.pages import load_page_functions
+    from utils.shared import RowView
+
+    if filtros is None:
+        filtros = [(None, None, None),
+                   (datetime.datetime(2022, 3, 20), ['Low', 'Jam'], None),
+                   (datetime.datetime(2022, 4, 6), ['High', 'Medium'],
+                    ['conditions Sunny', 'conditions Fog'])]
+    ensure_database(path)
+    entregadores = load_page_functions('entregadores')
+    df1 = load_dataset(path, columns=COLUNAS_SQL)
+    exato = load_distinct(path, exact=True)
+    diferencas = {}
+
+    def registrar(nome, esperado, obtido):
+        diferencas[nome] = max(diferencas.get(nome, 0.0),
+                               _max_difference(esperado.reset_index(drop=True),
+                                               obtido.reset_index(drop=True)))
+
+    for date_slider, traffic_options, weather_condition in filtros:
+        estado = (date_slider, traffic_options, weather_condition)
+        linhas = df1
+        if date_slider is not None:
+            linhas = linhas.loc[linhas['Order_Date'] < date_slider]
+        if traffic_options is not None:
+            linhas = linhas.loc[linhas['Road_traffic_density'].isin(traffic_options)]
+        if weather_condition is not None:
+            linhas = linhas.loc[linhas['Weatherconditions'].isin(weather_condition)]
+
+        registrar('cube', filter_cube(load_cube(path), *estado), query_cube(*estado, path=path))
+
+        distinct = SqlDistinct(*estado, path=path)
+        referencia = exato.filter(*estado)
+        semanas = referencia.cells['Order_Date'].dt.strftime('%U')
+        registrar('distinct', pd.DataFrame({'n': [referencia.count()]}),
+                  pd.DataFrame({'n': [distinct.count()]}))
+        registrar('distinct_by_week', referencia.count_by(semanas).reset_index(),
+                  distinct.count_by(distinct.cells['Order_Date'].dt.strftime('%U')).reset_index())
+
+        por_grupo = ['City', 'Road_traffic_density']
+        registrar('quantiles', load_quantiles(path).filter(*estado).quantiles_by(por_grupo),
+                  query_quantiles(*estado, path=path).quantiles_by(por_grupo))
+
+        mais_rapidos, mais_lentos = entregadores.top_delivers(RowView(linhas.reset_index(drop=True)))
+        sql_rapidos, sql_lentos = query_top_k('Time_taken(min)', 'City', 10, *estado, path=path)
+        # Entre médias empatadas no limite do top-k o entregador escolhido pode mudar
+        # (pandas: ordem das linhas; SQL: ID), então só os valores são comparados
+        colunas = ['City', 'Time_taken(min)']
+        registrar('top_delivers', pd.concat([mais_rapidos, mais_lentos]).loc[:, colunas],
+                  pd.concat([sql_rapidos, sql_lentos]).loc[:, colunas])
+
+        medias = (linhas.loc[:, ['Delivery_person_Ratings', 'Delivery_person_ID']]
+                  .groupby('Delivery_person_ID', observed=True).mean().reset_index())
+        medias['Delivery_person_ID'] = medias['Delivery_person_ID'].astype(str)
+        registrar('ratings_by_deliverer', medias.sort_values('Delivery_person_ID'),
+                  query_deliverer_means('Delivery_person_Ratings', (), *estado, path=path))
+    return diferencas
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(validate_sql(sys.argv[1] if len(sys.argv) > 1 else DATA_PATH))
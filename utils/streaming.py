@@ -0,0 +1,300 @@
+"""Pipeline em streaming para históricos de pedidos maiores que a memória.
+
+O csv é lido em blocos de tamanho limitado. Cada bloco passa pelas mesmas regras
+de limpeza (clean_code) e vira agregados parciais combináveis: somas, contagens,
+somas dos quadrados, mínimos e máximos por célula. Os parciais de todos os blocos
+são combinados célula a célula, então a memória usada depende do tamanho do bloco
+e do número de células, e não do tamanho do arquivo.
+
+Parciais produzidos:
+    - 'cube': o cubo diário das páginas (utils.cube);
+    - 'distinct': sketches HyperLogLog dos entregadores por dia, tráfego e clima
+      (utils.distinct); respondem as contagens de entregadores distintos com erro
+      padrão de ERRO_PADRAO;
+    - 'deliverers': cubo por cidade e entregador (uma célula por entregador); responde
+      as médias por entregador sobre todo o histórico (sem os filtros da barra lateral);
+    - 'locations': contagem de pedidos por cidade, tráfego e célula de coordenadas
+      (sem o dia); responde as medianas do mapa com erro máximo de meia célula (filtra
+      o tráfego, mas não o corte de data). A grade começa em GRADE_BASE graus e, quando passa de
+      MAX_CELULAS_LOCAL células, as células são reagrupadas em células 2x maiores
+      (coluna 'nivel'), então a grade tem memória limitada.
+
+Nenhum parcial cresce com o tamanho do arquivo: o cubo e os sketches crescem com os
+dias do histórico, o cubo de entregadores com a quantidade de entregadores e a grade
+é limitada a MAX_CELULAS_LOCAL células. Como esses dois parciais não têm todas as
+dimensões dos filtros, page_metrics recusa (ValueError) os filtros que removem algum
+pedido, em vez de retornar os números sem filtro.
+
+Com mais de um processo (CURRY_WORKERS ou workers), cada bloco bruto é limpo e
+agregado num processo do pool (utils.parallel) enquanto os próximos são lidos; os
+parciais são combinados na ordem dos blocos, então o resultado é o mesmo do cálculo
+serial. Cada processo ocupa até um bloco de memória.
+
+Uso: python -m utils.streaming [csv] [memória máxima em MB] [processos]
+"""
+import collections
+import functools
+
+import numpy as np
+import pandas as pd
+
+from utils.cube import DIMENSOES, MEDIDAS, build_cube, combine_cubes, filter_cube, rollup
+from utils.dataset import DATA_PATH, add_distance, clean_code, compact_dtypes
+from utils.distinct import DistinctSketch
+from utils.parallel import WORKERS, get_pool, workers_from
+from utils.spatial import GRADE_BASE
+
+# Memória máxima padrão (MB) ocupada por um bloco do csv durante a limpeza
+MEMORIA_MAXIMA_MB = 256
+
+# Um bloco bruto ocupa algumas vezes o seu tamanho durante a limpeza (cópias e colunas novas)
+FATOR_LIMPEZA = 4
+
+DIMENSOES_ENTREGADOR = ['City', 'Delivery_person_ID']
+
+DIMENSOES_LOCAL = ['City', 'Road_traffic_density', 'nivel', 'lat_bin', 'lng_bin']
+
+# Células máximas da grade do mapa (acima disso as células dobram de tamanho)
+MAX_CELULAS_LOCAL = 20000
+
+
+def chunk_size_for(path=DATA_PATH, max_memory_mb=MEMORIA_MAXIMA_MB, amostra=1000):
+    """Esta função calcula quantas linhas do csv cabem num bloco dentro da memória máxima.
+
+        O tamanho de uma linha é estimado numa amostra do início do arquivo.
+    """
+    df = pd.read_csv(path, nrows=amostra)
+    bytes_por_linha = df.memory_usage(deep=True).sum() / max(len(df), 1)
+    linhas = int(max_memory_mb * 2 ** 20 / (bytes_por_linha * FATOR_LIMPEZA))
+    return max(linhas, 1)
+
+
+def iter_clean_chunks(path=DATA_PATH, chunksize=None, max_memory_mb=MEMORIA_MAXIMA_MB):
+    """Lê o csv em blocos e retorna, para cada bloco, (linhas lidas, dataframe limpo e compactado)."""
+    if chunksize is None:
+        chunksize = chunk_size_for(path, max_memory_mb)
+    for df in pd.read_csv(path, chunksize=chunksize):
+        yield len(df), compact_dtypes(add_distance(clean_code(df)))
+
+
+def build_partials(df1):
+    """Esta função calcula os agregados parciais de um dataframe limpo (um bloco ou o dataset todo)."""
+    df_local = df1.loc[:, ['City', 'Road_traffic_density']].copy()
+    df_local['lat_bin'] = np.round(df1['Delivery_location_latitude'].to_numpy(dtype='float64')
+                                   / GRADE_BASE).astype(np.int32)
+    df_local['lng_bin'] = np.round(df1['Delivery_location_longitude'].to_numpy(dtype='float64')
+                                   / GRADE_BASE).astype(np.int32)
+    df_local['nivel'] = np.int8(0)
+
+    return {
+        'cube': build_cube(df1, DIMENSOES, MEDIDAS),
+        'distinct': DistinctSketch(df1),
+        'deliverers': build_cube(df1, DIMENSOES_ENTREGADOR,
+                                 ['Time_taken(min)', 'Delivery_person_Ratings']),
+        'locations': coarsen_locations(build_cube(df_local, DIMENSOES_LOCAL, [])),
+    }
+
+
+def _locations_at(locations, nivel):
+    """Reagrupa as células da grade do mapa no nível pedido (células de 2^nivel x GRADE_BASE graus)."""
+    deslocamento = nivel - locations['nivel'].to_numpy(dtype=np.int64)
+    if not deslocamento.any():
+        return locations
+    locations = locations.assign(
+        lat_bin=np.right_shift(locations['lat_bin'].to_numpy(dtype=np.int64), deslocamento).astype(np.int32),
+        lng_bin=np.right_shift(locations['lng_bin'].to_numpy(dtype=np.int64), deslocamento).astype(np.int32),
+        nivel=np.int8(nivel))
+    return combine_cubes([locations])
+
+
+def coarsen_locations(locations, max_cells=MAX_CELULAS_LOCAL):
+    """Esta função leva a grade do mapa ao nível mais grosso presente e dobra o tamanho
+        das células até caberem em max_cells células.
+    """
+    nivel = int(locations['nivel'].max()) if len(locations) > 0 else 0
+    locations = _locations_at(locations, nivel)
+    while len(locations) > max_cells:
+        nivel += 1
+        locations = _locations_at(locations, nivel)
+    return locations
+
+
+def clean_partials(df):
+    """Limpa um bloco bruto do csv e retorna (linhas lidas, linhas limpas, parciais do bloco)."""
+    df1 = compact_dtypes(add_distance(clean_code(df)))
+    return len(df), len(df1), build_partials(df1)
+
+
+def iter_chunk_partials(path=DATA_PATH, chunksize=None, workers=None):
+    """Retorna, na ordem dos blocos, (linhas lidas, linhas limpas, parciais) de cada bloco do csv.
+
+        Com mais de um processo, até `workers` blocos são limpos e agregados ao mesmo tempo no pool.
+    """
+    workers = WORKERS if workers is None else workers_from(workers)
+    if workers <= 1:
+        for df in pd.read_csv(path, chunksize=chunksize):
+            yield clean_partials(df)
+        return
+
+    pool = get_pool(workers)
+    pendentes = collections.deque()
+    for df in pd.read_csv(path, chunksize=chunksize):
+        pendentes.append(pool.submit(clean_partials, df))
+        if len(pendentes) >= workers:
+            yield pendentes.popleft().result()
+    while pendentes:
+        yield pendentes.popleft().result()
+
+
+# Combinação de cada parcial (os demais são cubos)
+COMBINACOES = {'distinct': lambda parciais: functools.reduce(DistinctSketch.merge, parciais),
+               'locations': lambda parciais: coarsen_locations(combine_cubes(parciais))}
+
+
+def combine_partials(partials):
+    """Combina os agregados parciais de vários blocos."""
+    return {nome: COMBINACOES.get(nome, combine_cubes)([parcial[nome] for parcial in partials])
+            for nome in partials[0]}
+
+
+def stream_partials(path=DATA_PATH, max_memory_mb=MEMORIA_MAXIMA_MB, chunksize=None, workers=None):
+    """Esta função lê o csv em blocos limitados e retorna os agregados parciais combinados.
+
+        Input: workers - processos que limpam e agregam os blocos (None: CURRY_WORKERS)
+        Output: (parciais, dicionário com linhas lidas, linhas limpas, blocos e linhas por bloco)
+    """
+    if chunksize is None:
+        chunksize = chunk_size_for(path, max_memory_mb)
+    # Pilha de (nível, parciais): dois parciais do mesmo nível são combinados, como num
+    # contador binário, para que cada bloco seja recombinado O(log blocos) vezes
+    pilha = []
+    lidas = limpas = blocos = 0
+    for linhas, linhas_limpas, parcial in iter_chunk_partials(path, chunksize, workers):
+        nivel = 0
+        while pilha and pilha[-1][0] == nivel:
+            parcial = combine_partials([pilha.pop()[1], parcial])
+            nivel += 1
+        pilha.append((nivel, parcial))
+        lidas += linhas
+        limpas += linhas_limpas
+        blocos += 1
+    partials = combine_partials([parcial for _, parcial in pilha]) if pilha else None
+    return partials, {'rows_in': lidas, 'rows_clean': limpas,
+                      'chunks': blocos, 'chunksize': chunksize}
+
+
+def weighted_median(valores, pesos):
+    """Mediana de valores com pesos (contagens), como a mediana do pandas sobre as linhas repetidas."""
+    ordem = np.argsort(valores, kind='stable')
+    valores = np.asarray(valores)[ordem]
+    acumulado = np.cumsum(np.asarray(pesos)[ordem])
+    total = acumulado[-1]
+    # Posições (base 1) do(s) elemento(s) central(is) das linhas expandidas
+    baixo = valores[np.searchsorted(acumulado, (total + 1) // 2)]
+    alto = valores[np.searchsorted(acumulado, total // 2 + 1)]
+    return (baixo + alto) / 2
+
+
+def location_medians(locations, by=('City', 'Road_traffic_density')):
+    """Mediana da latitude e longitude de entrega por grupo, a partir da grade de coordenadas."""
+    # Centro da célula j do nível k, em graus: a célula cobre os bins base [j * 2^k, (j + 1) * 2^k)
+    passo = 1 << (int(locations['nivel'].max()) if len(locations) > 0 else 0)
+    centro = (passo - 1) / 2
+    linhas = []
+    for chave, grupo in locations.groupby(list(by), observed=True):
+        linhas.append(list(chave) + [
+            (weighted_median(grupo['lat_bin'], grupo['orders']) * passo + centro) * GRADE_BASE,
+            (weighted_median(grupo['lng_bin'], grupo['orders']) * passo + centro) * GRADE_BASE])
+    return pd.DataFrame(linhas, columns=list(by) + ['Delivery_location_latitude',
+                                                    'Delivery_location_longitude'])
+
+
+def _removes_orders(cube, date_slider=None, traffic_options=None, weather_condition=None):
+    """Indica se os filtros removem algum pedido do cubo."""
+    filtrado = filter_cube(cube, date_slider, traffic_options, weather_condition)
+    return filtrado['orders'].sum() != cube['orders'].sum()
+
+
+def page_metrics(partials, date_slider=None, traffic_options=None, weather_condition=None):
+    """Esta função calcula, a partir dos parciais, os números de cada gráfico e métrica das páginas.
+
+        Input: parciais e os filtros da barra lateral (a visão empresa não filtra o clima)
+        Output: dicionário nome -> dataframe ou valor
+        Os parciais de entregadores e do mapa não têm todas as dimensões dos filtros:
+        filtros que removem algum pedido (ex.: um corte de data dentro do histórico)
+        levantam ValueError. Os filtros padrão das páginas (utils.filters)
+        não removem nenhum pedido do histórico.
+    """
+    if _removes_orders(partials['cube'], date_slider, traffic_options, weather_condition):
+        raise ValueError('Os parciais de entregadores e do mapa não têm todas as dimensões dos '
+                         'filtros: page_metrics só aceita filtros que não removem pedidos.')
+    cube_empresa = filter_cube(partials['cube'], date_slider, traffic_options)
+    cube = filter_cube(partials['cube'], date_slider, traffic_options, weather_condition)
+    distintos_empresa = partials['distinct'].filter(date_slider, traffic_options)
+    distintos = partials['distinct'].filter(date_slider, traffic_options, weather_condition)
+    # Os filtros não removem pedidos: os parciais sem as dimensões deles valem como estão
+    entregadores = partials['deliverers']
+    locais = filter_cube(partials['locations'], None, traffic_options)
+
+    # Visão empresa
+    pedidos_semana = rollup(cube_empresa.assign(
+        week_of_year=cube_empresa['Order_Date'].dt.strftime('%U')), 'week_of_year')
+    entregadores_semana = distintos_empresa.count_by(
+        distintos_empresa.cells['Order_Date'].dt.strftime('%U').rename('week_of_year'))
+    por_semana = pd.DataFrame({'week_of_year': pedidos_semana['week_of_year'],
+                               'ID': pedidos_semana['orders']})
+    por_semana['Delivery_person_ID'] = por_semana['week_of_year'].map(entregadores_semana).to_numpy()
+    por_semana['order_by_delivery'] = por_semana['ID'] / por_semana['Delivery_person_ID']
+
+    # Visão entregadores e restaurantes
+    idade = rollup(cube, 'Festival', 'Delivery_person_Age')
+    veiculo = rollup(cube, 'Festival', 'Vehicle_condition')
+
+    def _resumo(df_cube, by, measure):
+        df_aux = rollup(df_cube, by, measure)
+        return df_aux.loc[:, ([by] if isinstance(by, str) else list(by)) + ['mean', 'std']]
+
+    return {
+        'orders_by_day': rollup(cube_empresa, 'Order_Date'),
+        'orders_by_traffic': rollup(cube_empresa, 'Road_traffic_density'),
+        'orders_by_city_traffic': rollup(cube_empresa, ['City', 'Road_traffic_density']),
+        'orders_by_week': pedidos_semana,
+        'orders_per_deliverer_by_week': por_semana,
+        'location_medians': location_medians(locais),
+        'max_age': idade['max'].max(),
+        'min_age': idade['min'].min(),
+        'best_vehicle': veiculo['max'].max(),
+        'worst_vehicle': veiculo['min'].min(),
+        'ratings_by_deliverer': rollup(entregadores, 'Delivery_person_ID',
+                                       'Delivery_person_Ratings')
+        .loc[:, ['Delivery_person_ID', 'mean']]
+        .sort_values('mean', ascending=False),
+        'ratings_by_traffic': _resumo(cube, 'Road_traffic_density', 'Delivery_person_Ratings'),
+        'ratings_by_weather': _resumo(cube, 'Weatherconditions', 'Delivery_person_Ratings'),
+        'time_by_city_deliverer': _resumo(entregadores, ['City', 'Delivery_person_ID'],
+                                          'Time_taken(min)'),
+        'unique_deliverers': distintos.count(),
+        'distance_by_city': _resumo(cube, 'City', 'distance'),
+        'time_by_festival': _resumo(cube, 'Festival', 'Time_taken(min)'),
+        'time_by_city': _resumo(cube, 'City', 'Time_taken(min)'),
+        'time_by_city_traffic': _resumo(cube, ['City', 'Road_traffic_density'], 'Time_taken(min)'),
+        'time_by_city_order_type': _resumo(cube, ['City', 'Type_of_order'], 'Time_taken(min)'),
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import tracemalloc
+
+    path = sys.argv[1] if len(sys.argv) > 1 else DATA_PATH
+    max_memory_mb = float(sys.argv[2]) if len(sys.argv) > 2 else MEMORIA_MAXIMA_MB
+    workers = sys.argv[3] if len(sys.argv) > 3 else None
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    partials, stats = stream_partials(path, max_memory_mb, workers=workers)
+    stats['seconds'] = round(time.perf_counter() - inicio, 2)
+    stats['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    # Células de cada parcial (os sketches guardam as células em .cells)
+    stats.update({nome: len(getattr(parcial, 'cells', parcial)) for nome, parcial in partials.items()})
+    print(stats)
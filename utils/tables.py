@@ -0,0 +1,105 @@
+"""Tabelas paginadas e ordenadas no servidor.
+
+O st.dataframe converte a tabela inteira para Arrow e a envia ao navegador a cada
+rerun, mesmo quando só algumas dezenas de linhas aparecem na tela. paged_table mostra
+a tabela em páginas de LINHAS_POR_PAGINA linhas, com a ordenação escolhida na página:
+só a página visível é convertida e enviada.
+
+Três caches LRU (limitados em memória), todos com a versão dos dados na chave:
+    - a tabela completa por (tabela, filtros): build() só roda para filtros novos;
+    - a ordem das linhas por (tabela, filtros, ordenação): um argsort por coluna;
+    - a página já convertida para Arrow (pyarrow.Table) por (tabela, filtros,
+      ordenação, página): trocar de página, voltar a uma página vista ou repetir um
+      rerun não converte as linhas de novo. Resta ao Streamlit só gravar o stream
+      Arrow das linhas da página.
+
+A ordenação do navegador (clique no cabeçalho) continua disponível, mas só reordena a
+página visível; a ordenação da tabela inteira é a do seletor.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from utils.dataset import dataset_version
+from utils.lru import LRUCache
+from utils.timing import span
+
+# Linhas por página e memória máxima (MB) de cada cache
+LINHAS_POR_PAGINA = 25
+MEMORIA_TABELAS_MB = 64
+
+ORDENS = {'Decrescente': False, 'Crescente': True}
+
+_table_cache = LRUCache(MEMORIA_TABELAS_MB * 2 ** 20,
+                        sizeof=lambda df: int(df.memory_usage(deep=True).sum()))
+_order_cache = LRUCache(MEMORIA_TABELAS_MB * 2 ** 20, sizeof=lambda ordem: ordem.nbytes)
+_page_cache = LRUCache(MEMORIA_TABELAS_MB * 2 ** 20, sizeof=lambda tabela: tabela.nbytes)
+
+
+def page_count(rows, page_size=LINHAS_POR_PAGINA):
+    """Quantidade de páginas de uma tabela (pelo menos uma, mesmo vazia)."""
+    return max(int(np.ceil(rows / page_size)), 1)
+
+
+def _sort_order(df, sort, ascending):
+    """Posições das linhas na ordem pedida (estável, valores ausentes no fim)."""
+    if sort is None:
+        return np.arange(len(df))
+    return np.argsort(df[sort].rank(method='first', ascending=ascending,
+                                    na_option='bottom').to_numpy(), kind='stable')
+
+
+def table_page(name, filtros, build, sort=None, ascending=True, page=0, page_size=LINHAS_POR_PAGINA):
+    """Esta função retorna uma página da tabela ordenada, em cache.
+
+        Input:
+            - name: identificador da tabela (ex.: 'avg_ratings_per_deliver')
+            - filtros: estado dos filtros (utils.filters.filter_state)
+            - build: função sem argumentos que calcula a tabela completa (Dataframe)
+            - sort, ascending: coluna e sentido da ordenação (None mantém a ordem de build)
+            - page: página (base 0; páginas além da última mostram a última)
+        Output: (página como pyarrow.Table, com a posição na tabela ordenada como índice,
+                 quantidade de linhas da tabela completa)
+    """
+    versao = dataset_version()
+    chave = (name, filtros, versao)
+    with span('table.' + name):
+        df = _table_cache.get_or_build(chave, lambda: build().reset_index(drop=True))
+        page = min(max(page, 0), page_count(len(df), page_size) - 1)
+
+        def _page():
+            ordem = _order_cache.get_or_build(chave + (sort, ascending),
+                                              lambda: _sort_order(df, sort, ascending))
+            inicio = page * page_size
+            linhas = df.iloc[ordem[inicio:inicio + page_size]]
+            linhas.index = np.arange(inicio, inicio + len(linhas))
+            # Categóricas iriam com o dicionário inteiro de categorias em cada página
+            linhas = linhas.astype({col: object for col in linhas.columns
+                                    if isinstance(linhas[col].dtype, pd.CategoricalDtype)})
+            return pa.Table.from_pandas(linhas, preserve_index=True)
+
+        return _page_cache.get_or_build(chave + (sort, ascending, page, page_size), _page), len(df)
+
+
+def paged_table(name, filtros, build, columns, sort=None, ascending=True,
+                page_size=LINHAS_POR_PAGINA, height=None):
+    """Desenha a tabela paginada com os seletores de ordenação e de página.
+
+        Input:
+            - columns: colunas oferecidas no seletor de ordenação
+            - sort, ascending: ordenação inicial
+            Os demais argumentos são os de table_page.
+    """
+    col1, col2, col3 = st.columns(3)
+    columns = list(columns)
+    sort = col1.selectbox('Ordenar por', columns, index=columns.index(sort) if sort in columns else 0,
+                          key=name + '_ordenar')
+    ordem = col2.selectbox('Ordem', list(ORDENS), index=list(ORDENS.values()).index(ascending),
+                           key=name + '_ordem')
+    page = col3.number_input('Página', min_value=1, value=1, step=1, key=name + '_pagina')
+
+    tabela, linhas = table_page(name, filtros, build, sort, ORDENS[ordem], int(page) - 1, page_size)
+    paginas = page_count(linhas, page_size)
+    st.dataframe(tabela, use_container_width=True, height=height)
+    st.caption('Página %d de %d (%d linhas)' % (min(int(page), paginas), paginas, linhas))
@@ -0,0 +1,237 @@
+"""Spans de tempo dos estágios das páginas e da limpeza dos dados.
+
+Cada span registra o tempo de parede, as linhas de entrada e saída (quando informadas)
+e a variação da memória residente do processo. Os spans de uma execução da página
+ficam numa lista por thread (cada sessão do Streamlit roda na sua thread) e os totais
+por estágio são acumulados para o processo inteiro.
+
+Os spans só são medidos quando ativados: pelo painel de tempos da barra lateral
+(start_run(..., enabled=True)) ou pela variável de ambiente CURRY_TIMING=1. Desativados,
+span() retorna um objeto vazio compartilhado e timed() chama a função diretamente.
+
+Exportação (variáveis de ambiente):
+    - CURRY_TIMING_JSONL: arquivo onde cada span é acrescentado como uma linha json;
+    - CURRY_TIMING_PROM: arquivo texto no formato do Prometheus (textfile collector)
+      com os totais acumulados por estágio, regravado ao final de cada execução.
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+ATIVO_PADRAO = os.environ.get('CURRY_TIMING', '') not in ('', '0')
+ARQUIVO_JSONL = os.environ.get('CURRY_TIMING_JSONL')
+ARQUIVO_PROMETHEUS = os.environ.get('CURRY_TIMING_PROM')
+
+
+class _Estado(threading.local):
+    """Estado da execução de cada thread (os atributos de classe são os padrões, sem custo de busca)."""
+
+    ativo = ATIVO_PADRAO
+    page = None
+    # Spans abertos nesta thread (profundidade do próximo span)
+    profundidade = 0
+
+    def __init__(self):
+        self.spans = []
+
+
+_local = _Estado()
+
+# Totais por estágio: [execuções, segundos, linhas de entrada, linhas de saída]
+_totais = {}
+# Reentrante: write_prometheus segura o lock enquanto prometheus_text lê os totais
+_lock = threading.RLock()
+
+try:
+    _TAMANHO_PAGINA = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _TAMANHO_PAGINA = None
+
+
+def _rss_bytes():
+    """Memória residente atual do processo (None fora do Linux)."""
+    if _TAMANHO_PAGINA is None:
+        return None
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * _TAMANHO_PAGINA
+    except OSError:
+        return None
+
+
+def _linhas(valor):
+    try:
+        return len(valor)
+    except TypeError:
+        return None
+
+
+class Span:
+    """Medição de um estágio: use com `with` e, se quiser, preencha rows_out antes de sair."""
+
+    __slots__ = ('name', 'rows_in', 'rows_out', 'seconds', 'memory_delta_mb', 'started_at',
+                 'depth', '_inicio', '_memoria')
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.memory_delta_mb = None
+
+    def __enter__(self):
+        self.started_at = time.time()
+        # 0: estágio de nível superior; >0: aninhado noutro span aberto
+        self.depth = _local.profundidade
+        _local.profundidade += 1
+        self._memoria = _rss_bytes()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._inicio
+        _local.profundidade -= 1
+        memoria = _rss_bytes()
+        if memoria is not None and self._memoria is not None:
+            self.memory_delta_mb = round((memoria - self._memoria) / 2 ** 20, 2)
+        _record(self)
+        return False
+
+    def as_dict(self):
+        return {'stage': self.name, 'seconds': round(self.seconds, 6),
+                'rows_in': self.rows_in, 'rows_out': self.rows_out,
+                'memory_delta_mb': self.memory_delta_mb, 'started_at': round(self.started_at, 3),
+                'depth': self.depth}
+
+
+class _SemSpan:
+    """Span desativado: não mede nada."""
+
+    name = rows_in = rows_out = seconds = memory_delta_mb = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, nome, valor):
+        pass
+
+
+_SEM_SPAN = _SemSpan()
+
+
+def enabled():
+    """Indica se os spans estão sendo medidos nesta thread."""
+    return _local.ativo
+
+
+def span(name, rows_in=None):
+    """Retorna um span para o estágio (ou um span vazio, se a medição estiver desativada)."""
+    return Span(name, rows_in) if enabled() else _SEM_SPAN
+
+
+def timed(name):
+    """Decorador: mede a função como um span; linhas de entrada e saída = len do 1º argumento e do retorno."""
+    def decorador(func):
+        @functools.wraps(func)
+        def medida(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            with Span(name, _linhas(args[0]) if args else None) as medicao:
+                resultado = func(*args, **kwargs)
+                medicao.rows_out = _linhas(resultado)
+            return resultado
+        return medida
+    return decorador
+
+
+def _record(medicao):
+    _local.spans.append(medicao)
+    with _lock:
+        total = _totais.setdefault(medicao.name, [0, 0.0, 0, 0])
+        total[0] += 1
+        total[1] += medicao.seconds
+        total[2] += medicao.rows_in or 0
+        total[3] += medicao.rows_out or 0
+
+
+def start_run(page, enabled=False):
+    """Inicia a execução de uma página: limpa os spans da thread e liga a medição se pedido."""
+    _local.ativo = bool(enabled) or ATIVO_PADRAO
+    _local.page = page
+    _local.spans = []
+    _local.profundidade = 0
+
+
+def run_spans():
+    """Spans registrados na execução atual desta thread, como dicionários."""
+    return [dict(medicao.as_dict(), page=_local.page) for medicao in _local.spans]
+
+
+def prometheus_text():
+    """Totais acumulados por estágio no formato texto do Prometheus."""
+    with _lock:
+        totais = sorted(_totais.items())
+    metricas = [('curry_stage_runs_total', 'Execuções de cada estágio', 0),
+                ('curry_stage_seconds_total', 'Tempo acumulado de cada estágio (s)', 1),
+                ('curry_stage_rows_in_total', 'Linhas de entrada acumuladas', 2),
+                ('curry_stage_rows_out_total', 'Linhas de saída acumuladas', 3)]
+    linhas = []
+    for nome, descricao, indice in metricas:
+        linhas += ['# HELP %s %s' % (nome, descricao), '# TYPE %s counter' % nome]
+        linhas += ['%s{stage="%s"} %s' % (nome, estagio, total[indice]) for estagio, total in totais]
+    return '\n'.join(linhas) + '\n'
+
+
+def write_jsonl(path, spans):
+    """Acrescenta os spans ao arquivo, um json por linha."""
+    with open(path, 'a') as arquivo:
+        for medicao in spans:
+            arquivo.write(json.dumps(medicao) + '\n')
+
+
+def write_prometheus(path):
+    """Grava os totais no formato do Prometheus (troca atômica, como espera o textfile collector).
+
+        O arquivo temporário é de cada processo e thread, e as gravações do processo são
+        serializadas: uma gravação mais antiga não substitui os totais de uma mais nova.
+    """
+    tmp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with _lock:
+        with open(tmp, 'w') as arquivo:
+            arquivo.write(prometheus_text())
+        os.replace(tmp, path)
+
+
+def finish_run():
+    """Encerra a execução da página: exporta os spans (se configurado) e os retorna."""
+    spans = run_spans()
+    if spans and ARQUIVO_JSONL:
+        write_jsonl(ARQUIVO_JSONL, spans)
+    if spans and ARQUIVO_PROMETHEUS:
+        write_prometheus(ARQUIVO_PROMETHEUS)
+    return spans
+
+
+def timing_panel(container, spans):
+    """Mostra os spans da execução no container do Streamlit (ex.: st.sidebar)."""
+    if not spans:
+        container.caption('Marque o painel e interaja com a página para medir os estágios.')
+        return
+    # Só os estágios de nível superior: os aninhados já estão no tempo de quem os contém
+    total = sum(medicao['seconds'] for medicao in spans if medicao['depth'] == 0)
+    container.caption('%d estágios, %.1f ms no total dos estágios de nível superior'
+                      % (len(spans), total * 1000))
+    container.dataframe([{'estágio': '· ' * medicao['depth'] + medicao['stage'], 'ms': round(medicao['seconds'] * 1000, 2),
+                          'linhas': medicao['rows_in'], 'saída': medicao['rows_out'],
+                          'memória (MB)': medicao['memory_delta_mb']} for medicao in spans],
+                        use_container_width=True)
+    container.download_button('Baixar spans (jsonl)',
+                              ''.join(json.dumps(medicao) + '\n' for medicao in spans),
+                              file_name='spans.jsonl')
+    container.download_button('Baixar métricas (Prometheus)', prometheus_text(),
+                              file_name='curry_company.prom')
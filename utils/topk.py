@@ -0,0 +1,64 @@
+"""Seleção dos k maiores/menores valores de uma métrica dentro de cada grupo.
+
+A seleção usa np.partition (O(n) por grupo) para achar o k-ésimo valor de cada grupo
+em vez de ordenar a tabela inteira: as linhas abaixo dele entram direto e só os k
+escolhidos são ordenados. Empates no limite do top-k são resolvidos pela ordem das
+linhas na tabela (o que np.argpartition não garante), então o resultado é determinístico.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _smallest(values, k):
+    """Posições dos k menores valores, ordenadas por (valor, posição).
+
+        np.partition acha o k-ésimo menor valor; os empates com ele entram na ordem das posições.
+    """
+    if len(values) <= k:
+        escolhidos = np.arange(len(values))
+    else:
+        limite = np.partition(values, k - 1)[k - 1]
+        menores = np.flatnonzero(values < limite)
+        empates = np.flatnonzero(values == limite)[:k - len(menores)]
+        escolhidos = np.concatenate([menores, empates])
+    return escolhidos[np.lexsort((escolhidos, values[escolhidos]))]
+
+
+def top_k_per_group(df_aux, by, metric, k=10, groups=None):
+    """Esta função retorna os k menores e os k maiores valores da métrica em cada grupo, numa única passada.
+
+        Input:
+            - df_aux: tabela já agregada (uma linha por item, ex.: média por entregador)
+            - by: coluna ou lista de colunas dos grupos (ex.: 'City')
+            - metric: coluna usada no ranking
+            - k: quantidade de linhas por grupo
+            - groups: grupos a mostrar, nesta ordem (None: todos, na ordem dos valores)
+        Output: (menores, maiores) - dataframes com até k linhas por grupo, ordenados
+                pelo grupo e pela métrica (crescente nos menores, decrescente nos maiores)
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    df_aux = df_aux.loc[df_aux[metric].notna()]
+    chave = df_aux[by[0]] if len(by) == 1 else pd.MultiIndex.from_frame(df_aux[by])
+    codes, uniques = pd.factorize(chave, sort=True)
+    if groups is not None:
+        uniques = list(uniques)
+        ordem_grupos = [uniques.index(grupo) for grupo in groups if grupo in uniques]
+    else:
+        ordem_grupos = range(len(uniques))
+
+    # Linhas agrupadas por grupo (ordenação estável apenas dos códigos inteiros)
+    ordem = np.argsort(codes, kind='stable')
+    limites = np.searchsorted(codes[ordem], np.arange(len(uniques) + 1))
+    values = df_aux[metric].to_numpy(dtype=np.float64)[ordem]
+
+    menores, maiores = [], []
+    for grupo in ordem_grupos:
+        inicio, fim = limites[grupo], limites[grupo + 1]
+        menores.append(ordem[inicio + _smallest(values[inicio:fim], k)])
+        maiores.append(ordem[inicio + _smallest(-values[inicio:fim], k)])
+
+    def _linhas(posicoes):
+        posicoes = np.concatenate(posicoes) if posicoes else np.array([], dtype=np.int64)
+        return df_aux.iloc[posicoes].reset_index(drop=True)
+
+    return _linhas(menores), _linhas(maiores)
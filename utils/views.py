@@ -0,0 +1,63 @@
+"""Abas preguiçosas para as páginas com várias visões.
+
+O st.tabs do Streamlit executa o corpo de todas as abas a cada rerun, mesmo as que
+não estão visíveis. lazy_tabs mostra a barra de abas como um seletor guardado no
+session_state e a página executa só o bloco da aba escolhida: o custo de uma
+interação passa a ser o da seção visível. Os resultados já calculados de cada aba
+(figuras e mapas) continuam nos caches de utils.figures e utils.maps, então voltar
+a uma aba já vista não recalcula nada.
+
+sidebar_branding monta o cabeçalho da barra lateral comum a todas as páginas; o
+logo é lido do disco uma vez por processo e reutilizado por todas as sessões.
+data_status mostra a versão dos dados servida pela página e o erro da última
+atualização em segundo plano, se ela falhou (utils.refresh).
+"""
+import functools
+
+import streamlit as st
+
+from utils.dataset import DATA_PATH, dataset_info
+from utils.refresh import refresh_error
+
+LOGO_PATH = 'food_delivery.png'
+
+
+def lazy_tabs(labels, key):
+    """Barra de abas em que só a aba escolhida é executada.
+
+        Input:
+            - labels: rótulos das abas, na ordem
+            - key: chave do session_state (mantém a aba ao trocar filtros e páginas)
+        Output: rótulo da aba escolhida
+    """
+    return st.radio('Visão', labels, horizontal=True, key=key, label_visibility='collapsed')
+
+
+@functools.lru_cache(maxsize=None)
+def logo_bytes(path=LOGO_PATH):
+    """Conteúdo do arquivo do logo, lido uma vez por processo."""
+    with open(path, 'rb') as arquivo:
+        return arquivo.read()
+
+
+def sidebar_branding(path=LOGO_PATH):
+    """Logo e slogan Cury Company no topo da barra lateral."""
+    st.sidebar.image(logo_bytes(path), width=150)
+    st.sidebar.markdown('# Cury Company')
+    st.sidebar.markdown('### Fastest Delivery in Town')
+    st.sidebar.markdown("""---""")
+
+
+def data_status(path=DATA_PATH):
+    """Versão e data dos dados servidos e o erro da última atualização (se falhou), na barra lateral."""
+    info = dataset_info(path)
+    texto = 'Dados: versão %s de %s' % (info['version'], info['updated_at'].strftime('%d/%m/%Y %H:%M'))
+    if info['published_at'] is not None:
+        texto += ' (publicada às %s)' % info['published_at'].strftime('%H:%M:%S')
+    st.sidebar.caption(texto)
+
+    erro = refresh_error(path)
+    if erro is not None:
+        # Última linha do traceback: o tipo e a mensagem da exceção
+        st.sidebar.warning('A última atualização dos dados falhou; servindo a versão acima. '
+                           + erro.strip().splitlines()[-1])
@@ -0,0 +1,133 @@
+"""Aquecimento dos caches do processo na subida do servidor.
+
+Depois de um deploy, a primeira sessão pagaria sozinha a leitura do snapshot, a
+montagem do cubo, dos sketches, do índice espacial e do motor de filtros e os gráficos do estado padrão
+da barra lateral. warm_up faz esse trabalho antes da primeira visita: carrega o
+dataset com as colunas de cada página, monta os agregados em cache e calcula, com
+as mesmas funções e chaves de cache das páginas (utils.pages), as figuras e o mapa
+dos filtros padrão (DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO).
+
+O Streamlit não tem um gancho de início do servidor, então o aquecimento roda numa
+thread do próprio processo do servidor, iniciada antes do streamlit run. Os caches
+seguram um lock enquanto calculam: uma sessão que chega durante o aquecimento
+espera o cálculo em andamento em vez de refazê-lo. O launcher também inicia a
+atualização em segundo plano (utils.refresh), que refaz o aquecimento a cada versão
+nova dos dados publicada. Com CURRY_BACKEND=sqlite, o launcher monta o banco da versão
+atual antes de subir o servidor (as requisições não montam o banco).
+
+Uso (no lugar de `streamlit run Home.py`): python -m utils.warmup [argumentos do streamlit run]
+"""
+import logging
+import threading
+import time
+
+from utils.cube import load_cube
+from utils.dataset import DATA_PATH, dataset_version, ensure_snapshot, load_dataset
+from utils.distinct import load_distinct
+from utils.figures import cached_figure
+from utils.filters import (CLIMA_PADRAO, DATA_PADRAO, TRAFEGO_PADRAO, filter_state,
+                           load_filter_engine)
+from utils.maps import build_map, cached_map_html
+from utils.pages import load_page_functions
+from utils.quantiles import load_quantiles
+from utils.refresh import start_refresher
+from utils.shared import load_view
+from utils.spatial import load_spatial
+from utils.sqlstore import ensure_database, filtered_cube, filtered_distinct, use_sql
+
+# Modo do mapa selecionado por padrão na visão geográfica
+MODO_MAPA_PADRAO = 'median'
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_empresa(path):
+    """Figuras e mapa da visão empresa no estado padrão da barra lateral."""
+    empresa = load_page_functions('empresa')
+    filtros = filter_state(DATA_PADRAO, TRAFEGO_PADRAO)
+    cube = filtered_cube(DATA_PADRAO, TRAFEGO_PADRAO, path=path)
+    cached_figure('order_metric', filtros, lambda: empresa.order_metric(cube))
+    cached_figure('traffic_order_share', filtros, lambda: empresa.traffic_order_share(cube))
+    cached_figure('traffic_order_city', filtros, lambda: empresa.traffic_order_city(cube))
+    cached_figure('order_by_week', filtros, lambda: empresa.order_by_week(cube))
+    cached_figure('order_share_by_week', filtros, lambda: empresa.order_share_by_week(
+        cube, filtered_distinct(DATA_PADRAO, TRAFEGO_PADRAO, path=path)))
+
+    # Mesma chave de country_maps na página
+    linhas = load_view(DATA_PADRAO, TRAFEGO_PADRAO, columns=empresa.COLUNAS, path=path)
+    chave = ('country_maps', dataset_version(path), MODO_MAPA_PADRAO, filtros)
+    cached_map_html(chave, lambda: build_map(linhas.frame(), MODO_MAPA_PADRAO))
+
+
+def _warm_restaurantes(path):
+    """Figuras da visão restaurantes no estado padrão da barra lateral."""
+    restaurantes = load_page_functions('restaurantes')
+    filtros = filter_state(DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO)
+    cube = filtered_cube(DATA_PADRAO, TRAFEGO_PADRAO, CLIMA_PADRAO, path=path)
+    cached_figure('avg_std_time_graph', filtros, lambda: restaurantes.avg_std_time_graph(cube))
+    cached_figure('distance', filtros, lambda: restaurantes.distance(cube, fig=True))
+    cached_figure('avg_std_time_on_traffic', filtros,
+                  lambda: restaurantes.avg_std_time_on_traffic(cube))
+
+
+def warm_up(path=DATA_PATH):
+    """Esta função carrega os dados e calcula os resultados dos filtros padrão das páginas.
+
+        Output: dicionário estágio -> segundos
+    """
+    tempos = {}
+
+    def etapa(nome, func):
+        inicio = time.perf_counter()
+        func()
+        tempos[nome] = round(time.perf_counter() - inicio, 3)
+
+    etapa('snapshot', lambda: ensure_snapshot(path))
+    if use_sql():
+        etapa('database', lambda: ensure_database(path))
+    else:
+        etapa('cube', lambda: load_cube(path))
+        etapa('distinct', lambda: load_distinct(path))
+        etapa('quantiles', lambda: load_quantiles(path))
+        # Dataframe compartilhado com as colunas da visão entregadores (linhas dos rankings)
+        etapa('dataset', lambda: load_dataset(path, columns=load_page_functions('entregadores').COLUNAS))
+    etapa('filter_engine', lambda: load_filter_engine(path))
+    etapa('spatial', lambda: load_spatial(path))
+    etapa('empresa', lambda: _warm_empresa(path))
+    etapa('restaurantes', lambda: _warm_restaurantes(path))
+    return tempos
+
+
+def start_warm_up(path=DATA_PATH):
+    """Inicia warm_up numa thread em segundo plano (não impede o servidor de encerrar)."""
+    def _run():
+        try:
+            tempos = warm_up(path)
+        except Exception:
+            # Aquecer é só uma otimização: a página calcula o que faltar na primeira visita
+            logger.exception('Aquecimento dos caches falhou')
+        else:
+            logger.info('Caches aquecidos em %.2f s: %s', sum(tempos.values()), tempos)
+
+    thread = threading.Thread(target=_run, name='curry-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def main(args=()):
+    """Aquece os caches e sobe o servidor Streamlit do dashboard no mesmo processo."""
+    from streamlit.web import cli
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if use_sql():
+        # As páginas só abrem o banco publicado: ele precisa existir antes da primeira requisição
+        ensure_database()
+    start_refresher(on_refresh=lambda version: warm_up())
+    start_warm_up()
+    cli.main(['run', 'Home.py', *args], prog_name='streamlit')
+
+
+if __name__ == '__main__':
+    import sys
+
+    main(sys.argv[1:])